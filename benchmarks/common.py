@@ -0,0 +1,63 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Measurements shared by the benchmarks: wall time, CPU time of the process and its peak RSS.
+The results of a benchmark are a flat dict, printed as a table, or as JSON for benchmarks.suite.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import resource
+import sys
+from time import perf_counter, process_time
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of the process, in MB. ru_maxrss is in KB on Linux, bytes on macOS."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class Measure:
+    """Wall and CPU seconds spent in the with block"""
+
+    def __init__(self):
+        self.seconds: float = 0.0
+        self.cpu_seconds: float = 0.0
+
+    def __enter__(self) -> Measure:
+        self._start = perf_counter()
+        self._cpu_start = process_time()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = perf_counter() - self._start
+        self.cpu_seconds = process_time() - self._cpu_start
+
+
+def add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as a JSON object"
+    )
+
+
+def quiet_logs() -> None:
+    """The watcher logs every cluster scan at INFO level, which would be measured too"""
+    logging.getLogger("kafka-connect-watcher").setLevel(logging.WARNING)
+
+
+def print_results(results: dict, as_json: bool = False) -> None:
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    if as_json:
+        print(json.dumps(results))
+        return
+    for name, value in results.items():
+        print(
+            f"{name:>45}: {value:12.3f}"
+            if isinstance(value, float)
+            else f"{name:>45}: {value:>12}"
+        )
@@ -0,0 +1,90 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+EMF documents serialized per second by publish_clusters_emf, for the cluster and connectors metrics of a fake
+cluster (benchmarks.fake_connect). The documents are written to a discarded stdout (local environment).
+
+  * first: every connector is new, so the metrics of all the connectors are published.
+  * steady: the connectors did not change, so only the metrics of the unhealthy ones are published.
+
+    python -m benchmarks.emf_serialization --connectors 2000 --failure-ratio 0.1 --rounds 10
+"""
+
+from __future__ import annotations
+
+import argparse
+from contextlib import redirect_stdout
+from copy import deepcopy
+from io import StringIO
+
+from aws_embedded_metrics.environment.local_environment import LocalEnvironment
+
+from benchmarks.common import Measure, add_output_arguments, print_results, quiet_logs
+from benchmarks.fake_connect import FakeConnectCluster, load_snapshot
+from kafka_connect_watcher.aws_emf import publish_clusters_emf
+from kafka_connect_watcher.cluster import ConnectCluster
+
+CLUSTER_DEFINITION: dict = {
+    "hostname": "127.0.0.1",
+    "name": "benchmark",
+    "evaluation_rules": [{"include_regex": [".*"], "ignore_paused": True}],
+    "metrics": {
+        "aws_emf": {
+            "enabled": True,
+            "namespace": "KafkaConnect",
+            "dimensions": {"Env": "benchmark"},
+        }
+    },
+}
+
+
+class NullOutput(StringIO):
+    def write(self, content: str) -> int:
+        return len(content)
+
+
+def evaluate(connect_cluster: ConnectCluster, fake_cluster: FakeConnectCluster) -> None:
+    snapshot = load_snapshot(connect_cluster, fake_cluster)
+    routes = connect_cluster.route_connectors(snapshot)
+    for rule in connect_cluster.handling_rules:
+        rule.execute(connect_cluster, snapshot, routes[rule])
+
+
+def publish(connect_cluster: ConnectCluster, rounds: int, prefix: str) -> dict:
+    environment = LocalEnvironment()
+    documents: int = (1 + len(connect_cluster.connectors_to_report)) * rounds
+    with redirect_stdout(NullOutput()), Measure() as measure:
+        for _ in range(rounds):
+            publish_clusters_emf(connect_cluster, environment)
+    return {
+        f"{prefix}_documents": documents // rounds,
+        f"{prefix}_documents_per_sec": documents / measure.seconds,
+        f"{prefix}_cpu_seconds": measure.cpu_seconds / rounds,
+    }
+
+
+def benchmark(fake_cluster: FakeConnectCluster, rounds: int) -> dict:
+    connect_cluster = ConnectCluster(deepcopy(CLUSTER_DEFINITION), {})
+    evaluate(connect_cluster, fake_cluster)
+    results: dict = publish(connect_cluster, rounds, "first")
+    evaluate(connect_cluster, fake_cluster)
+    results.update(publish(connect_cluster, rounds, "steady"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connectors", type=int, default=2000)
+    parser.add_argument("--tasks", type=int, default=3)
+    parser.add_argument("--failure-ratio", type=float, default=0.1)
+    parser.add_argument("--rounds", type=int, default=10)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    quiet_logs()
+    fake_cluster = FakeConnectCluster(args.connectors, args.tasks, args.failure_ratio)
+    print_results(benchmark(fake_cluster, args.rounds), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Connectors evaluated per second by ConnectCluster.route_connectors and EvaluationRule.execute, on snapshots of a
+fake cluster (benchmarks.fake_connect), without any REST call.
+
+  * first: every connector is new, so the filters, metrics and statuses are all computed.
+  * steady: the connectors did not change since the previous snapshot, so these are re-used.
+
+    python -m benchmarks.evaluation --connectors 5000 --tasks 3 --failure-ratio 0.1 --rounds 20
+"""
+
+from __future__ import annotations
+
+import argparse
+from copy import deepcopy
+
+from benchmarks.common import Measure, add_output_arguments, print_results, quiet_logs
+from benchmarks.fake_connect import FakeConnectCluster, load_snapshot
+from kafka_connect_watcher.cluster import ConnectCluster
+
+CLUSTER_DEFINITION: dict = {
+    "hostname": "127.0.0.1",
+    "name": "benchmark",
+    "evaluation_rules": [
+        {
+            "include_regex": [".*"],
+            "exclude_regex": ["^ignored-.*"],
+            "ignore_paused": True,
+        }
+    ],
+}
+
+
+def new_cluster() -> ConnectCluster:
+    return ConnectCluster(deepcopy(CLUSTER_DEFINITION), {})
+
+
+def evaluate(
+    connect_cluster: ConnectCluster, fake_cluster: FakeConnectCluster, measure: Measure
+) -> None:
+    snapshot = load_snapshot(connect_cluster, fake_cluster)
+    with measure:
+        routes = connect_cluster.route_connectors(snapshot)
+        for rule in connect_cluster.handling_rules:
+            rule.execute(connect_cluster, snapshot, routes[rule])
+
+
+def benchmark(fake_cluster: FakeConnectCluster, rounds: int) -> dict:
+    connectors: int = len(fake_cluster.connectors_names)
+    first, steady = Measure(), Measure()
+    first_seconds = first_cpu_seconds = steady_seconds = steady_cpu_seconds = 0.0
+    for _ in range(rounds):
+        connect_cluster = new_cluster()
+        evaluate(connect_cluster, fake_cluster, first)
+        first_seconds += first.seconds
+        first_cpu_seconds += first.cpu_seconds
+        evaluate(connect_cluster, fake_cluster, steady)
+        steady_seconds += steady.seconds
+        steady_cpu_seconds += steady.cpu_seconds
+    return {
+        "connectors": connectors,
+        "failed": int(connectors * fake_cluster.failure_ratio),
+        "first_connectors_per_sec": rounds * connectors / first_seconds,
+        "first_cpu_seconds": first_cpu_seconds / rounds,
+        "steady_connectors_per_sec": rounds * connectors / steady_seconds,
+        "steady_cpu_seconds": steady_cpu_seconds / rounds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connectors", type=int, default=5000)
+    parser.add_argument("--tasks", type=int, default=3)
+    parser.add_argument("--failure-ratio", type=float, default=0.1)
+    parser.add_argument("--rounds", type=int, default=20)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    quiet_logs()
+    fake_cluster = FakeConnectCluster(args.connectors, args.tasks, args.failure_ratio)
+    print_results(benchmark(fake_cluster, args.rounds), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Local fake of the Kafka Connect REST API, simulating clusters of connectors and tasks, for the benchmarks.
+
+Each cluster is served on its own port. A ratio of the connectors have a failed task (with a stack trace), the
+responses can be delayed to simulate the REST latency, and the expand query parameters can be ignored, like the
+workers before Kafka 2.3 do. The requests are counted per endpoint, and their total is served on
+/__benchmark/requests (not counted).
+The benchmarks serve the clusters from a child process, so that they are not accounted in the CPU time and the RSS
+measured.
+
+    python -m benchmarks.fake_connect --clusters 3 --connectors 100 --tasks 3 --failure-ratio 0.1 --port 18083
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.cluster import ClusterSnapshot, ConnectCluster
+
+import argparse
+import json
+import multiprocessing
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from urllib.request import urlopen
+
+from kafka_connect_watcher.instrumentation import endpoint_template
+
+REQUESTS_COUNT_PATH: str = "/__benchmark/requests"
+
+TRACE: str = (
+    "org.apache.kafka.connect.errors.ConnectException: Exiting WorkerSinkTask due to unrecoverable exception.\n"
+    + "\tat org.apache.kafka.connect.runtime.WorkerSinkTask.deliverMessages(WorkerSinkTask.java:611)\n"
+    * 20
+)
+
+
+class FakeConnectHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    cluster: FakeConnectCluster
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, code: int, body=None) -> None:
+        payload: bytes = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_request(self, method: str) -> None:
+        if self.path == REQUESTS_COUNT_PATH:
+            return self.reply(200, self.cluster.requests_count())
+        self.cluster.record(method, self.path)
+        if self.cluster.latency:
+            sleep(self.cluster.latency)
+        code, body = self.cluster.respond(method, self.path)
+        self.reply(code, body)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+
+class FakeConnectCluster:
+    """A fake connect cluster of connectors, each with tasks, served on 127.0.0.1"""
+
+    def __init__(
+        self,
+        connectors: int = 100,
+        tasks: int = 1,
+        failure_ratio: float = 0.0,
+        latency: float = 0.0,
+        expand: bool = True,
+        port: int = 0,
+    ):
+        self.tasks = tasks
+        self.failure_ratio = failure_ratio
+        self.latency = latency
+        self.expand = expand
+        self.connectors_names: list[str] = [
+            f"connector-{index:05d}" for index in range(connectors)
+        ]
+        self._indexes: dict[str, int] = {
+            _name: _index for _index, _name in enumerate(self.connectors_names)
+        }
+        self.requests: Counter = Counter()
+        self._lock = Lock()
+        self._port = port
+        self.server: Union[ThreadingHTTPServer, None] = None
+        self._thread: Union[Thread, None] = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> FakeConnectCluster:
+        handler = type("ClusterHandler", (FakeConnectHandler,), {"cluster": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", self._port), handler)
+        self.server.daemon_threads = True
+        self._thread = Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def record(self, method: str, path: str) -> None:
+        with self._lock:
+            self.requests[f"{method} {endpoint_template(path)}"] += 1
+
+    def requests_count(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def is_failed(self, index: int) -> bool:
+        """Spreads the failed connectors evenly, floor(connectors * failure_ratio) of them"""
+        return int((index + 1) * self.failure_ratio) > int(index * self.failure_ratio)
+
+    def status(self, connector_name: str) -> dict:
+        failed: bool = self.is_failed(self._indexes[connector_name])
+        tasks: list[dict] = []
+        for task_id in range(self.tasks):
+            task: dict = {
+                "id": task_id,
+                "state": "RUNNING",
+                "worker_id": "10.0.0.1:8083",
+            }
+            if failed and task_id == 0:
+                task.update({"state": "FAILED", "trace": TRACE})
+            tasks.append(task)
+        return {
+            "name": connector_name,
+            "connector": {"state": "RUNNING", "worker_id": "10.0.0.1:8083"},
+            "tasks": tasks,
+            "type": "sink",
+        }
+
+    def info(self, connector_name: str) -> dict:
+        return {
+            "name": connector_name,
+            "config": {
+                "name": connector_name,
+                "connector.class": "io.confluent.connect.s3.S3SinkConnector",
+                "tasks.max": str(self.tasks),
+                "topics": f"topic-{connector_name}",
+            },
+            "tasks": [
+                {"connector": connector_name, "task": _task_id}
+                for _task_id in range(self.tasks)
+            ],
+            "type": "sink",
+        }
+
+    def expanded_payload(self) -> dict:
+        """Response to GET /connectors?expand=status&expand=info"""
+        return {
+            _name: {"status": self.status(_name), "info": self.info(_name)}
+            for _name in self.connectors_names
+        }
+
+    def respond(self, method: str, path: str) -> tuple[int, object]:
+        query_path, _, query = path.partition("?")
+        parts: list[str] = [_part for _part in query_path.split("/") if _part]
+        if method == "GET" and parts == []:
+            return 200, {
+                "version": "3.5.0",
+                "commit": "fake",
+                "kafka_cluster_id": "fake",
+            }
+        if method == "GET" and parts == ["admin", "loggers"]:
+            return 200, {"root": {"level": "INFO"}}
+        if method == "GET" and parts == ["connectors"]:
+            if self.expand and "expand" in query:
+                return 200, self.expanded_payload()
+            return 200, self.connectors_names
+        if len(parts) < 2 or parts[0] != "connectors" or parts[1] not in self._indexes:
+            return 404, {"error_code": 404, "message": f"{path} not found"}
+        connector_name: str = parts[1]
+        if method == "GET" and len(parts) == 2:
+            return 200, self.info(connector_name)
+        if method == "GET" and parts[2:] == ["status"]:
+            return 200, self.status(connector_name)
+        if method == "GET" and parts[2:] == ["tasks"]:
+            return 200, [
+                {"id": {"connector": connector_name, "task": _task_id}, "config": {}}
+                for _task_id in range(self.tasks)
+            ]
+        if method == "POST" and parts[-1] == "restart":
+            return 204, None
+        if method == "PUT" and parts[2:] in (["pause"], ["resume"]):
+            return 202, None
+        return 404, {"error_code": 404, "message": f"{path} not found"}
+
+
+def load_snapshot(
+    connect_cluster: ConnectCluster, fake_cluster: FakeConnectCluster
+) -> ClusterSnapshot:
+    """Sets the snapshot of the connect cluster from the fake cluster, without any REST call"""
+    connect_cluster.supports_expand = True
+    return connect_cluster.set_snapshot(
+        connect_cluster.states_from_expanded(fake_cluster.expanded_payload()), 0.0, 1
+    )
+
+
+def start_clusters(
+    clusters: int, first_port: int = 0, **cluster_options
+) -> list[FakeConnectCluster]:
+    return [
+        FakeConnectCluster(
+            port=first_port + _index if first_port else 0, **cluster_options
+        ).start()
+        for _index in range(clusters)
+    ]
+
+
+class RemoteFakeCluster:
+    """A fake cluster served by another process"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+
+    def requests_count(self) -> int:
+        with urlopen(f"{self.url}{REQUESTS_COUNT_PATH}") as response:
+            return json.loads(response.read())
+
+
+def serve_clusters(connection, clusters: int, cluster_options: dict) -> None:
+    fake_clusters = start_clusters(clusters, **cluster_options)
+    connection.send([_cluster.port for _cluster in fake_clusters])
+    connection.recv()
+    for fake_cluster in fake_clusters:
+        fake_cluster.stop()
+
+
+class FakeClustersProcess:
+    """Serves the fake clusters from a child process"""
+
+    def __init__(self, clusters: int, **cluster_options):
+        self._connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=serve_clusters,
+            args=(child_connection, clusters, cluster_options),
+            daemon=True,
+        )
+        self.clusters: list[RemoteFakeCluster] = []
+
+    def __enter__(self) -> list[RemoteFakeCluster]:
+        self.process.start()
+        self.clusters = [RemoteFakeCluster(_port) for _port in self._connection.recv()]
+        return self.clusters
+
+    def __exit__(self, *args):
+        self._connection.send("stop")
+        self.process.join(5)
+
+
+def add_cluster_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--clusters", type=int, default=3)
+    parser.add_argument("--connectors", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=3)
+    parser.add_argument("--failure-ratio", type=float, default=0.1)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to each response"
+    )
+    parser.add_argument(
+        "--no-expand",
+        action="store_true",
+        help="Ignore the expand query parameters, like the workers before Kafka 2.3",
+    )
+
+
+def clusters_options(args: argparse.Namespace) -> dict:
+    return {
+        "connectors": args.connectors,
+        "tasks": args.tasks,
+        "failure_ratio": args.failure_ratio,
+        "latency": args.latency,
+        "expand": not args.no_expand,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser("fake_connect")
+    add_cluster_arguments(parser)
+    parser.add_argument(
+        "--port", type=int, default=18083, help="Port of the first cluster"
+    )
+    args = parser.parse_args()
+    clusters = start_clusters(args.clusters, args.port, **clusters_options(args))
+    for cluster in clusters:
+        print(f"Fake connect cluster on {cluster.url}")
+    try:
+        clusters[0]._thread.join()
+    except KeyboardInterrupt:
+        for cluster in clusters:
+            cluster.stop()
+
+
+if __name__ == "__main__":
+    main()
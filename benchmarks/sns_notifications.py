@@ -0,0 +1,148 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Notifications per second sent by SnsChannel, compared to creating a session, a client and compiling
+the templates for every notification, and messages rendered per second for single notifications and digests.
+The SNS API is answered by a botocore before-send hook: requests are serialized & signed, but not sent.
+
+    python -m benchmarks.sns_notifications --notifications 500 --threads 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+
+from boto3.session import Session
+from botocore.awsrequest import AWSResponse
+from jinja2 import BaseLoader, Environment
+
+from benchmarks.common import Measure, add_output_arguments, print_results, quiet_logs
+from kafka_connect_watcher.aws_sns import SnsChannel
+from kafka_connect_watcher.notifications import Digest, Notification
+
+TOPIC_ARN = "arn:aws:sns:eu-west-1:123456789012:benchmark"
+PUBLISH_RESPONSE = (
+    b'<PublishResponse xmlns="http://sns.amazonaws.com/doc/2010-03-31/">'
+    b"<PublishResult><MessageId>benchmark</MessageId></PublishResult>"
+    b"</PublishResponse>"
+)
+
+
+class RawResponse:
+    def stream(self, **kwargs):
+        yield PUBLISH_RESPONSE
+
+
+def fake_send(request, **kwargs) -> AWSResponse:
+    return AWSResponse(request.url, 200, {}, RawResponse())
+
+
+def stub_client(client):
+    client.meta.events.register("before-send.sns.Publish", fake_send)
+    return client
+
+
+class ConnectorState:
+    def __init__(self, name: str):
+        self.name = name
+        self.status = {
+            "name": name,
+            "connector": {"state": "FAILED", "worker_id": "10.0.0.1:8083"},
+            "tasks": [{"id": 0, "state": "FAILED", "trace": "boom " * 200}],
+        }
+
+
+class Cluster:
+    name = "benchmark"
+
+
+def legacy_notification(channel: SnsChannel, connector: ConnectorState) -> None:
+    """Session, client & templates created for each notification"""
+    messages: dict = {}
+    for message_type, template in channel.messages_templates.items():
+        messages[message_type] = (
+            Environment(loader=BaseLoader(), autoescape=True, auto_reload=False)
+            .from_string(template)
+            .render(
+                env=environ,
+                CONNECTOR_NAME=connector.name,
+                CONNECT_CLUSTER_ID=Cluster.name,
+                CONNECT_TRACE_ERROR=json.dumps(connector.status),
+            )
+        )
+    stub_client(Session().client("sns", region_name=channel.region)).publish(
+        TopicArn=channel.arn,
+        Subject=f"Kafka Connect error for {connector.name}",
+        Message=json.dumps(messages),
+        MessageStructure="json",
+    )
+
+
+def cached_notification(channel: SnsChannel, connector: ConnectorState) -> None:
+    """Rendered & published as by the notifications dispatcher"""
+    channel.dispatch(Notification(Cluster.name, connector.name, connector.status))
+
+
+def render_digests(channel: SnsChannel, digest_size: int, digests: int) -> float:
+    """Digests of digest_size connectors rendered per second, without publishing"""
+    notifications = [
+        Notification(Cluster.name, _connector.name, _connector.status)
+        for _connector in (
+            ConnectorState(f"connector-{index}") for index in range(digest_size)
+        )
+    ]
+    digest = Digest(Cluster.name, notifications[0].signature, notifications)
+    with Measure() as measure:
+        for _ in range(digests):
+            channel.render_messages(digest)
+    return digests / measure.seconds
+
+
+def run(function, channel: SnsChannel, notifications: int, threads: int) -> float:
+    connectors = [
+        ConnectorState(f"connector-{index}") for index in range(notifications)
+    ]
+    with Measure() as measure, ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda _connector: function(channel, _connector), connectors))
+    return notifications / measure.seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notifications", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--digest-size",
+        type=int,
+        default=20,
+        help="Connectors in the digests of the render benchmark",
+    )
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    quiet_logs()
+    environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+    channel = SnsChannel("benchmark", {"topic_arn": TOPIC_ARN})
+    stub_client(channel.client)
+    results: dict = {
+        "legacy_notifications_per_sec": run(
+            legacy_notification, channel, args.notifications, args.threads
+        ),
+        "notifications_per_sec": run(
+            cached_notification, channel, args.notifications, args.threads
+        ),
+        "render_per_sec": render_digests(channel, 1, args.notifications),
+        "render_digests_per_sec": render_digests(
+            channel, args.digest_size, args.notifications
+        ),
+    }
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Startup time and memory of the watcher: imports, configuration loading and clusters creation, each measured
+in a fresh interpreter, with the optional features (SNS, EMF, Prometheus) disabled, then enabled.
+Also measures the configuration loading in a running process, where the schema validator is reused.
+
+    python -m benchmarks.startup --runs 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import yaml
+
+MINIMAL_CONFIG: dict = {
+    "clusters": [
+        {
+            "hostname": "localhost",
+            "port": 8083,
+            "evaluation_rules": [{"include_regex": [".*"]}],
+        }
+    ],
+}
+
+FEATURES_CONFIG: dict = {
+    "clusters": [
+        {
+            "hostname": "localhost",
+            "port": 8083,
+            "metrics": {
+                "aws_emf": {"enabled": True, "namespace": "KafkaConnect"},
+                "prometheus": {"enabled": True},
+            },
+            "evaluation_rules": [
+                {
+                    "include_regex": [".*"],
+                    "auto_correct_actions": [
+                        {"action": "restart", "notify": [{"target": "sns.alerts"}]}
+                    ],
+                }
+            ],
+        }
+    ],
+    "notification_channels": {
+        "sns": {"alerts": {"topic_arn": "arn:aws:sns:eu-west-1:123456789012:alerts"}}
+    },
+}
+
+STARTUP_SCRIPT: str = """
+import json, resource, sys
+from time import perf_counter
+start = perf_counter()
+from kafka_connect_watcher.cli import start_watcher
+from kafka_connect_watcher.aws_emf import init_emf_config
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.prometheus import publish_cluster_prometheus
+imported = perf_counter()
+config = Config(sys.argv[1])
+configured = perf_counter()
+clusters = [ConnectCluster(cluster, config) for cluster in config.config["clusters"]]
+init_emf_config(config, clusters)
+for cluster in clusters:
+    if cluster.prometheus_config:
+        cluster.metrics.update({"total": 0})
+        publish_cluster_prometheus(cluster)
+ready = perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "config_ms": (configured - imported) * 1000,
+    "clusters_ms": (ready - configured) * 1000,
+    "total_ms": (ready - start) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def measure(config_path: str, runs: int) -> dict:
+    results: list[dict] = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, config_path],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: median(result[key] for result in results) for key in results[0]}
+
+
+def config_reloads(config_path: str, loads: int) -> tuple[float, float]:
+    """Duration of the first configuration load, and the average of the following ones"""
+    from kafka_connect_watcher.config import Config
+
+    start = perf_counter()
+    Config(config_path)
+    first = perf_counter() - start
+    start = perf_counter()
+    for _ in range(loads):
+        Config(config_path)
+    return first, (perf_counter() - start) / loads
+
+
+def main():
+    parser = argparse.ArgumentParser("startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--loads", type=int, default=50)
+    args = parser.parse_args()
+    with TemporaryDirectory() as directory:
+        for name, config in (
+            ("minimal", MINIMAL_CONFIG),
+            ("features", FEATURES_CONFIG),
+        ):
+            config_path = f"{directory}/{name}.yaml"
+            with open(config_path, "w") as config_fd:
+                yaml.dump(config, config_fd)
+            result = measure(config_path, args.runs)
+            print(
+                f"{name:>9}: "
+                + ", ".join(f"{key}={value:.1f}" for key, value in result.items())
+            )
+        first, following = config_reloads(f"{directory}/minimal.yaml", args.loads)
+        print(
+            f"Config loading: first {first * 1000:.2f}ms, then {following * 1000:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Runs the benchmarks, each in its own interpreter so that the CPU time and peak RSS are its own, and compares
+the results to a baseline from a previous run. Exits with 1 when a result regressed by more than the tolerance:
+
+  * *_per_sec: higher is better.
+  * *_seconds, *_per_scan, *_per_cycle, *_mb: lower is better.
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --tolerance 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+from typing import Union
+
+BENCHMARKS: dict[str, list[str]] = {
+    "watcher_cycles": [
+        "--clusters",
+        "3",
+        "--connectors",
+        "500",
+        "--tasks",
+        "3",
+        "--failure-ratio",
+        "0.1",
+        "--cycles",
+        "10",
+        "--duration",
+        "6",
+    ],
+    "watcher_cycles_no_expand": [
+        "--clusters",
+        "2",
+        "--connectors",
+        "100",
+        "--no-expand",
+        "--cycles",
+        "3",
+        "--skip",
+        "run",
+    ],
+    "evaluation": ["--connectors", "5000", "--rounds", "10"],
+    "emf_serialization": ["--connectors", "2000", "--rounds", "5"],
+    "sns_notifications": ["--notifications", "100"],
+}
+
+LOWER_IS_BETTER: tuple = ("_seconds", "_per_scan", "_per_cycle", "_mb")
+
+
+def run_benchmark(name: str, arguments: list[str]) -> dict:
+    module: str = name.removesuffix("_no_expand")
+    process = subprocess.run(
+        [sys.executable, "-m", f"benchmarks.{module}", "--json", *arguments],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def regression(name: str, value: float, baseline: float) -> Union[float, None]:
+    """Relative regression of the value compared to the baseline, None when not comparable"""
+    if not baseline:
+        return None
+    if name.endswith("_per_sec"):
+        return (baseline - value) / baseline
+    if name.endswith(LOWER_IS_BETTER):
+        return (value - baseline) / baseline
+    return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions: list[str] = []
+    for benchmark, benchmark_results in results.items():
+        for name, value in benchmark_results.items():
+            baseline_value = baseline.get(benchmark, {}).get(name)
+            if baseline_value is None:
+                continue
+            change = regression(name, value, baseline_value)
+            if change is not None and change > tolerance:
+                regressions.append(
+                    f"{benchmark}.{name}: {value:.4g} (baseline {baseline_value:.4g}, {change:+.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="Path to write the results to, as JSON")
+    parser.add_argument("--baseline", help="Results of a previous run, to compare to")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative regression allowed. Defaults to 0.2",
+    )
+    parser.add_argument(
+        "--only", action="append", choices=list(BENCHMARKS), help="Benchmarks to run"
+    )
+    args = parser.parse_args()
+    results: dict = {}
+    for name, arguments in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        print(f"Running {name}", file=sys.stderr)
+        results[name] = run_benchmark(name, arguments)
+        for result_name, value in results[name].items():
+            print(f"{name}.{result_name}: {value}")
+    if args.output:
+        with open(args.output, "w") as output_fd:
+            json.dump(results, output_fd, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_fd:
+            regressions = compare(results, json.load(baseline_fd), args.tolerance)
+        for regressed in regressions:
+            print(f"REGRESSION {regressed}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Throughput of the watcher against local fake connect clusters (benchmarks.fake_connect), served by a child
+process: cluster scans per second, REST calls per cycle, CPU time per scan and peak RSS of the watcher.
+
+  * threads: cycles of process_connect_cluster over all the clusters, on a pool of cluster workers, back to back.
+  * async: the same cycles with the async engine (AsyncWatcher.process_cluster).
+  * run: Watcher.run for --duration seconds, scheduling the clusters every --interval.
+
+    python -m benchmarks.watcher_cycles --clusters 3 --connectors 500 --tasks 3 --failure-ratio 0.1 --cycles 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Timer
+
+from benchmarks.common import Measure, add_output_arguments, print_results, quiet_logs
+from benchmarks.fake_connect import (
+    FakeClustersProcess,
+    RemoteFakeCluster,
+    add_cluster_arguments,
+    clusters_options,
+)
+from kafka_connect_watcher.async_engine import AsyncConnectClient, AsyncWatcher
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.instrumentation import instrumentation_metrics
+from kafka_connect_watcher.threads_settings import NUM_THREADS
+from kafka_connect_watcher.watcher import Watcher, process_connect_cluster
+
+
+def no_metrics_reporter(config: Config, watcher) -> None:
+    pass
+
+
+def watcher_config(
+    fake_clusters: list[RemoteFakeCluster], interval: str, auto_correct: bool
+) -> Config:
+    rule: dict = {"include_regex": [".*"], "ignore_paused": True}
+    if auto_correct:
+        rule["auto_correct_actions"] = [{"action": "restart"}]
+    return Config(
+        configuration={
+            "watch_interval": interval,
+            "clusters": [
+                {
+                    "name": f"cluster-{_index}",
+                    "hostname": "127.0.0.1",
+                    "port": _cluster.port,
+                    "interval": interval,
+                    "evaluation_rules": [rule],
+                }
+                for _index, _cluster in enumerate(fake_clusters)
+            ],
+        }
+    )
+
+
+def requests_count(fake_clusters: list[RemoteFakeCluster]) -> int:
+    return sum(_cluster.requests_count() for _cluster in fake_clusters)
+
+
+def cycles_results(
+    prefix: str,
+    measure: Measure,
+    cycles: int,
+    scans: int,
+    rest_calls: int,
+) -> dict:
+    return {
+        f"{prefix}_scans_per_sec": scans / measure.seconds,
+        f"{prefix}_rest_calls_per_cycle": rest_calls / cycles,
+        f"{prefix}_cpu_seconds_per_scan": measure.cpu_seconds / scans,
+        f"{prefix}_cycle_seconds": measure.seconds / cycles,
+    }
+
+
+def threads_cycles(
+    fake_clusters: list[RemoteFakeCluster], config: Config, cycles: int, threads: int
+) -> dict:
+    clusters = [
+        ConnectCluster(_cluster, config) for _cluster in config.config["clusters"]
+    ]
+    watcher = Watcher(no_metrics_reporter, serve_prometheus=False)
+    with ThreadPoolExecutor(threads) as executor:
+        list(
+            executor.map(
+                lambda _cluster: process_connect_cluster(_cluster, watcher), clusters
+            )
+        )
+        start_requests = requests_count(fake_clusters)
+        with Measure() as measure:
+            for _ in range(cycles):
+                list(
+                    executor.map(
+                        lambda _cluster: process_connect_cluster(_cluster, watcher),
+                        clusters,
+                    )
+                )
+    return cycles_results(
+        "threads",
+        measure,
+        cycles,
+        cycles * len(clusters),
+        requests_count(fake_clusters) - start_requests,
+    )
+
+
+async def async_process(watcher: AsyncWatcher, clients: list[AsyncConnectClient]):
+    await asyncio.gather(
+        *(
+            watcher.process_cluster(_client.connect_cluster, _client)
+            for _client in clients
+        )
+    )
+
+
+async def async_cycles_run(
+    fake_clusters: list[RemoteFakeCluster], config: Config, cycles: int
+) -> dict:
+    clusters = [
+        ConnectCluster(_cluster, config) for _cluster in config.config["clusters"]
+    ]
+    watcher = AsyncWatcher(no_metrics_reporter, serve_prometheus=False)
+    clients = [AsyncConnectClient(_cluster) for _cluster in clusters]
+    try:
+        await async_process(watcher, clients)
+        start_requests = requests_count(fake_clusters)
+        with Measure() as measure:
+            for _ in range(cycles):
+                await async_process(watcher, clients)
+    finally:
+        await asyncio.gather(*(_client.close() for _client in clients))
+    return cycles_results(
+        "async",
+        measure,
+        cycles,
+        cycles * len(clusters),
+        requests_count(fake_clusters) - start_requests,
+    )
+
+
+def async_cycles(
+    fake_clusters: list[RemoteFakeCluster], config: Config, cycles: int
+) -> dict:
+    return asyncio.run(async_cycles_run(fake_clusters, config, cycles))
+
+
+def watcher_run(
+    fake_clusters: list[RemoteFakeCluster], config: Config, duration: float
+) -> dict:
+    """Watcher.run, stopped after duration. Runs last: it shuts down the shared pipelines."""
+    watcher = Watcher(no_metrics_reporter, serve_prometheus=False)
+    stop = Timer(duration, lambda: setattr(watcher, "keep_running", False))
+    start_requests = requests_count(fake_clusters)
+    stop.start()
+    with Measure() as measure:
+        watcher.run(config)
+    scans: int = instrumentation_metrics(watcher.clusters.values())["phase_fetch_count"]
+    rest_calls: int = requests_count(fake_clusters) - start_requests
+    return {
+        "run_scans": scans,
+        "run_rest_calls_per_scan": rest_calls / max(1, scans),
+        "run_cpu_seconds_per_scan": measure.cpu_seconds / max(1, scans),
+        "run_cpu_utilization": measure.cpu_seconds / measure.seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_cluster_arguments(parser)
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=NUM_THREADS)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", default="2s")
+    parser.add_argument(
+        "--auto-correct",
+        action="store_true",
+        help="Restart the failed connectors, which never recover",
+    )
+    parser.add_argument(
+        "--skip",
+        action="append",
+        default=[],
+        choices=["threads", "async", "run"],
+    )
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    quiet_logs()
+    results: dict = {
+        "clusters": args.clusters,
+        "connectors": args.connectors,
+        "tasks": args.tasks,
+    }
+    with FakeClustersProcess(args.clusters, **clusters_options(args)) as fake_clusters:
+        config = watcher_config(fake_clusters, args.interval, args.auto_correct)
+        if "threads" not in args.skip:
+            results.update(
+                threads_cycles(fake_clusters, config, args.cycles, args.threads)
+            )
+        if "async" not in args.skip:
+            results.update(async_cycles(fake_clusters, config, args.cycles))
+        if "run" not in args.skip:
+            results.update(watcher_run(fake_clusters, config, args.duration))
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
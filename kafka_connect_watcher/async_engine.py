@@ -0,0 +1,451 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+asyncio engine: scans the clusters as coroutines, using a pooled keep-alive HTTP client per cluster.
+
+aiohttp is an optional dependency (the async extra), only imported once a cluster opens its HTTP session.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Union
+
+if TYPE_CHECKING:
+    from aiohttp import ClientSession
+
+    from kafka_connect_watcher.cluster import (
+        ClusterSnapshot,
+        ConnectCluster,
+        ConnectorState,
+    )
+    from kafka_connect_watcher.config import Config
+    from kafka_connect_watcher.error_rules import EvaluationRule
+
+import asyncio
+import random
+import signal
+from time import perf_counter
+
+from kafka_connect_api.errors import GenericNotFound
+
+from kafka_connect_watcher.aws_emf import (
+    handle_watcher_emf,
+    init_emf_config,
+    publish_clusters_emf,
+)
+from kafka_connect_watcher.circuit_breaker import circuit_breakers_metrics
+from kafka_connect_watcher.cluster import ConnectCluster, connector_path
+from kafka_connect_watcher.connectors_eval import cycle_connector
+from kafka_connect_watcher.http_client import transport_metrics
+from kafka_connect_watcher.instrumentation import (
+    get_sampling_profiler,
+    instrumentation_metrics,
+)
+from kafka_connect_watcher.leases import get_lease_manager, init_leases
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.notifications import (
+    get_notification_pipeline,
+    init_notifications,
+)
+from kafka_connect_watcher.prometheus import (
+    get_metrics_registry,
+    init_prometheus,
+    publish_cluster_prometheus,
+)
+from kafka_connect_watcher.reload import ConfigWatcher, reload_clusters
+from kafka_connect_watcher.scheduler import DEFAULT_JITTER_RATIO, jitter
+
+
+class AsyncConnectClient:
+    """
+    Pooled, keep-alive HTTP client for a connect cluster, with the http_client settings of the cluster transport.
+    The number of requests (and blocking actions) in-flight against the cluster is capped by max_in_flight_requests.
+    """
+
+    def __init__(self, connect_cluster: ConnectCluster):
+        self.connect_cluster = connect_cluster
+        transport = connect_cluster.transport
+        self.max_in_flight_requests: int = transport.max_in_flight_requests
+        self.max_pool_size: int = transport.max_pool_size
+        self.request_timeout: float = transport.request_timeout
+        self.connect_timeout: float = transport.connect_timeout
+        self._semaphore = asyncio.Semaphore(self.max_in_flight_requests)
+        self._session: Union[ClientSession, None] = None
+        self.requests_count: int = 0
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            from aiohttp import BasicAuth, ClientSession, ClientTimeout, TCPConnector
+
+            api = self.connect_cluster.api
+            self._session = ClientSession(
+                connector=TCPConnector(
+                    limit=self.max_pool_size,
+                    ssl=None if api.verify_ssl else False,
+                ),
+                timeout=ClientTimeout(
+                    total=self.request_timeout, connect=self.connect_timeout
+                ),
+                auth=(
+                    BasicAuth(api.username, api.password)
+                    if api.username and api.password
+                    else None
+                ),
+                headers=api.headers,
+            )
+        return self._session
+
+    async def get(self, query_path: str) -> Union[dict, list]:
+        async with self._semaphore:
+            self.requests_count += 1
+            start = perf_counter()
+            error: bool = True
+            try:
+                async with self.session.get(
+                    f"{self.connect_cluster.api.url}{query_path}"
+                ) as response:
+                    if response.status == 404:
+                        raise GenericNotFound(404, (query_path, await response.text()))
+                    response.raise_for_status()
+                    payload = await response.json()
+                    error = False
+                    return payload
+            finally:
+                self.connect_cluster.http_stats.record(
+                    "GET", query_path, perf_counter() - start, error
+                )
+
+    async def run_sync(self, function: Callable, *args) -> Any:
+        """Runs blocking calls (connector actions) in a thread, counting against the in-flight limit"""
+        async with self._semaphore:
+            return await asyncio.to_thread(function, *args)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+async def fetch_connector_state(
+    connect_cluster: ConnectCluster, client: AsyncConnectClient, connector_name: str
+) -> tuple[Union[ConnectorState, None], int]:
+    """
+    The connector state, None if deleted meanwhile, and the number of REST calls made: status and info are
+    requested concurrently, so both are always sent.
+    """
+    status, info = await asyncio.gather(
+        client.get(f"{connector_path(connector_name)}/status"),
+        client.get(connector_path(connector_name)),
+        return_exceptions=True,
+    )
+    for result in (status, info):
+        if isinstance(result, GenericNotFound):
+            LOG.debug(f"{connect_cluster.name} - {connector_name} deleted during scan")
+            return None, 2
+        if isinstance(result, BaseException):
+            raise result
+    return connect_cluster.connector_state(connector_name, status, info), 2
+
+
+async def scan_cluster(
+    connect_cluster: ConnectCluster, client: AsyncConnectClient
+) -> ClusterSnapshot:
+    """Async equivalent of ConnectCluster.scan"""
+    start = perf_counter()
+    try:
+        payload = await client.get(connect_cluster.connectors_list_path)
+        rest_latency = perf_counter() - start
+        if connect_cluster.is_expanded(payload):
+            connectors = connect_cluster.states_from_expanded(payload)
+            rest_calls: int = 1
+        else:
+            results = await asyncio.gather(
+                *(
+                    fetch_connector_state(connect_cluster, client, connector_name)
+                    for connector_name in payload
+                )
+            )
+            connectors = {
+                _state.name: _state for _state, _ in results if _state is not None
+            }
+            rest_calls: int = 1 + sum(_rest_calls for _, _rest_calls in results)
+    except Exception:
+        connect_cluster.record_scan(False)
+        raise
+    connect_cluster.record_scan(True)
+    return connect_cluster.set_snapshot(
+        connectors, perf_counter() - start, rest_calls, rest_latency
+    )
+
+
+async def execute_rule(
+    rule: EvaluationRule,
+    connect_cluster: ConnectCluster,
+    client: AsyncConnectClient,
+    snapshot: ClusterSnapshot,
+    connectors_to_handle: list[ConnectorState],
+) -> bool:
+    """Async equivalent of EvaluationRule.execute"""
+    rule_label = connect_cluster.rule_label(rule)
+    try:
+        with connect_cluster.timers.time("evaluate", rule_label):
+            connectors_statuses, connectors_to_fix, connectors_to_cycle = rule.evaluate(
+                connectors_to_handle, snapshot.diff
+            )
+        remediate_start = perf_counter()
+        remediates = await asyncio.to_thread(
+            rule.remediates, connect_cluster, connectors_to_fix, connectors_to_cycle
+        )
+        if not remediates:
+            connectors_to_cycle = []
+        cycled = await asyncio.gather(
+            *(
+                client.run_sync(cycle_connector, connect_cluster, connector)
+                for connector in connectors_to_cycle
+            ),
+            return_exceptions=True,
+        )
+        for connector, connector_cycled in zip(connectors_to_cycle, cycled):
+            if isinstance(connector_cycled, Exception):
+                LOG.exception(connector_cycled)
+                LOG.error(f"{connect_cluster.name} - {connector.name}: failed to cycle")
+                connector_cycled = False
+            if not connector_cycled:
+                connectors_to_fix.append(connector)
+        rule.update_metrics(
+            connect_cluster,
+            len(snapshot.connectors),
+            len(connectors_to_handle),
+            connectors_statuses,
+            connectors_to_fix,
+        )
+        if remediates and rule.auto_correct_rules:
+            for connector in connectors_to_fix:
+                rule.auto_correct(connect_cluster, connector)
+        connect_cluster.timers.record(
+            "remediate", perf_counter() - remediate_start, rule_label
+        )
+        return True
+    except Exception as error:
+        LOG.exception(error)
+        LOG.error(f"Failed to process the cluster {connect_cluster.name}")
+        return False
+
+
+class AsyncWatcher:
+    """
+    Runs the watcher with asyncio: each cluster is watched by its own coroutine, on its own interval.
+    The watcher metrics are published with metrics_reporter, every scan interval.
+    """
+
+    def __init__(
+        self,
+        metrics_reporter: Callable[[Config, AsyncWatcher], None] = handle_watcher_emf,
+        serve_prometheus: bool = True,
+    ):
+        self.keep_running: bool = True
+        self.metrics_reporter = metrics_reporter
+        self.serve_prometheus = serve_prometheus
+        self._stop: Union[asyncio.Event, None] = None
+        self.clients: dict[str, AsyncConnectClient] = {}
+        self.clusters_tasks: dict[str, asyncio.Task] = {}
+        self.metrics: dict = {
+            "connect_clusters_total": 0,
+            "connect_clusters_healthy": 0,
+            "connect_clusters_unhealthy": 0,
+        }
+
+    def run(self, config: Config, config_watcher: ConfigWatcher = None):
+        try:
+            asyncio.run(self.run_async(config, config_watcher))
+        except KeyboardInterrupt:
+            LOG.debug("\rExited due to Keyboard interrupt")
+
+    def exit_gracefully(self):
+        self.keep_running = False
+        if self._stop:
+            self._stop.set()
+
+    async def run_async(self, config: Config, config_watcher: ConfigWatcher = None):
+        LOG.info("Initializing the watcher (async engine)")
+        get_sampling_profiler()
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for _signal in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(_signal, self.exit_gracefully)
+        clusters: list[ConnectCluster] = [
+            ConnectCluster(cluster, config) for cluster in config.config["clusters"]
+        ]
+        self.metrics.update({"connect_clusters_total": len(clusters)})
+        init_emf_config(config, clusters)
+        if self.serve_prometheus:
+            init_prometheus(config)
+        init_notifications(config)
+        init_leases(config)
+        for cluster in clusters:
+            self.start_cluster(cluster)
+        tasks: list[asyncio.Task] = [
+            asyncio.create_task(self.publish_watcher_metrics(config))
+        ]
+        if config_watcher is not None:
+            tasks.append(asyncio.create_task(self.watch_config(config, config_watcher)))
+        LOG.info(f"Watcher clusters ({len(clusters)}) initialized.")
+        try:
+            await self._stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(
+                *(self.stop_cluster(_name) for _name in list(self.clients))
+            )
+            await asyncio.to_thread(get_notification_pipeline().shutdown)
+            await asyncio.to_thread(get_lease_manager().shutdown)
+            profiler = get_sampling_profiler()
+            if profiler is not None:
+                await asyncio.to_thread(profiler.shutdown)
+
+    def start_cluster(self, connect_cluster: ConnectCluster) -> None:
+        client = AsyncConnectClient(connect_cluster)
+        self.clients[connect_cluster.name] = client
+        self.clusters_tasks[connect_cluster.name] = asyncio.create_task(
+            self.watch_cluster(client)
+        )
+
+    async def stop_cluster(self, cluster_name: str) -> None:
+        """Stops watching the cluster, and closes its HTTP session"""
+        task = self.clusters_tasks.pop(cluster_name, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        client = self.clients.pop(cluster_name, None)
+        if client is not None:
+            await client.close()
+            client.connect_cluster.transport.close()
+
+    async def watch_config(self, config: Config, config_watcher: ConfigWatcher):
+        """Reloads the configuration when it changed, starting & stopping the watch of the clusters"""
+        while self.keep_running:
+            await self.sleep(1.0)
+            if not config_watcher.changed():
+                continue
+            new_config = await asyncio.to_thread(config_watcher.load)
+            if new_config is None:
+                continue
+            changes = reload_clusters(
+                {
+                    _name: _client.connect_cluster
+                    for _name, _client in self.clients.items()
+                },
+                config,
+                new_config,
+            )
+            for connect_cluster in changes.removed:
+                await self.stop_cluster(connect_cluster.name)
+                get_metrics_registry().remove(connect_cluster.name)
+                get_lease_manager().release(connect_cluster.name)
+            for previous_cluster, connect_cluster in changes.rebuilt:
+                await self.stop_cluster(previous_cluster.name)
+                self.start_cluster(connect_cluster)
+                get_lease_manager().refresh_ttl(connect_cluster)
+            for connect_cluster in changes.added:
+                self.start_cluster(connect_cluster)
+            for connect_cluster in changes.reconfigured:
+                get_lease_manager().refresh_ttl(connect_cluster)
+            self.metrics.update({"connect_clusters_total": len(self.clients)})
+            init_notifications(new_config)
+            if self.serve_prometheus:
+                init_prometheus(new_config)
+            config = new_config
+
+    async def sleep(self, seconds: float) -> None:
+        """Sleeps for the given time, or until the watcher stops"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+
+    async def watch_cluster(self, client: AsyncConnectClient) -> None:
+        connect_cluster = client.connect_cluster
+        await self.sleep(
+            random.uniform(0, connect_cluster.interval * DEFAULT_JITTER_RATIO)
+        )
+        while self.keep_running:
+            start = perf_counter()
+            await self.process_cluster(connect_cluster, client)
+            elapsed = perf_counter() - start
+            LOG.info(
+                f"{connect_cluster.name} - Cluster processing finished - {elapsed:.3f}s"
+            )
+            if connect_cluster.circuit_open:
+                await self.sleep(connect_cluster.circuit_breaker.probe_in())
+            else:
+                await self.sleep(jitter(connect_cluster.interval) - elapsed)
+
+    async def process_cluster(
+        self, connect_cluster: ConnectCluster, client: AsyncConnectClient
+    ) -> None:
+        if connect_cluster.circuit_open and not await asyncio.to_thread(
+            connect_cluster.available
+        ):
+            self.metrics["connect_clusters_unhealthy"] += 1
+            publish_cluster_prometheus(connect_cluster)
+            return
+        try:
+            start = perf_counter()
+            snapshot = await scan_cluster(connect_cluster, client)
+            connect_cluster.timers.record("fetch", perf_counter() - start)
+            with connect_cluster.timers.time("filter"):
+                routes = connect_cluster.route_connectors(snapshot)
+        except Exception as error:
+            self.metrics["connect_clusters_unhealthy"] += 1
+            LOG.exception(error)
+            LOG.error(f"Failed to scan the cluster {connect_cluster.name}")
+            publish_cluster_prometheus(connect_cluster)
+            return
+        results = await asyncio.gather(
+            *(
+                execute_rule(rule, connect_cluster, client, snapshot, connectors)
+                for rule, connectors in routes.items()
+            )
+        )
+        if all(results):
+            self.metrics["connect_clusters_healthy"] += 1
+        else:
+            self.metrics["connect_clusters_unhealthy"] += 1
+        connect_cluster.adapt_interval()
+        start = perf_counter()
+        try:
+            if connect_cluster.emf_config:
+                await asyncio.to_thread(publish_clusters_emf, connect_cluster)
+        except Exception as error:
+            LOG.exception(error)
+            LOG.error(
+                f"Failed to export EMF metrics for cluster {connect_cluster.name}"
+            )
+        try:
+            publish_cluster_prometheus(connect_cluster)
+        except Exception as error:
+            LOG.exception(error)
+            LOG.error(
+                f"Failed to export prometheus metrics for cluster {connect_cluster.name}"
+            )
+        connect_cluster.timers.record("publish", perf_counter() - start)
+
+    async def publish_watcher_metrics(self, config: Config) -> None:
+        while self.keep_running:
+            await self.sleep(config.scan_intervals)
+            self.metrics.update(get_notification_pipeline().metrics)
+            self.metrics.update(get_lease_manager().metrics)
+            clusters: list[ConnectCluster] = [
+                _client.connect_cluster for _client in self.clients.values()
+            ]
+            self.metrics.update(instrumentation_metrics(clusters))
+            self.metrics.update(transport_metrics(clusters))
+            self.metrics.update(circuit_breakers_metrics(clusters))
+            await asyncio.to_thread(self.metrics_reporter, config, self)
+            LOG.debug(f"Watcher metrics: {self.metrics}")
+            self.metrics.update(
+                {"connect_clusters_healthy": 0, "connect_clusters_unhealthy": 0}
+            )
@@ -3,29 +3,45 @@
 
 """
 AWS EMF Publishing management for cluster & connectors
+
+aws_embedded_metrics (which pulls in aiohttp) is only imported once EMF publishing is enabled.
 """
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Union
 
 if TYPE_CHECKING:
+    from aws_embedded_metrics.environment import Environment
+    from aws_embedded_metrics.logger.metrics_context import MetricsContext
+    from aws_embedded_metrics.storage_resolution import StorageResolution
     from kafka_connect_watcher.cluster import ConnectCluster
     from kafka_connect_watcher.config import Config
     from kafka_connect_watcher.watcher import Watcher
 
+import sys
 from asyncio import get_event_loop, new_event_loop, set_event_loop
-from copy import deepcopy
-
-from aws_embedded_metrics import metric_scope
-from aws_embedded_metrics.config import get_config
 
 from kafka_connect_watcher.logger import LOG
 
-emf_config = get_config()
+
+def emf_enabled(config: Config, clusters: list[ConnectCluster]) -> bool:
+    return bool(
+        (config.emf_watcher_config and config.emf_watcher_config.enabled)
+        or any(
+            cluster.emf_config and cluster.emf_config.enabled for cluster in clusters
+        )
+    )
 
 
-def init_emf_config(config: Config) -> None:
+def init_emf_config(config: Config, clusters: list[ConnectCluster] = None) -> None:
+    """Configures the EMF library, if the watcher or any of the clusters publish EMF metrics"""
+    if clusters is not None and not emf_enabled(config, clusters):
+        LOG.debug("EMF metrics disabled")
+        return
+    from aws_embedded_metrics.config import get_config
+
+    emf_config = get_config()
     try:
         loop = get_event_loop()
     except RuntimeError:
@@ -36,75 +52,149 @@ def init_emf_config(config: Config) -> None:
     emf_config.log_group_name = config.emf_log_group
 
 
-@metric_scope
-def publish_cluster_metrics(cluster: ConnectCluster, metrics) -> None:
+class EmfWriter:
+    """
+    Buffers the EMF documents of a publishing cycle, and writes them all to the sink at once on flush.
+    The environment (and its sink) is resolved once per cycle.
+    Each document holds up to 100 metrics, all sharing the same dimensions values: the metrics of two
+    connectors cannot be packed in the same document.
+    The agent and stdout sinks are written to with their serializer and socket client, which aws-embedded-metrics
+    does not document: the library is pinned to a minor version, and tests/test_aws_emf.py checks these attributes.
+    Any other sink is written to with its public accept method, one context at a time.
+    """
+
+    def __init__(self, environment: Environment = None):
+        from aws_embedded_metrics.environment.environment_detector import (
+            resolve_environment_sync,
+        )
+        from aws_embedded_metrics.logger.metrics_context import MetricsContext
+        from aws_embedded_metrics.sinks.agent_sink import AgentSink
+        from aws_embedded_metrics.sinks.stdout_sink import StdoutSink
+
+        self.context_class = MetricsContext
+        self.environment = environment or resolve_environment_sync()
+        self.sink = self.environment.get_sink()
+        self.agent_sink: bool = isinstance(self.sink, AgentSink)
+        self.stdout_sink: bool = isinstance(self.sink, StdoutSink)
+        self.contexts: list[MetricsContext] = []
+
+    def __len__(self):
+        return len(self.contexts)
+
+    def put(
+        self,
+        namespace: str,
+        dimensions: dict,
+        metrics: dict,
+        resolution: StorageResolution,
+        properties: dict = None,
+    ) -> None:
+        context = self.context_class(namespace=namespace, properties=properties)
+        context.set_dimensions([dimensions], use_default=False)
+        self.environment.configure_context(context)
+        for metric_name, value in metrics.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            context.put_metric(metric_name, value, None, resolution)
+        if context.metrics:
+            self.contexts.append(context)
+
+    def documents(self) -> list[str]:
+        serializer = self.sink.serializer
+        documents: list[str] = []
+        for context in self.contexts:
+            if self.agent_sink:
+                context.meta["LogGroupName"] = self.sink.log_group_name
+                if self.sink.log_steam_name is not None:
+                    context.meta["LogStreamName"] = self.sink.log_steam_name
+            documents += serializer.serialize(context)
+        return documents
+
+    def flush(self) -> None:
+        if not self.contexts:
+            return
+        if self.agent_sink:
+            self.sink.client.send_message(
+                "".join(f"{document}\n" for document in self.documents()).encode(
+                    "utf-8"
+                )
+            )
+        elif self.stdout_sink:
+            sys.stdout.write("".join(f"{document}\n" for document in self.documents()))
+        else:
+            for context in self.contexts:
+                self.sink.accept(context)
+        self.contexts = []
+
+
+def publish_cluster_metrics(cluster: ConnectCluster, writer: EmfWriter) -> None:
     LOG.info(
         f"{cluster.name} - Publishing Cluster metrics to EMF with Resolution {cluster.emf_config.emf_resolution}",
     )
     LOG.debug(cluster.metrics)
-    metrics.reset_dimensions(use_default=False)
-    metrics.set_property("ConnectDetails", {"designation": cluster.name})
-    dimensions: dict = deepcopy(cluster.emf_config.dimensions)
-    dimensions.update({"ConnectCluster": cluster.name})
-    metrics.put_dimensions(dimensions)
-    for metric_name, value in cluster.metrics.items():
-        if not isinstance(value, (int, str)):
-            continue
-        metrics.put_metric(metric_name, value, None, cluster.emf_config.emf_resolution)
-
-
-@metric_scope
+    writer.put(
+        cluster.emf_config.namespace,
+        cluster.emf_config.dimensions_set(ConnectCluster=cluster.name),
+        cluster.metrics,
+        cluster.emf_config.emf_resolution,
+        {"ConnectDetails": {"designation": cluster.name}},
+    )
+
+
 def publish_connector_metrics(
-    cluster: ConnectCluster, connector_name, connector_metrics, metrics
+    cluster: ConnectCluster,
+    connector_name: str,
+    connector_metrics: dict,
+    writer: EmfWriter,
 ) -> None:
-    LOG.debug(
-        f"Publishing Cluster Connector metrics to EMF with Resolution {cluster.emf_config.emf_resolution}"
+    writer.put(
+        cluster.emf_config.namespace,
+        cluster.emf_config.dimensions_set(
+            ConnectorName=connector_name, ConnectCluster=cluster.name
+        ),
+        connector_metrics,
+        cluster.emf_config.emf_resolution,
+        {"ConnectDetails": {"designation": cluster.name}},
     )
-    metrics.set_namespace(cluster.emf_config.namespace)
-    metrics.reset_dimensions(use_default=False)
-    metrics.set_property("ConnectDetails", {"designation": cluster.name})
-    dimensions: dict = deepcopy(cluster.emf_config.dimensions)
-    dimensions.update({"ConnectorName": connector_name, "ConnectCluster": cluster.name})
-    metrics.put_dimensions(dimensions)
-    for _conn_metric_name, _conn_metric_value in connector_metrics.items():
-        metrics.put_metric(
-            _conn_metric_name,
-            _conn_metric_value,
-            None,
-            cluster.emf_config.emf_resolution,
-        )
 
 
-def publish_clusters_emf(cluster: ConnectCluster) -> None:
+def publish_clusters_emf(
+    cluster: ConnectCluster, environment: Union[Environment, None] = None
+) -> None:
+    """Publishes the cluster metrics, and the metrics of the connectors to report, in a single write"""
     if not cluster.emf_config.enabled:
         return
-    try:
-        loop = get_event_loop()
-    except RuntimeError:
-        loop = new_event_loop()
-    print("Publish EMF for clusters")
-    set_event_loop(loop)
-    publish_cluster_metrics(cluster)
-    for connector_name, connector_metrics in cluster.metrics["connectors"].items():
-        publish_connector_metrics(cluster, connector_name, connector_metrics)
+    writer = EmfWriter(environment)
+    publish_cluster_metrics(cluster, writer)
+    for connector_name in cluster.connectors_to_report:
+        publish_connector_metrics(
+            cluster,
+            connector_name,
+            cluster.metrics["connectors"][connector_name],
+            writer,
+        )
+    if cluster.snapshot:
+        for connector_name in cluster.snapshot.diff.removed:
+            cluster.emf_config.discard_dimensions_set(
+                ConnectorName=connector_name, ConnectCluster=cluster.name
+            )
+    LOG.debug(f"{cluster.name} - Publishing {len(writer)} EMF documents")
+    writer.flush()
 
 
-@metric_scope
-def publish_watcher_emf_metrics(config: Config, watcher: Watcher, metrics):
+def publish_watcher_emf_metrics(config: Config, watcher: Watcher) -> None:
     LOG.info(
         f"Publishing Watcher metrics to EMF with Resolution {config.emf_watcher_config.emf_resolution}"
     )
     LOG.debug(watcher.metrics)
-    metrics.set_namespace(config.emf_watcher_config.namespace)
-    metrics.reset_dimensions(use_default=False)
-    metrics.put_dimensions(config.emf_watcher_config.dimensions)
-    for _watcher_metric, _watcher_metric_value in watcher.metrics.items():
-        metrics.put_metric(
-            _watcher_metric,
-            _watcher_metric_value,
-            None,
-            config.emf_watcher_config.emf_resolution,
-        )
+    writer = EmfWriter()
+    writer.put(
+        config.emf_watcher_config.namespace,
+        config.emf_watcher_config.dimensions_set(),
+        watcher.metrics,
+        config.emf_watcher_config.emf_resolution,
+    )
+    writer.flush()
 
 
 def handle_watcher_emf(config: Config, watcher: Watcher) -> None:
@@ -7,25 +7,92 @@
 from __future__ import annotations
 
 import json
-from typing import TYPE_CHECKING, Union
+from typing import TYPE_CHECKING, Callable, Union
 
 if TYPE_CHECKING:
     from kafka_connect_api.kafka_connect_api import Connector
-    from kafka_connect_watcher.cluster import ConnectCluster
+    from kafka_connect_watcher.cluster import ConnectCluster, ConnectorState
 
 from copy import deepcopy
-from datetime import datetime as dt
 from os import environ, path
+from threading import Lock
 
 from boto3.session import Session
-from botocore.exceptions import ClientError
-from compose_x_common.aws import get_assume_role_session
-from compose_x_common.compose_x_common import keyisset, set_else_none
+from botocore.client import BaseClient
+from botocore.config import Config as BotoConfig
+from botocore.credentials import (
+    CredentialProvider,
+    CredentialResolver,
+    DeferredRefreshableCredentials,
+)
+from botocore.exceptions import BotoCoreError, ClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from botocore.exceptions import HTTPClientError
+from botocore.session import get_session
+from compose_x_common.compose_x_common import (
+    get_duration_timedelta,
+    keyisset,
+    set_else_none,
+)
 from importlib_resources import files as pkg_files
-from jinja2 import BaseLoader, Environment
+from jinja2 import BaseLoader, Environment, Template
 from kafka_connect_api.errors import GenericNotFound
 
 from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.notifications import (
+    Digest,
+    Notification,
+    NotificationCoalescer,
+    RateLimiter,
+    get_notification_pipeline,
+)
+from kafka_connect_watcher.threads_settings import EVALUATION_THREADS
+from kafka_connect_watcher.traces import FingerprintCache, trace_fingerprint
+
+ASSUME_ROLE_DURATION_SECONDS: int = 3600
+PUBLISH_BATCH_SIZE: int = 10
+PUBLISH_MAX_BYTES: int = 256 * 1024
+TRUNCATED_TRACE_SUFFIX: str = "... (truncated)"
+SUBJECT_MAX_LENGTH: int = 100
+DEFAULT_DEDUPE_TTL: str = "1h"
+RETRYABLE_ERROR_CODES: frozenset = frozenset(
+    (
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "KMSThrottlingException",
+        "InternalError",
+        "InternalFailure",
+        "ServiceUnavailable",
+    )
+)
+
+JINJA_ENV = Environment(
+    loader=BaseLoader(),
+    autoescape=True,
+    auto_reload=False,
+)
+
+
+def message_size(subject: str, messages: dict) -> int:
+    """Size of the message, as counted against the SNS payload limit"""
+    return len(subject.encode("utf-8")) + len(json.dumps(messages).encode("utf-8"))
+
+
+class AssumeRoleCredentialProvider(CredentialProvider):
+    """Credentials of the channel role, obtained from STS on first use, and refreshed before they expire"""
+
+    METHOD = "sns-channel-assume-role"
+    CANONICAL_NAME = "custom-sns-channel-assume-role"
+
+    def __init__(self, refresh_using: Callable[[], dict]):
+        super().__init__()
+        self.refresh_using = refresh_using
+
+    def load(self) -> DeferredRefreshableCredentials:
+        return DeferredRefreshableCredentials(
+            refresh_using=self.refresh_using, method=self.METHOD
+        )
 
 
 class SnsChannel:
@@ -43,11 +110,51 @@ class SnsChannel:
         }
         self.ignore_errors = keyisset("ignore_errors", self.definition)
         self._messages_templates: dict = {}
+        self._compiled_templates: dict[str, Template] = {}
         self.import_jinja2_templates()
+        self._session: Union[Session, None] = None
+        self._client: Union[BaseClient, None] = None
+        self._client_lock = Lock()
+        coalescing_window = set_else_none("coalescing_window", self.definition)
+        self.coalescer: Union[NotificationCoalescer, None] = (
+            NotificationCoalescer(
+                get_duration_timedelta(coalescing_window).total_seconds()
+            )
+            if coalescing_window
+            else None
+        )
+        self.rate_limiter = RateLimiter(
+            set_else_none("max_publishes_per_minute", self.definition)
+        )
+        dedupe_ttl = set_else_none("dedupe_ttl", self.definition, DEFAULT_DEDUPE_TTL)
+        self.fingerprints: Union[FingerprintCache, None] = (
+            FingerprintCache(get_duration_timedelta(dedupe_ttl).total_seconds())
+            if get_duration_timedelta(dedupe_ttl)
+            else None
+        )
+        self._metrics_lock = Lock()
+        self._metrics: dict = {
+            "received": 0,
+            "suppressed": 0,
+            "digests": 0,
+            "publish_calls": 0,
+            "rate_limited": 0,
+        }
+        get_notification_pipeline().register(self)
 
     def __repr__(self):
         return f"sns.{self.name}"
 
+    @property
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            return dict(self._metrics)
+
+    def count(self, metric_name: str, value: int = 1) -> None:
+        """Counts in the channel metrics, from the evaluation threads and the notifications dispatcher"""
+        with self._metrics_lock:
+            self._metrics[metric_name] += value
+
     def import_jinja2_templates(self) -> None:
         if keyisset("template", self.definition):
             self._templates_definitions.update(self.definition["template"])
@@ -56,75 +163,115 @@ class SnsChannel:
                 raise FileNotFoundError(f"Template file not found: {template_path}")
             with open(path.abspath(template_path)) as template_file:
                 self._messages_templates[message_type] = template_file.read()
+            self._compiled_templates[message_type] = JINJA_ENV.from_string(
+                self._messages_templates[message_type]
+            )
 
     @property
     def messages_templates(self) -> dict:
         """Messages templates"""
         return self._messages_templates
 
+    @property
+    def compiled_templates(self) -> dict[str, Template]:
+        """Messages templates, compiled once when imported"""
+        return self._compiled_templates
+
     @property
     def definition(self) -> dict:
         """Initial definition"""
         return self.__definition
 
+    @property
+    def region(self) -> str:
+        """The SNS client is created in the region of the topic"""
+        return self.arn.split(":")[3]
+
     def publish(self, subject: str, message: Union[str, dict]) -> None:
         """Publish message to SNS"""
         if not isinstance(message, (str, dict)):
             raise TypeError(f"message must be str or dict, not {type(message)}")
-        client = self.session.client("sns")
+        client = self.client
         try:
             if isinstance(message, str):
-                client.publish(TopicArn=self.arn, Subject=subject, Message=message)
+                get_notification_pipeline().send(
+                    client.publish,
+                    self.is_retryable,
+                    TopicArn=self.arn,
+                    Subject=subject,
+                    Message=message,
+                )
             else:
-                client.publish(
+                get_notification_pipeline().send(
+                    client.publish,
+                    self.is_retryable,
                     TopicArn=self.arn,
                     Subject=subject,
                     Message=json.dumps(message),
                     MessageStructure="json",
                 )
 
-        except (client.exceptions, ClientError) as error:
+        except (ClientError, BotoCoreError) as error:
             LOG.exception(error)
             LOG.error(f"{self.name} - Failed to send notification to {self.arn}")
 
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """Throttling, server side errors and connection errors are retried"""
+        if isinstance(error, ClientError):
+            return (
+                error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+                or error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+                >= 500
+            )
+        return isinstance(error, (BotoConnectionError, HTTPClientError))
+
     @staticmethod
     def render_message_template(
-        template: str,
+        template: Union[Template, str],
         cluster_id: str,
         connector_name: str,
         connector_error: str,
+        **variables,
     ) -> str:
-        jinja_env = Environment(
-            loader=BaseLoader(),
-            autoescape=True,
-            auto_reload=False,
-        ).from_string(template)
-
-        content = jinja_env.render(
+        if isinstance(template, str):
+            template = JINJA_ENV.from_string(template)
+        content = template.render(
             env=environ,
             CONNECTOR_NAME=connector_name,
             CONNECT_CLUSTER_ID=cluster_id,
             CONNECT_TRACE_ERROR=connector_error,
+            **variables,
         )
         return content
 
-    def send_error_notification(self, cluster: ConnectCluster, connector: Connector):
-        """Send error notification"""
-        subject = f"Kafka Connect error for {connector.name}"
+    def render_messages(
+        self, digest: Digest, trace_max_length: Union[int, None] = None
+    ) -> dict:
+        """
+        Renders the message for each message type. For a digest of several connectors, CONNECTOR_NAME
+        is the list of their names, and the trace is the one of the first connector, truncated to
+        trace_max_length characters if set.
+        """
+        connectors_names = digest.connectors_names
+        connector_trace = json.dumps(digest.notifications[0].status)
+        if trace_max_length is not None and len(connector_trace) > trace_max_length:
+            connector_trace = (
+                f"{connector_trace[:trace_max_length]}{TRUNCATED_TRACE_SUFFIX}"
+            )
         messages: dict = {}
-        try:
-            connector_status = connector.status
-        except GenericNotFound:
-            connector_status = "Connector does not have any workable status"
-        for sns_message_type in self.messages_templates:
+        for sns_message_type, template in self.compiled_templates.items():
             try:
-                content = self.render_message_template(
-                    self.messages_templates[sns_message_type],
-                    cluster.name,
-                    connector.name,
-                    json.dumps(connector_status),
+                messages[sns_message_type] = self.render_message_template(
+                    template,
+                    digest.cluster_name,
+                    ", ".join(connectors_names),
+                    connector_trace,
+                    CONNECTORS=connectors_names,
+                    CONNECTORS_COUNT=len(connectors_names),
+                    ERROR_SIGNATURE=digest.signature,
+                    REPEATS=digest.repeats,
                 )
-                messages[sns_message_type] = content
             except Exception as error:
                 LOG.exception(error)
                 LOG.error(
@@ -132,19 +279,238 @@ class SnsChannel:
                 )
                 if not self.ignore_errors:
                     raise
+        return messages
+
+    def render_digest(self, digest: Digest) -> tuple[str, dict, int]:
+        """
+        Renders the subject and messages of the digest, with their size. Over the SNS limit of 256KB,
+        the messages are rendered again with the connector trace truncated to fit.
+        """
+        subject = self.digest_subject(digest)
+        messages = self.render_messages(digest)
+        size = message_size(subject, messages)
+        trace_length = len(json.dumps(digest.notifications[0].status))
+        while size > PUBLISH_MAX_BYTES and trace_length > 0:
+            trace_length = max(
+                0,
+                min(
+                    trace_length - 1,
+                    int(trace_length * 0.9 * PUBLISH_MAX_BYTES / size),
+                ),
+            )
+            messages = self.render_messages(digest, trace_length)
+            size = message_size(subject, messages)
+        return subject, messages, size
+
+    @staticmethod
+    def digest_subject(digest: Digest) -> str:
+        connectors_names = digest.connectors_names
+        if len(connectors_names) == 1:
+            return f"Kafka Connect error for {connectors_names[0]}"
+        subject: str = (
+            f"Kafka Connect errors for {len(connectors_names)} connectors in {digest.cluster_name}"
+        )
+        return subject[:SUBJECT_MAX_LENGTH]
+
+    def send_error_notification(
+        self,
+        cluster: ConnectCluster,
+        connector: Connector,
+        connector_state: ConnectorState = None,
+    ):
+        """
+        Send error notification. Uses the status from the cluster scan snapshot when provided,
+        otherwise retrieves it from the connect cluster.
+        The notification is queued for the notifications dispatcher: this never waits on SNS.
+        """
+        if connector_state is not None:
+            connector_status = connector_state.status
+        else:
+            try:
+                connector_status = connector.status
+            except GenericNotFound:
+                connector_status = "Connector does not have any workable status"
+        self.count("received")
+        repeats: Union[int, None] = 0
+        if self.fingerprints is not None:
+            repeats = self.fingerprints.admit(
+                (cluster.name, connector.name, trace_fingerprint(connector_status))
+            )
+            if repeats is None:
+                self.count("suppressed")
+                LOG.debug(
+                    f"{self} - {connector.name} error already notified. Suppressing notification"
+                )
+                return
+        get_notification_pipeline().submit(
+            self,
+            Notification(cluster.name, connector.name, connector_status, repeats),
+        )
+
+    def dispatch(self, notification: Notification) -> None:
+        """
+        Delivers the notification, from the notifications dispatcher thread.
+        With a coalescing window, the notification is grouped with the other notifications of the window.
+        """
+        if self.coalescer is not None:
+            self.coalescer.add(notification)
+            return
+        digest = Digest(
+            notification.cluster_name, notification.signature, [notification]
+        )
+        if not self.rate_limiter.try_acquire():
+            self.count("rate_limited")
+            LOG.warning(
+                f"{self} - notifications rate limit reached. Dropping notification for {notification.connector_name}"
+            )
+            return
+        subject, messages, _ = self.render_digest(digest)
         self.publish(subject, messages)
+        self.count("publish_calls")
+
+    def publish_digests(self, digests: list[Digest]) -> None:
+        """
+        Publishes the digests with PublishBatch, in batches of up to 10 messages and 256KB.
+        Digests over the rate limit are put back into the coalescer, for the next window.
+        """
+        to_publish: list[Digest] = []
+        for index, digest in enumerate(digests):
+            if not self.rate_limiter.try_acquire():
+                self.count("rate_limited", len(digests) - index)
+                LOG.warning(
+                    f"{self} - notifications rate limit reached. Deferring {len(digests) - index} digests"
+                )
+                self.coalescer.requeue(digests[index:])
+                break
+            to_publish.append(digest)
+        for batch in self.batches(to_publish):
+            if len(batch) == 1:
+                self.publish(batch[0][1], batch[0][2])
+            else:
+                self.publish_batch(batch)
+            self.count("publish_calls")
+            self.count("digests", len(batch))
+
+    def batches(self, digests: list[Digest]) -> list[list[tuple[Digest, str, dict]]]:
+        """
+        Renders the digests, and groups them in batches within the PublishBatch limits: 10 messages,
+        and 256KB for all the messages together.
+        """
+        batches: list[list[tuple[Digest, str, dict]]] = []
+        batch: list[tuple[Digest, str, dict]] = []
+        batch_size: int = 0
+        for digest in digests:
+            subject, messages, size = self.render_digest(digest)
+            if batch and (
+                len(batch) >= PUBLISH_BATCH_SIZE
+                or batch_size + size > PUBLISH_MAX_BYTES
+            ):
+                batches.append(batch)
+                batch = []
+                batch_size = 0
+            batch.append((digest, subject, messages))
+            batch_size += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def publish_batch(self, batch: list[tuple[Digest, str, dict]]) -> None:
+        """
+        Publishes the rendered digests with PublishBatch. The digests which failed on the SNS side
+        are put back into the coalescer, to be published with the next window.
+        """
+        try:
+            response = get_notification_pipeline().send(
+                self.client.publish_batch,
+                self.is_retryable,
+                TopicArn=self.arn,
+                PublishBatchRequestEntries=[
+                    {
+                        "Id": str(index),
+                        "Subject": subject,
+                        "Message": json.dumps(messages),
+                        "MessageStructure": "json",
+                    }
+                    for index, (_, subject, messages) in enumerate(batch)
+                ],
+            )
+        except (ClientError, BotoCoreError) as error:
+            LOG.exception(error)
+            LOG.error(f"{self.name} - Failed to send notifications to {self.arn}")
+            return
+        to_requeue: list[Digest] = []
+        for failed in response.get("Failed", []):
+            LOG.error(
+                f"{self.name} - Failed to send notification {failed.get('Id')} to {self.arn}: "
+                f"{failed.get('Code')} {failed.get('Message')}"
+            )
+            if not failed.get("SenderFault", True):
+                to_requeue.append(batch[int(failed["Id"])][0])
+        if to_requeue:
+            LOG.warning(
+                f"{self} - Requeuing {len(to_requeue)} notifications which failed on the SNS side"
+            )
+            self.coalescer.requeue(to_requeue)
 
     @property
     def session(self) -> Session:
-        if keyisset("role_arn", self.definition):
-            return get_assume_role_session(
-                Session(),
-                self.definition["role_arn"],
-                set_else_none(
+        """
+        Long-lived session. With role_arn, its credentials are obtained from STS on first use, and
+        refreshed before they expire.
+        """
+        if self._session is None:
+            with self._client_lock:
+                if self._session is None:
+                    self._session = self.create_session()
+        return self._session
+
+    @property
+    def client(self) -> BaseClient:
+        """SNS client, shared by all the threads sending notifications (boto3 clients are thread-safe)"""
+        if self._client is None:
+            session = self.session
+            with self._client_lock:
+                if self._client is None:
+                    self._client = session.client(
+                        "sns",
+                        region_name=self.region,
+                        config=BotoConfig(
+                            max_pool_connections=max(10, EVALUATION_THREADS)
+                        ),
+                    )
+        return self._client
+
+    def create_session(self) -> Session:
+        if not keyisset("role_arn", self.definition):
+            return Session()
+        botocore_session = get_session()
+        botocore_session.register_component(
+            "credential_provider",
+            CredentialResolver(
+                [AssumeRoleCredentialProvider(self.assume_role_credentials)]
+            ),
+        )
+        return Session(botocore_session=botocore_session)
+
+    def assume_role_credentials(self) -> dict:
+        """Credentials metadata for the refreshable credentials, from STS AssumeRole"""
+        LOG.debug(f"{self.name} - assuming role {self.definition['role_arn']}")
+        credentials = (
+            Session()
+            .client("sts")
+            .assume_role(
+                RoleArn=self.definition["role_arn"],
+                RoleSessionName=set_else_none(
                     "role_session_name",
                     self.definition,
                     f"KafkaConnectWatcher{self.name}",
                 ),
-            )
-        else:
-            return Session()
+                DurationSeconds=ASSUME_ROLE_DURATION_SECONDS,
+            )["Credentials"]
+        )
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": credentials["Expiration"].isoformat(),
+        }
@@ -0,0 +1,146 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Circuit breaker of a connect cluster, so that an unreachable cluster fails fast instead of waiting out the
+HTTP timeouts at every scan.
+
+  * closed: the cluster is scanned. Opens after failure_threshold consecutive failed scans.
+  * open: the cluster is not scanned until its probe is due, probe_interval after opening.
+  * half-open: the probe is due. The cluster is probed with GET /, closing the breaker on success, otherwise
+    opening it again for backoff_factor times longer, up to max_probe_interval.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Iterable
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.cluster import ConnectCluster
+
+from threading import Lock
+from time import monotonic
+
+from kafka_connect_watcher.scheduler import DEFAULT_JITTER_RATIO
+
+CLOSED: str = "closed"
+HALF_OPEN: str = "half-open"
+OPEN: str = "open"
+CIRCUIT_STATES: tuple[str, ...] = (CLOSED, HALF_OPEN, OPEN)
+
+DEFAULT_FAILURE_THRESHOLD: int = 3
+DEFAULT_PROBE_INTERVAL: str = "10s"
+DEFAULT_MAX_PROBE_INTERVAL: str = "5m"
+DEFAULT_PROBE_TIMEOUT: str = "5s"
+
+
+class CircuitBreaker:
+    """
+    States of the cluster breaker. The probe is allowed up to the scheduling jitter early, so that a cluster
+    scheduled on its probe delay is not skipped for a whole delay more.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        probe_interval: float = 10.0,
+        max_probe_interval: float = 300.0,
+        backoff_factor: float = 2.0,
+        probe_timeout: float = 5.0,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max(max_probe_interval, probe_interval)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.probe_timeout = probe_timeout
+        self.clock = clock
+        self.state: str = CLOSED
+        self.failures: int = 0
+        self.probe_delay: float = probe_interval
+        self.probe_due: float = 0.0
+        self._lock = Lock()
+        self._metrics: dict = {
+            "circuit_breaker_opened": 0,
+            "circuit_breaker_probes": 0,
+            "cluster_scans_skipped": 0,
+        }
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == CLOSED
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self._metrics)
+
+    def probe_in(self) -> float:
+        """Seconds until the probe is due, 0 when closed"""
+        if self.state == CLOSED:
+            return 0.0
+        return max(0.0, self.probe_due - self.clock())
+
+    def allow(self) -> bool:
+        """
+        Whether the cluster can be queried. When the probe is due, the breaker goes half-open and the caller
+        must probe the cluster, then record the result. Counts the scans skipped otherwise.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() >= self.probe_due - (
+                self.probe_delay * DEFAULT_JITTER_RATIO
+            ):
+                self.state = HALF_OPEN
+                self._metrics["circuit_breaker_probes"] += 1
+                return True
+            self._metrics["cluster_scans_skipped"] += 1
+            return False
+
+    def record_success(self) -> str:
+        """Closes the breaker. Returns the previous state."""
+        with self._lock:
+            previous_state: str = self.state
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_delay = self.probe_interval
+            return previous_state
+
+    def record_failure(self) -> str:
+        """
+        Counts the failure, and opens the breaker after failure_threshold of them, or straight away when
+        half-open, with the probe delay backed off. Returns the new state.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probe_delay = min(
+                    self.max_probe_interval, self.probe_delay * self.backoff_factor
+                )
+            elif self.state == CLOSED:
+                self.failures += 1
+                if self.failures < self.failure_threshold:
+                    return self.state
+                self.probe_delay = self.probe_interval
+                self._metrics["circuit_breaker_opened"] += 1
+            self.state = OPEN
+            self.probe_due = self.clock() + self.probe_delay
+            return self.state
+
+
+def circuit_breakers_metrics(clusters: Iterable[ConnectCluster]) -> dict:
+    """Clusters which circuit is not closed, and totals of the breakers metrics, for the watcher metrics"""
+    metrics: dict = {
+        "connect_clusters_open": 0,
+        "circuit_breaker_opened": 0,
+        "circuit_breaker_probes": 0,
+        "cluster_scans_skipped": 0,
+    }
+    for cluster in clusters:
+        if cluster.circuit_breaker is None:
+            continue
+        if not cluster.circuit_breaker.is_closed:
+            metrics["connect_clusters_open"] += 1
+        for metric_name, value in cluster.circuit_breaker.metrics.items():
+            metrics[metric_name] += value
+    return metrics
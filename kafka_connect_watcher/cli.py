@@ -2,9 +2,12 @@
 #   Copyright 2023 John "Preston" Mille <john@ews-network.net>
 
 import argparse
+from importlib.util import find_spec
 from os import path
 
 from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.reload import ConfigWatcher
+from kafka_connect_watcher.sharding import Shard, ShardedWatcher
 from kafka_connect_watcher.watcher import Watcher
 
 
@@ -13,12 +16,64 @@ def start_watcher():
     parser.add_argument(
         "-c", "--config-file", help="The input configuration file", required=True
     )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "async"],
+        help="Execution engine. Overrides the engine set in the configuration file. Defaults to threads",
+        default=None,
+    )
+    parser.add_argument(
+        "--reload-interval",
+        type=float,
+        help="Seconds between checks of the configuration file for changes, to reload it."
+        " The configuration is reloaded on SIGHUP regardless.",
+        default=None,
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        help="Index of the shard of clusters watched by this replica, in [0, --shard-count)",
+        default=0,
+    )
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        help="Number of replicas the clusters are sharded across. Defaults to 1",
+        default=1,
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Number of worker processes the clusters of the replica are sharded across. Defaults to 1",
+        default=1,
+    )
 
     args = parser.parse_args()
+    try:
+        shard = Shard(args.shard_index, args.shard_count)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.processes < 1:
+        parser.error("--processes must be 1 or more")
+
+    config = shard.select(Config(path.abspath(args.config_file)))
+    engine = args.engine if args.engine else config.engine
+    if engine == "async" and find_spec("aiohttp") is None:
+        parser.error(
+            "The async engine requires aiohttp: pip install kafka-connect-watcher[async]"
+        )
+    if args.processes > 1:
+        ShardedWatcher(args.processes, shard, engine, args.reload_interval).run(config)
+        return
+    config_watcher = ConfigWatcher(args.config_file, args.reload_interval, shard=shard)
+    config_watcher.install_signal_handler()
+    if engine == "async":
+        from kafka_connect_watcher.async_engine import AsyncWatcher
 
-    config = Config(path.abspath(args.config_file))
-    watcher = Watcher()
-    watcher.run(config)
+        watcher = AsyncWatcher()
+    else:
+        watcher = Watcher()
+    watcher.run(config, config_watcher)
 
 
 if __name__ == "__main__":
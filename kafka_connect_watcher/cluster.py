@@ -8,20 +8,234 @@ Models Connect cluster
 from __future__ import annotations
 
 from copy import deepcopy
-from typing import TYPE_CHECKING
+from dataclasses import dataclass, field
+from functools import cached_property
+from sys import getsizeof
+from time import perf_counter
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping, Union
+from urllib.parse import quote
 
 if TYPE_CHECKING:
     from kafka_connect_watcher.config import Config
 
-from aws_embedded_metrics.config import get_config
-from compose_x_common.compose_x_common import keyisset, set_else_none
-from kafka_connect_api.kafka_connect_api import Api, Cluster, Connector
-from prometheus_client import Gauge
+from compose_x_common.compose_x_common import (
+    get_duration_timedelta,
+    keyisset,
+    set_else_none,
+)
+from kafka_connect_api.errors import GenericNotFound
+from kafka_connect_api.kafka_connect_api import Cluster, Connector
 
-from kafka_connect_watcher.config import EmfConfig
+from kafka_connect_watcher.circuit_breaker import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_MAX_PROBE_INTERVAL,
+    DEFAULT_PROBE_INTERVAL,
+    DEFAULT_PROBE_TIMEOUT,
+    OPEN,
+    CircuitBreaker,
+)
+from kafka_connect_watcher.config import (
+    DEFAULT_WATCH_INTERVAL,
+    EmfConfig,
+    get_interval_seconds,
+)
+from kafka_connect_watcher.connectors_eval import (
+    CONNECTOR_METRICS_SIZE,
+    ConnectorMetrics,
+    get_connector_metrics,
+)
 from kafka_connect_watcher.error_rules import EvaluationRule
+from kafka_connect_watcher.http_client import HttpTransport, PooledApi
+from kafka_connect_watcher.instrumentation import (
+    HttpStats,
+    PhaseTimers,
+)
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.remediation import get_remediation_scheduler
+from kafka_connect_watcher.scheduler import AdaptiveInterval
+from kafka_connect_watcher.workers import get_evaluation_pool
 
-emf_config = get_config()
+DEFAULT_FAST_INTERVAL: int = 5
+
+EXPANDED_CONNECTORS_PATH: str = "/connectors?expand=status&expand=info"
+
+
+def connector_path(connector_name: str) -> str:
+    """REST path of the connector, with its name quoted: names can contain /, ? or spaces"""
+    return f"/connectors/{quote(connector_name, safe='')}"
+
+
+@dataclass(frozen=True)
+class TaskState:
+    """
+    Immutable state of a connector task, as reported by the connect cluster at scan time.
+    """
+
+    id: int
+    state: str
+    worker_id: Union[str, None] = None
+    trace: Union[str, None] = None
+
+    def is_running(self) -> bool:
+        return self.state == "RUNNING"
+
+    @classmethod
+    def from_status(cls, task_status: dict) -> TaskState:
+        return cls(
+            id=int(task_status["id"]),
+            state=task_status.get("state", "UNKNOWN"),
+            worker_id=task_status.get("worker_id"),
+            trace=task_status.get("trace"),
+        )
+
+
+@dataclass(frozen=True)
+class ConnectorState:
+    """
+    Immutable state of a connector and its tasks, as reported by the connect cluster at scan time.
+    The handle is the kafka_connect_api Connector, used to apply actions onto the live connector.
+    """
+
+    name: str
+    state: str
+    tasks: tuple[TaskState, ...] = ()
+    type: Union[str, None] = None
+    worker_id: Union[str, None] = None
+    trace: Union[str, None] = None
+    config: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    handle: Union[Connector, None] = field(default=None, compare=False, repr=False)
+
+    def is_running(self) -> bool:
+        return self.state == "RUNNING"
+
+    def is_healthy(self) -> bool:
+        return self.is_running() and all(_task.is_running() for _task in self.tasks)
+
+    @cached_property
+    def signature(self) -> tuple:
+        """The connector & tasks states, compared between two scans to detect state transitions"""
+        return self.state, tuple((_task.id, _task.state) for _task in self.tasks)
+
+    @property
+    def status(self) -> dict:
+        """Connector status in the format of GET /connectors/{name}/status"""
+        connector_status: dict = {"state": self.state, "worker_id": self.worker_id}
+        if self.trace:
+            connector_status["trace"] = self.trace
+        tasks: list[dict] = []
+        for task in self.tasks:
+            task_status: dict = {
+                "id": task.id,
+                "state": task.state,
+                "worker_id": task.worker_id,
+            }
+            if task.trace:
+                task_status["trace"] = task.trace
+            tasks.append(task_status)
+        return {
+            "name": self.name,
+            "connector": connector_status,
+            "tasks": tasks,
+            "type": self.type,
+        }
+
+    @classmethod
+    def from_status(
+        cls,
+        name: str,
+        status: Union[dict, None],
+        info: Union[dict, None] = None,
+        handle: Connector = None,
+    ) -> ConnectorState:
+        status = status or {}
+        info = info or {}
+        connector_status: dict = status.get("connector", {})
+        return cls(
+            name=name,
+            state=connector_status.get("state", "UNKNOWN"),
+            tasks=tuple(
+                sorted(
+                    (TaskState.from_status(_task) for _task in status.get("tasks", [])),
+                    key=lambda _task: _task.id,
+                )
+            ),
+            type=status.get("type", info.get("type")),
+            worker_id=connector_status.get("worker_id"),
+            trace=connector_status.get("trace"),
+            config=MappingProxyType(dict(info.get("config", {}))),
+            handle=handle,
+        )
+
+
+@dataclass(frozen=True)
+class SnapshotDiff:
+    """
+    Names of the connectors added, removed, or which connector/tasks state changed between two scans.
+    """
+
+    added: frozenset[str] = frozenset()
+    removed: frozenset[str] = frozenset()
+    changed: frozenset[str] = frozenset()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    @property
+    def updated(self) -> frozenset[str]:
+        """Connectors which state is new for this scan"""
+        return self.added | self.changed
+
+    @classmethod
+    def compare(
+        cls,
+        previous: Union[Mapping[str, ConnectorState], None],
+        current: Mapping[str, ConnectorState],
+    ) -> SnapshotDiff:
+        if previous is None:
+            return cls(added=frozenset(current))
+        return cls(
+            added=frozenset(current.keys() - previous.keys()),
+            removed=frozenset(previous.keys() - current.keys()),
+            changed=frozenset(
+                connector_name
+                for connector_name, connector in current.items()
+                if connector_name in previous
+                and previous[connector_name].signature != connector.signature
+            ),
+        )
+
+
+class ClusterSnapshot:
+    """
+    Point in time view of all the connectors of a connect cluster, taken once per scan.
+    The diff holds the changes from the previous snapshot of the cluster.
+    """
+
+    def __init__(
+        self,
+        connectors: dict[str, ConnectorState],
+        expanded: bool,
+        duration: float = 0.0,
+        rest_calls: int = 0,
+        previous: ClusterSnapshot = None,
+        rest_latency: float = 0.0,
+    ):
+        self._connectors = MappingProxyType(connectors)
+        self.expanded = expanded
+        self.duration = duration
+        self.rest_calls = rest_calls
+        self.rest_latency = rest_latency
+        self.diff = SnapshotDiff.compare(
+            previous.connectors if previous else None, self._connectors
+        )
+
+    def __len__(self):
+        return len(self._connectors)
+
+    @property
+    def connectors(self) -> Mapping[str, ConnectorState]:
+        return self._connectors
 
 
 class ConnectCluster:
@@ -46,29 +260,47 @@ class ConnectCluster:
         password = set_else_none(
             "password", set_else_none("authentication", cluster_config)
         )
+        self.timers = PhaseTimers()
+        self.http_stats = HttpStats()
+        self.transport = HttpTransport(set_else_none("http_client", cluster_config, {}))
         if url:
-            self._api = Api(
+            self._api = PooledApi(
                 self.hostname,
                 url=url,
                 username=username,
                 password=password,
+                http_stats=self.http_stats,
+                transport=self.transport,
             )
         else:
-            self._api = Api(
+            self._api = PooledApi(
                 self.hostname,
                 port=int(set_else_none("port", cluster_config, 8083)),
                 username=username,
                 password=password,
+                http_stats=self.http_stats,
+                transport=self.transport,
             )
-        try:
-            self._cluster = Cluster(self.api)
-        except Exception as error:
-            print(error)
+        self._cluster = Cluster(self.api)
 
         self.handling_rules: list[EvaluationRule] = [
             EvaluationRule(config, watcher_config)
-            for config in set_else_none(EvaluationRule.config_key, self.definition)
+            for config in set_else_none(
+                EvaluationRule.config_key, self.definition, alt_value=[]
+            )
         ]
+        self.init_metrics_config()
+        self.adaptive_interval: Union[AdaptiveInterval, None] = None
+        self.init_adaptive_interval()
+        self.circuit_breaker: Union[CircuitBreaker, None] = None
+        self.init_circuit_breaker()
+        self.emf_namespace = None
+        self.metrics: dict = {"connectors": {}}
+        self.supports_expand: Union[bool, None] = None
+        self.snapshot: Union[ClusterSnapshot, None] = None
+        self.connectors_to_report: set[str] = set()
+
+    def init_metrics_config(self) -> None:
         self.metrics_config: dict = set_else_none("metrics", self.definition, {})
         # self.emf_config: dict = set_else_none("aws_emf", self.metrics_config, {})
         self.emf_config: EmfConfig = (
@@ -79,15 +311,63 @@ class ConnectCluster:
         self.prometheus_config: dict = set_else_none(
             "prometheus", self.metrics_config, {}
         )
-        self.emf_namespace = None
-        self.metrics: dict = {"connectors": {}}
+
+    def init_adaptive_interval(self) -> None:
+        adaptive_config: dict = set_else_none("adaptive_interval", self.definition, {})
+        if not adaptive_config or not adaptive_config.get("enabled", True):
+            self.adaptive_interval = None
+            return
+        interval = self.base_interval
+        self.adaptive_interval = AdaptiveInterval(
+            interval,
+            get_interval_seconds(
+                set_else_none("fast_interval", adaptive_config, DEFAULT_FAST_INTERVAL)
+            ),
+            get_interval_seconds(
+                set_else_none("max_interval", adaptive_config, interval * 10)
+            ),
+            set_else_none("stable_cycles", adaptive_config, 3),
+            set_else_none("backoff_factor", adaptive_config, 2.0),
+        )
+
+    def init_circuit_breaker(self) -> None:
+        """The circuit breaker is enabled unless circuit_breaker.enabled is false"""
+        breaker_config: dict = set_else_none("circuit_breaker", self.definition, {})
+        if not breaker_config.get("enabled", True):
+            self.circuit_breaker = None
+            return
+        self.circuit_breaker = CircuitBreaker(
+            set_else_none(
+                "failure_threshold", breaker_config, DEFAULT_FAILURE_THRESHOLD
+            ),
+            get_interval_seconds(
+                set_else_none("probe_interval", breaker_config, DEFAULT_PROBE_INTERVAL)
+            ),
+            get_interval_seconds(
+                set_else_none(
+                    "max_probe_interval", breaker_config, DEFAULT_MAX_PROBE_INTERVAL
+                )
+            ),
+            set_else_none("backoff_factor", breaker_config, 2.0),
+            get_duration_timedelta(
+                set_else_none("probe_timeout", breaker_config, DEFAULT_PROBE_TIMEOUT)
+            ).total_seconds(),
+        )
+
+    @staticmethod
+    def definition_name(cluster_config: dict) -> str:
+        """The name of the cluster for the given definition, without creating it"""
+        name = set_else_none("name", cluster_config)
+        if name:
+            return name
+        return f"{cluster_config['hostname']}_{int(set_else_none('port', cluster_config, 8083))}"
 
     @property
     def hostname(self) -> str:
         return self.definition["hostname"]
 
     @property
-    def api(self) -> Api:
+    def api(self) -> PooledApi:
         return self._api
 
     @property
@@ -104,5 +384,251 @@ class ConnectCluster:
     def port(self) -> int:
         return self._port
 
+    @property
+    def interval(self) -> float:
+        """
+        Seconds between two scans of the cluster. With adaptive_interval, adapted after each scan.
+        While the circuit breaker is not closed, the delay until the next probe.
+        """
+        if self.circuit_open:
+            return self.circuit_breaker.probe_delay
+        if self.adaptive_interval is not None:
+            return self.adaptive_interval.interval
+        return self.base_interval
+
+    @property
+    def base_interval(self) -> int:
+        """Seconds between two scans of the cluster, as configured"""
+        return set_else_none("interval", self.definition, DEFAULT_WATCH_INTERVAL)
+
+    @property
+    def circuit_open(self) -> bool:
+        """Whether the circuit breaker is open or half-open: the cluster is not scanned"""
+        return self.circuit_breaker is not None and not self.circuit_breaker.is_closed
+
+    def probe(self) -> None:
+        """Cheap health check of the cluster, with GET /. Raises if the cluster does not respond."""
+        self.api.get_raw(
+            "/",
+            timeout=(
+                self.transport.connect_timeout,
+                self.circuit_breaker.probe_timeout,
+            ),
+        )
+
+    def available(self) -> bool:
+        """
+        Whether the cluster can be scanned, per its circuit breaker. When the probe is due, probes the cluster
+        and closes the breaker if it responds.
+        """
+        if self.circuit_breaker is None or not self.circuit_open:
+            return True
+        if not self.circuit_breaker.allow():
+            LOG.debug(f"{self.name} - circuit open, scan skipped")
+            return False
+        try:
+            self.probe()
+        except Exception as error:
+            self.circuit_breaker.record_failure()
+            LOG.warning(
+                f"{self.name} - probe failed ({error}). Next probe in {self.circuit_breaker.probe_delay:g}s"
+            )
+            return False
+        self.circuit_breaker.record_success()
+        LOG.info(f"{self.name} - probe succeeded, circuit closed")
+        return True
+
+    def record_scan(self, success: bool) -> None:
+        """Records the scan result with the circuit breaker, which opens after consecutive failures"""
+        if self.circuit_breaker is None:
+            return
+        if success:
+            self.circuit_breaker.record_success()
+        elif self.circuit_breaker.record_failure() == OPEN:
+            LOG.error(
+                f"{self.name} - circuit open after {self.circuit_breaker.failures} failed scans."
+                f" Next probe in {self.circuit_breaker.probe_delay:g}s"
+            )
+
+    def adapt_interval(self) -> None:
+        """
+        Adapts the scan interval to the last scan: shortened while connectors are unhealthy or remediations
+        are pending, lengthened while nothing changes.
+        """
+        if self.adaptive_interval is None or self.snapshot is None:
+            return
+        previous_interval: float = self.adaptive_interval.interval
+        unhealthy: bool = (
+            any(_rule.has_unhealthy_connectors() for _rule in self.handling_rules)
+            or get_remediation_scheduler().pending(self.name) > 0
+        )
+        interval = self.adaptive_interval.update(bool(self.snapshot.diff), unhealthy)
+        if interval != previous_interval:
+            LOG.info(
+                f"{self.name} - scan interval changed from {previous_interval:g}s to {interval:g}s"
+            )
+
+    def rule_label(self, rule: EvaluationRule) -> str:
+        """Label of the evaluation rule in the timers: its index in the cluster rules"""
+        for index, handling_rule in enumerate(self.handling_rules):
+            if handling_rule is rule:
+                return str(index)
+        return ""
+
     def emf_high_resolution(self) -> bool:
         return keyisset("high_resolution_metrics", self.emf_config)
+
+    @property
+    def connectors_list_path(self) -> str:
+        if self.supports_expand is False:
+            return "/connectors"
+        return EXPANDED_CONNECTORS_PATH
+
+    def is_expanded(self, payload: Union[dict, list]) -> bool:
+        """
+        Workers which do not support expand ignore the query parameters and return the list of connectors names.
+        The result is kept so that the following scans go straight to /connectors.
+        """
+        expanded: bool = isinstance(payload, dict)
+        if self.supports_expand is None and not expanded:
+            LOG.info(
+                f"{self.name} - expand not supported. Fetching connectors individually"
+            )
+        if self.supports_expand is not False:
+            self.supports_expand = expanded
+        return expanded
+
+    def connector_state(
+        self, connector_name: str, status: dict, info: dict = None
+    ) -> ConnectorState:
+        return ConnectorState.from_status(
+            connector_name, status, info, Connector(self.cluster, connector_name)
+        )
+
+    def states_from_expanded(self, payload: dict) -> dict[str, ConnectorState]:
+        return {
+            connector_name: self.connector_state(
+                connector_name,
+                set_else_none("status", connector_payload),
+                set_else_none("info", connector_payload),
+            )
+            for connector_name, connector_payload in payload.items()
+        }
+
+    def set_snapshot(
+        self,
+        connectors: dict[str, ConnectorState],
+        duration: float,
+        rest_calls: int,
+        rest_latency: float = 0.0,
+    ) -> ClusterSnapshot:
+        """rest_latency is the duration of the connectors list request"""
+        self.snapshot = ClusterSnapshot(
+            connectors,
+            bool(self.supports_expand),
+            duration,
+            rest_calls,
+            previous=self.snapshot,
+            rest_latency=rest_latency,
+        )
+        diff = self.snapshot.diff
+        if diff:
+            LOG.debug(
+                f"{self.name} - connectors added: {len(diff.added)}, removed: {len(diff.removed)},"
+                f" changed: {len(diff.changed)}"
+            )
+        return self.snapshot
+
+    def scan(self) -> ClusterSnapshot:
+        """
+        Retrieves the status & info of all the connectors at once, using the expand query parameters.
+        If the connect cluster does not support expand, falls back to fetching each connector concurrently.
+        """
+        start = perf_counter()
+        try:
+            payload = self.api.get(self.connectors_list_path)
+            rest_latency = perf_counter() - start
+            if self.is_expanded(payload):
+                connectors = self.states_from_expanded(payload)
+                rest_calls: int = 1
+            else:
+                connectors, fetch_calls = self.fetch_connectors_states(payload)
+                rest_calls: int = 1 + fetch_calls
+        except Exception:
+            self.record_scan(False)
+            raise
+        self.record_scan(True)
+        return self.set_snapshot(
+            connectors, perf_counter() - start, rest_calls, rest_latency
+        )
+
+    def fetch_connectors_states(
+        self, connectors_names: list[str]
+    ) -> tuple[dict[str, ConnectorState], int]:
+        """
+        Fetches status & info for each connector on the evaluation pool, bounding the requests in-flight
+        to the pool size. Returns the states, and the number of REST calls made.
+        """
+        evaluation_pool = get_evaluation_pool()
+        futures = [
+            evaluation_pool.submit(self.fetch_connector_state, connector_name)
+            for connector_name in connectors_names
+        ]
+        results = [future.result() for future in futures]
+        return {
+            _state.name: _state for _state, _ in results if _state is not None
+        }, sum(_rest_calls for _, _rest_calls in results)
+
+    def fetch_connector_state(
+        self, connector_name: str
+    ) -> tuple[Union[ConnectorState, None], int]:
+        """The connector state, None if deleted meanwhile, and the number of REST calls made"""
+        rest_calls: int = 0
+        try:
+            rest_calls += 1
+            status = self.api.get(f"{connector_path(connector_name)}/status")
+            rest_calls += 1
+            info = self.api.get(connector_path(connector_name))
+        except GenericNotFound:
+            LOG.debug(f"{self.name} - {connector_name} deleted during scan")
+            return None, rest_calls
+        return self.connector_state(connector_name, status, info), rest_calls
+
+    def route_connectors(
+        self, snapshot: ClusterSnapshot
+    ) -> dict[EvaluationRule, list[ConnectorState]]:
+        """
+        Dispatches the connectors of the snapshot to the evaluation rules which include_regex/exclude_regex
+        match them, and records the metrics of every connector handled by at least one rule.
+        Metrics are only rebuilt for the connectors which changed since the previous scan, and only
+        these and the unhealthy ones are to be reported. The metrics of the connectors which are not in the
+        snapshot anymore, or not handled by any rule, are dropped.
+        The rules are read once, so that the routes are consistent if a reload replaces them meanwhile.
+        """
+        handling_rules: list[EvaluationRule] = self.handling_rules
+        routes: dict[EvaluationRule, list[ConnectorState]] = {
+            rule: [] for rule in handling_rules
+        }
+        connectors_metrics: dict[str, ConnectorMetrics] = self.metrics["connectors"]
+        updated = snapshot.diff.updated
+        for connector_name in connectors_metrics.keys() - snapshot.connectors.keys():
+            del connectors_metrics[connector_name]
+        self.connectors_to_report = set()
+        for connector_name, connector in snapshot.connectors.items():
+            handled: bool = False
+            for rule in handling_rules:
+                if rule.filter_out_connector(connector_name, self):
+                    routes[rule].append(connector)
+                    handled = True
+            if not handled:
+                connectors_metrics.pop(connector_name, None)
+                continue
+            if connector_name in updated or connector_name not in connectors_metrics:
+                connectors_metrics[connector_name] = get_connector_metrics(connector)
+                self.connectors_to_report.add(connector_name)
+            elif not connector.is_healthy():
+                self.connectors_to_report.add(connector_name)
+        self.metrics["connectors_metrics_bytes"] = getsizeof(
+            connectors_metrics
+        ) + CONNECTOR_METRICS_SIZE * len(connectors_metrics)
+        return routes
@@ -12,22 +12,29 @@ from copy import deepcopy
 from datetime import datetime as dt
 from json import JSONDecodeError, loads
 from os import path
-from typing import Union
+from threading import Lock
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.aws_sns import SnsChannel
 
 import yaml
-from aws_embedded_metrics.storage_resolution import StorageResolution
 from compose_x_common.compose_x_common import get_duration, keyisset, set_else_none
 from importlib_resources import files as pkg_files
-from jsonschema import RefResolver, validate
+from jsonschema import RefResolver
+from jsonschema.exceptions import best_match
+from jsonschema.protocols import Validator
+from jsonschema.validators import validator_for
 
 try:
     from yaml import Loader
 except ImportError:
     from yaml import CLoader as Loader
 
-from kafka_connect_watcher.aws_sns import SnsChannel
 from kafka_connect_watcher.logger import LOG
 
+DEFAULT_WATCH_INTERVAL: int = 60
+
 
 class Config:
     """
@@ -53,6 +60,7 @@ class Config:
                 configuration = loads(configuration)
             except JSONDecodeError:
                 configuration = yaml.load(configuration, Loader=Loader)
+        self.config_file_path: Union[str, None] = config_file_path
         self._config: dict = {}
         self.config = configuration
         self._original_config = deepcopy(configuration)
@@ -70,12 +78,22 @@ class Config:
             else None
         )
         self.scan_intervals = self.set_scan_intervals()
-        self.notification_channels: dict = {}
+        self.engine: str = set_else_none("engine", self.config, "threads")
+        self.prometheus_config: Union[dict, None] = set_else_none(
+            "prometheus", self.config
+        )
+        self.notifications_config: dict = set_else_none(
+            "notifications", self.config, {}
+        )
+        self.leases_config: Union[dict, None] = set_else_none("leases", self.config)
+        self.notification_channels: dict[str, SnsChannel] = {}
         if keyisset("notification_channels", self.config):
             for channel_name, channel_definition in self.config[
                 "notification_channels"
             ].items():
                 if channel_name == "sns":
+                    from kafka_connect_watcher.aws_sns import SnsChannel
+
                     for (
                         sns_channel_name,
                         sns_channel_definition,
@@ -95,19 +113,15 @@ class Config:
 
     @config.setter
     def config(self, config: dict) -> None:
-        source = pkg_files("kafka_connect_watcher").joinpath("watcher-config.spec.json")
-        resolver = RefResolver(f"file://{path.abspath(path.dirname(source))}/", None)
-        validate(
-            config,
-            loads(source.read_text()),
-            resolver=resolver,
+        error = best_match(get_config_validator().iter_errors(config))
+        if error is not None:
+            raise error
+        default_interval = set_else_none(
+            "watch_interval", config, DEFAULT_WATCH_INTERVAL
         )
         for cluster in config["clusters"]:
-            interval_string = set_else_none("interval", cluster, "15s")
-            interval_delta = get_duration(interval_string)
-            now = dt.now()
-            cluster["interval"] = max(
-                2, int(((now + interval_delta) - now).total_seconds())
+            cluster["interval"] = get_interval_seconds(
+                set_else_none("interval", cluster, default_interval)
             )
         self._config = config
 
@@ -116,17 +130,48 @@ class Config:
         return self._original_config
 
     def set_scan_intervals(self) -> int:
-        intervals_value = set_else_none("watch_interval", self.config, 60)
-        if isinstance(intervals_value, str):
-            interval_delta = get_duration(intervals_value)
-            now = dt.now()
-            return max(2, int(((now + interval_delta) - now).total_seconds()))
-        else:
-            return max([2, intervals_value])
+        return get_interval_seconds(
+            set_else_none("watch_interval", self.config, DEFAULT_WATCH_INTERVAL)
+        )
+
+
+_CONFIG_VALIDATOR: Union[Validator, None] = None
+_CONFIG_VALIDATOR_LOCK = Lock()
+
+
+def get_config_validator() -> Validator:
+    """The validator of the configuration JSON schema, built once"""
+    global _CONFIG_VALIDATOR
+    with _CONFIG_VALIDATOR_LOCK:
+        if _CONFIG_VALIDATOR is None:
+            source = pkg_files("kafka_connect_watcher").joinpath(
+                "watcher-config.spec.json"
+            )
+            schema: dict = loads(source.read_text())
+            validator_class = validator_for(schema)
+            validator_class.check_schema(schema)
+            _CONFIG_VALIDATOR = validator_class(
+                schema,
+                resolver=RefResolver(
+                    f"file://{path.abspath(path.dirname(source))}/", schema
+                ),
+            )
+        return _CONFIG_VALIDATOR
+
+
+def get_interval_seconds(interval_value: Union[str, int]) -> int:
+    """Converts a duration string (i.e. 15s, 1m) or a number of seconds to seconds. Minimum 2 seconds."""
+    if isinstance(interval_value, str):
+        interval_delta = get_duration(interval_value)
+        now = dt.now()
+        return max(2, int(((now + interval_delta) - now).total_seconds()))
+    return max([2, int(interval_value)])
 
 
 class EmfConfig:
     def __init__(self, config: dict):
+        from aws_embedded_metrics.storage_resolution import StorageResolution
+
         self.enabled: bool = keyisset("enabled", config)
         self.namespace = config["namespace"]
         self.emf_resolution = (
@@ -135,3 +180,20 @@ class EmfConfig:
             else StorageResolution.STANDARD
         )
         self.dimensions = set_else_none("dimensions", config, {})
+        self._dimensions_sets: dict[tuple, dict] = {}
+
+    def dimensions_set(self, **dimensions: str) -> dict:
+        """
+        The configured dimensions with the given ones. Computed once for each set of values, and shared:
+        the returned dict must not be modified.
+        """
+        key = tuple(dimensions.items())
+        dimensions_set = self._dimensions_sets.get(key)
+        if dimensions_set is None:
+            dimensions_set = dict(self.dimensions)
+            dimensions_set.update(dimensions)
+            self._dimensions_sets[key] = dimensions_set
+        return dimensions_set
+
+    def discard_dimensions_set(self, **dimensions: str) -> None:
+        self._dimensions_sets.pop(tuple(dimensions.items()), None)
@@ -6,93 +6,126 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from multiprocessing import Queue
+    from kafka_connect_watcher.cluster import ConnectCluster, ConnectorState
+    from kafka_connect_watcher.error_rules import EvaluationRule
 
-from multiprocessing import Queue
+from collections.abc import Iterator, Mapping
+from sys import getsizeof
 
 from kafka_connect_api.errors import GenericNotFound
 
 from kafka_connect_watcher.logger import LOG
 
+CONNECTOR_RUNNING: str = "running"
+CONNECTOR_PAUSED: str = "paused"
+CONNECTOR_UNASSIGNED: str = "unassigned"
+CONNECTOR_TO_FIX: str = "failed"
 
-def evaluate_connector_status(queue: Queue) -> None:
-    while True:
-        if queue.empty():
-            break
-        else:
-            (
-                evaluation_rule,
-                connect,
-                connector,
-                running_connectors,
-                paused_connectors,
-                unassigned_connectors,
-                connectors_to_fix,
-            ) = queue.get()
-        if connect is None:
-            break
-
-        connector_metrics: dict = {
-            "tasks": len(connector.tasks),
-            "running": len(
-                [_task for _task in connector.tasks if _task.state == "RUNNING"]
-            ),
-            "failed": len(
-                [_task for _task in connector.tasks if _task.state == "FAILED"]
-            ),
-            "unassigned": len(
-                [_task for _task in connector.tasks if _task.state == "UNASSIGNED"]
-            ),
-        }
-        try:
-            if connector.state in ["RUNNING"]:
-                if (
-                    all([task.is_running() for task in connector.tasks])
-                    or (
-                        evaluation_rule.ignore_unassigned
-                        and all(
-                            [
-                                task.state in ["RUNNING", "UNASSIGNED"]
-                                for task in connector.tasks
-                            ]
-                        )
-                    )
-                    or (
-                        evaluation_rule.ignore_paused
-                        and all(
-                            [
-                                task.state in ["RUNNING", "PAUSED"]
-                                for task in connector.tasks
-                            ]
-                        )
-                    )
-                ):
-                    running_connectors += 1
-                else:
-                    connectors_to_fix.append(connector)
-            elif connector.state == "PAUSED":
-                paused_connectors += 1
-                if not evaluation_rule.ignore_paused:
-                    connector.cycle_connector()
-            elif connector.state == "UNASSIGNED":
-                unassigned_connectors += 1
-                if not evaluation_rule.ignore_unassigned:
-                    connector.cycle_connector()
-            else:
-                connectors_to_fix.append(connector)
-        except GenericNotFound as error:
-            LOG.debug(
-                "Connector {} not found in connect cluster. {}".format(
-                    connector.name,
-                    error,
+
+class ConnectorMetrics(Mapping):
+    """
+    Tasks count per state for a connector. A slotted record, about a third of the size of the equivalent dict,
+    which reads like that dict (metrics["failed"], items()) for the metrics publishers.
+    """
+
+    __slots__ = ("tasks", "running", "failed", "unassigned")
+
+    def __init__(
+        self, tasks: int = 0, running: int = 0, failed: int = 0, unassigned: int = 0
+    ):
+        self.tasks = tasks
+        self.running = running
+        self.failed = failed
+        self.unassigned = unassigned
+
+    def __getitem__(self, key: str) -> int:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return f"ConnectorMetrics({', '.join(f'{_key}={self[_key]}' for _key in self)})"
+
+
+CONNECTOR_METRICS_SIZE: int = getsizeof(ConnectorMetrics())
+
+
+def get_connector_metrics(connector: ConnectorState) -> ConnectorMetrics:
+    """Tasks count per state for the connector"""
+    tasks_states: list[str] = [_task.state for _task in connector.tasks]
+    return ConnectorMetrics(
+        len(tasks_states),
+        tasks_states.count("RUNNING"),
+        tasks_states.count("FAILED"),
+        tasks_states.count("UNASSIGNED"),
+    )
+
+
+def evaluate_connector_status(
+    evaluation_rule: EvaluationRule, connector: ConnectorState
+) -> str:
+    """
+    Evaluates the connector state from the cluster snapshot. No REST calls are made.
+    When the connector status is RUNNING, checks all the tasks too, ignoring UNASSIGNED or PAUSED
+    tasks if the rule says so.
+    """
+    if connector.state == "RUNNING":
+        if (
+            all([task.is_running() for task in connector.tasks])
+            or (
+                evaluation_rule.ignore_unassigned
+                and all(
+                    [
+                        task.state in ["RUNNING", "UNASSIGNED"]
+                        for task in connector.tasks
+                    ]
                 )
             )
-            LOG.error(
-                "{} - {}: failed to retrieve status".format(
-                    connect.name, connector.name
+            or (
+                evaluation_rule.ignore_paused
+                and all(
+                    [task.state in ["RUNNING", "PAUSED"] for task in connector.tasks]
                 )
             )
-            unassigned_connectors += 1
-            connectors_to_fix.append(connector)
-        connect.metrics["connectors"].update({connector.name: connector_metrics})
-        queue.task_done()
+        ):
+            return CONNECTOR_RUNNING
+        return CONNECTOR_TO_FIX
+    elif connector.state == "PAUSED":
+        return CONNECTOR_PAUSED
+    elif connector.state == "UNASSIGNED":
+        return CONNECTOR_UNASSIGNED
+    return CONNECTOR_TO_FIX
+
+
+def needs_cycle(evaluation_rule: EvaluationRule, connector_status: str) -> bool:
+    """PAUSED and UNASSIGNED connectors get cycled, unless the rule ignores them"""
+    return (
+        connector_status == CONNECTOR_PAUSED and not evaluation_rule.ignore_paused
+    ) or (
+        connector_status == CONNECTOR_UNASSIGNED
+        and not evaluation_rule.ignore_unassigned
+    )
+
+
+def cycle_connector(connect: ConnectCluster, connector: ConnectorState) -> bool:
+    """Cycles the connector. Returns False if the connector could not be found anymore."""
+    try:
+        connector.handle.cycle_connector()
+        return True
+    except GenericNotFound as error:
+        LOG.debug(
+            "Connector {} not found in connect cluster. {}".format(
+                connector.name,
+                error,
+            )
+        )
+        LOG.error(
+            "{} - {}: failed to retrieve status".format(connect.name, connector.name)
+        )
+        return False
@@ -7,18 +7,22 @@ Error handling rules
 
 from __future__ import annotations
 
-import time
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from kafka_connect_api.kafka_connect_api import Connector
-    from kafka_connect_watcher.cluster import ConnectCluster
+    from kafka_connect_watcher.cluster import (
+        ClusterSnapshot,
+        ConnectCluster,
+        ConnectorState,
+        SnapshotDiff,
+    )
     from kafka_connect_watcher.config import Config
 
-import re
+from collections import Counter
+from concurrent.futures import Future
 from copy import deepcopy
-from queue import Queue
-from threading import Thread
+from functools import lru_cache
 
 from compose_x_common.compose_x_common import (
     get_duration_timedelta,
@@ -26,10 +30,22 @@ from compose_x_common.compose_x_common import (
     set_else_none,
 )
 
-from kafka_connect_watcher.connectors_eval import evaluate_connector_status
+from kafka_connect_watcher.connectors_eval import (
+    CONNECTOR_PAUSED,
+    CONNECTOR_RUNNING,
+    CONNECTOR_TO_FIX,
+    CONNECTOR_UNASSIGNED,
+    cycle_connector,
+    evaluate_connector_status,
+    needs_cycle,
+)
+from kafka_connect_watcher.leases import get_lease_manager
 from kafka_connect_watcher.logger import LOG
-from kafka_connect_watcher.threads_settings import NUM_THREADS
-from kafka_connect_watcher.tools import import_regexes
+from kafka_connect_watcher.remediation import Remediation, get_remediation_scheduler
+from kafka_connect_watcher.tools import RegexMatcher, import_regexes
+from kafka_connect_watcher.workers import get_evaluation_pool
+
+CONNECTORS_FILTER_CACHE_SIZE: int = 8192
 
 
 class EvaluationRule:
@@ -48,18 +64,21 @@ class EvaluationRule:
         self._original_definition = deepcopy(rule_definition)
         if not keyisset("include_regex", self.definition):
             LOG.debug("NO INCLUDE REGEX. CONSIDERING ALL CONNECTORS")
-            self.include_regexes: list[re.Pattern] = [re.compile(r"(.*)")]
+            self.include_regexes: RegexMatcher = import_regexes([r"(.*)"])
         else:
-            self.include_regexes: list[re.Pattern] = import_regexes(
+            self.include_regexes: RegexMatcher = import_regexes(
                 self.definition["include_regex"]
             )
         if not keyisset("exclude_regex", self.definition):
             LOG.debug("NO exclude REGEX.")
-            self.exclude_regexes: list[re.Pattern] = []
+            self.exclude_regexes: RegexMatcher = import_regexes([])
         else:
-            self.exclude_regexes: list[re.Pattern] = import_regexes(
+            self.exclude_regexes: RegexMatcher = import_regexes(
                 self.definition["exclude_regex"]
             )
+        self._is_handled = lru_cache(maxsize=CONNECTORS_FILTER_CACHE_SIZE)(
+            self._match_connector
+        )
 
         self.ignore_paused = keyisset("ignore_paused", self.definition)
         self.ignore_unassigned = keyisset("ignore_unassigned", self.definition)
@@ -69,82 +88,170 @@ class EvaluationRule:
                 "auto_correct_actions", self.original_config, alt_value=[]
             )
         ]
+        self._statuses: dict[str, str] = {}
 
     @property
     def original_config(self) -> dict:
         return self._original_definition
 
-    def filter_out_connector(self, connector_name: str, cluster: ConnectCluster):
-        if self.exclude_regexes:
-            for regex in self.exclude_regexes:
-                if regex.match(connector_name):
-                    LOG.info(
-                        f"{cluster.name} - Connector {connector_name} ignored by exclude_regex"
-                    )
-                    return False
-        for regex in self.include_regexes:
-            LOG.debug(regex.pattern)
-            LOG.debug(regex.match(connector_name))
-            if regex.match(connector_name):
-                return True
-
-    def execute(self, connect: ConnectCluster) -> None:
+    def filter_out_connector(
+        self, connector_name: str, cluster: ConnectCluster
+    ) -> bool:
+        """Whether the connector is handled by the rule. The decision is cached per connector name."""
+        return self._is_handled(connector_name, cluster.name)
+
+    def _match_connector(self, connector_name: str, cluster_name: str) -> bool:
+        if self.exclude_regexes.match(connector_name):
+            LOG.info(
+                f"{cluster_name} - Connector {connector_name} ignored by exclude_regex"
+            )
+            return False
+        return self.include_regexes.match(connector_name)
+
+    def execute(
+        self,
+        connect: ConnectCluster,
+        snapshot: ClusterSnapshot = None,
+        connectors_to_handle: list[ConnectorState] = None,
+    ) -> None:
         """
         Scans the connectors, matches the ones invalid and not healthy.
         When the connector status is RUNNING, we check all the tasks too to be sure.
         When paused, if we ignore paused connectors, skip
+        When the snapshot and connectors to handle are provided (shared cluster scan), they are used as-is.
         """
-        connectors_total: int = len(connect.cluster.connectors)
-        connectors_to_handle: list[Connector] = []
-        for connector_name in list(connect.cluster.connectors.keys()):
-            if self.filter_out_connector(connector_name, connect):
-                connectors_to_handle.append(connect.cluster.connectors[connector_name])
-        connectors_to_fix: list[Connector] = []
-
-        connectors_count: int = len(connectors_to_handle)
-        ignored_connectors: int = connectors_total - connectors_count
-        paused_connectors: int = 0
-        unassigned_connectors: int = 0
-        running_connectors: int = 0
-
-        connectors_processing_queue = Queue()
-        for connector in connectors_to_handle:
-            connectors_processing_queue.put(
-                [
-                    self,
-                    connect,
-                    connector,
-                    running_connectors,
-                    paused_connectors,
-                    unassigned_connectors,
-                    connectors_to_fix,
-                ],
-                False,
+        if snapshot is None:
+            snapshot = connect.scan()
+        connectors_total: int = len(snapshot.connectors)
+        if connectors_to_handle is None:
+            connectors_to_handle = [
+                connector
+                for connector_name, connector in snapshot.connectors.items()
+                if self.filter_out_connector(connector_name, connect)
+            ]
+        evaluation_pool = get_evaluation_pool()
+        rule_label = connect.rule_label(self)
+        with connect.timers.time("evaluate", rule_label):
+            connectors_statuses, connectors_to_fix, connectors_to_cycle = self.evaluate(
+                connectors_to_handle, snapshot.diff
+            )
+        with connect.timers.time("remediate", rule_label):
+            remediates = self.remediates(
+                connect, connectors_to_fix, connectors_to_cycle
+            )
+            if not remediates:
+                connectors_to_cycle = []
+            cycled_connectors: list[tuple[ConnectorState, Future]] = [
+                (connector, evaluation_pool.submit(cycle_connector, connect, connector))
+                for connector in connectors_to_cycle
+            ]
+            for connector, cycled in cycled_connectors:
+                try:
+                    connector_cycled = cycled.result()
+                except Exception as error:
+                    LOG.exception(error)
+                    LOG.error(f"{connect.name} - {connector.name}: failed to cycle")
+                    connector_cycled = False
+                if not connector_cycled:
+                    connectors_to_fix.append(connector)
+            self.update_metrics(
+                connect,
+                connectors_total,
+                len(connectors_to_handle),
+                connectors_statuses,
+                connectors_to_fix,
             )
-        _processes: list[Thread] = []
-        for _ in range(NUM_THREADS):
-            __process = Thread(
-                target=evaluate_connector_status,
-                daemon=True,
-                args=(connectors_processing_queue,),
+            if not remediates or not self.auto_correct_rules:
+                return
+            for connector in connectors_to_fix:
+                self.auto_correct(connect, connector)
+
+    def evaluate(
+        self, connectors_to_handle: list[ConnectorState], diff: SnapshotDiff = None
+    ) -> tuple[Counter, list[ConnectorState], list[ConnectorState]]:
+        """
+        Evaluates the connectors from the snapshot, without any REST call.
+        With the diff from the previous snapshot, the status of the connectors which did not change is
+        re-used from the previous evaluation.
+        Returns the count of connectors per status, the connectors to fix and the connectors to cycle.
+        """
+        connectors_statuses: Counter = Counter()
+        connectors_to_fix: list[ConnectorState] = []
+        connectors_to_cycle: list[ConnectorState] = []
+        updated = diff.updated if diff is not None else None
+        evaluated: dict[str, str] = {}
+        for connector in connectors_to_handle:
+            connector_status = (
+                self._statuses.get(connector.name)
+                if updated is not None and connector.name not in updated
+                else None
             )
-            _processes.append(__process)
-            __process.start()
-        for _process in _processes:
-            _process.join()
+            if connector_status is None:
+                connector_status = evaluate_connector_status(self, connector)
+            evaluated[connector.name] = connector_status
+            connectors_statuses[connector_status] += 1
+            if connector_status == CONNECTOR_TO_FIX:
+                connectors_to_fix.append(connector)
+            elif needs_cycle(self, connector_status):
+                connectors_to_cycle.append(connector)
+        self._statuses = evaluated
+        return connectors_statuses, connectors_to_fix, connectors_to_cycle
+
+    def has_unhealthy_connectors(self) -> bool:
+        """Whether connectors were to fix or to cycle at the last evaluation"""
+        return any(
+            _status == CONNECTOR_TO_FIX or needs_cycle(self, _status)
+            for _status in self._statuses.values()
+        )
+
+    @staticmethod
+    def update_metrics(
+        connect: ConnectCluster,
+        connectors_total: int,
+        connectors_count: int,
+        connectors_statuses: Counter,
+        connectors_to_fix: list[ConnectorState],
+    ) -> None:
         connect.metrics.update(
             {
                 "total": connectors_total,
-                "ignored": ignored_connectors,
+                "ignored": connectors_total - connectors_count,
                 "count": connectors_count,
-                "running": running_connectors,
-                "unassigned": unassigned_connectors,
+                "running": connectors_statuses[CONNECTOR_RUNNING],
+                "paused": connectors_statuses[CONNECTOR_PAUSED],
+                "unassigned": connectors_statuses[CONNECTOR_UNASSIGNED],
                 "failed": len(connectors_to_fix),
             }
         )
-        for connector in connectors_to_fix:
-            for rule in self.auto_correct_rules:
-                rule.process(connect, connector)
+
+    @staticmethod
+    def remediates(
+        connect: ConnectCluster,
+        connectors_to_fix: list[ConnectorState],
+        connectors_to_cycle: list[ConnectorState],
+    ) -> bool:
+        """
+        Whether the connectors to fix or cycle are remediated by this watcher, which must hold the cluster lease.
+        The other watchers are on standby for the cluster.
+        """
+        if not connectors_to_fix and not connectors_to_cycle:
+            return True
+        if get_lease_manager().owns(connect):
+            return True
+        LOG.debug(
+            f"{connect.name} - standby, the cluster lease is held by another watcher. "
+            f"Not remediating {len(connectors_to_fix) + len(connectors_to_cycle)} connectors"
+        )
+        return False
+
+    def auto_correct(self, connect: ConnectCluster, connector: ConnectorState) -> bool:
+        """
+        Schedules the auto-correct actions, in order, for the connector. Does not wait for them.
+        Returns False if a remediation is already in progress for the connector.
+        """
+        return get_remediation_scheduler().submit(
+            Remediation(connect, connector, self.auto_correct_rules)
+        )
 
 
 class AutoCorrectRule:
@@ -178,51 +285,43 @@ class AutoCorrectRule:
     def original_config(self) -> dict:
         return self._original_config
 
-    def process(self, cluster: ConnectCluster, connector: Connector):
-        initial_delay = max(
-            5, int(get_duration_timedelta(self.wait_for_status).total_seconds())
-        )
-        use_backoff = "max_backoff" in self.config and "max_attempts" in self.config
-
-        if use_backoff:
-            max_backoff = max(1, self.config["max_backoff"])
-            max_attempts = max(1, self.config["max_attempts"])
-            backoff = initial_delay
-            attempt = 0
-
-            LOG.info(
-                f"Backoff enabled: max_backoff={max_backoff}, max_attempts={max_attempts}"
-            )
-
-            while attempt < max_attempts:
-                status = connector.status
-                connector_state = status.get("connector", {}).get("state", "UNKNOWN")
-                task_states = [
-                    task.get("state", "UNKNOWN") for task in status.get("tasks", [])
-                ]
+    @property
+    def initial_delay(self) -> int:
+        """Delay before checking on the connector status after the action, also the first backoff delay"""
+        return max(5, int(get_duration_timedelta(self.wait_for_status).total_seconds()))
 
-                all_tasks_running = all(state == "RUNNING" for state in task_states)
+    @property
+    def use_backoff(self) -> bool:
+        return "max_backoff" in self.config and "max_attempts" in self.config
 
-                if connector_state == "RUNNING" and all_tasks_running:
-                    LOG.info(
-                        f"{connector.name} and all its tasks have recovered. Skipping corrective action."
-                    )
-                    return
+    @property
+    def max_backoff(self) -> int:
+        return max(1, self.config["max_backoff"])
 
-                LOG.warning(
-                    f"{connector.name} not fully recovered (connector: {connector_state}, tasks: {task_states}). "
-                    f"Attempt {attempt + 1}/{max_attempts}. Waiting {backoff}s before re-checking..."
-                )
-                time.sleep(backoff)
-                backoff = min(max_backoff, backoff * 2)
-                attempt += 1
-        else:
-            LOG.info(
-                f"No backoff configured for connector {connector.name}. "
-                f"Applying corrective action '{self.action}' immediately."
-            )
+    @property
+    def max_attempts(self) -> int:
+        return max(1, self.config["max_attempts"])
+
+    @staticmethod
+    def has_recovered(connector: Connector) -> tuple[bool, str, list[str]]:
+        """Retrieves the live connector status. Recovered when the connector and all its tasks are RUNNING"""
+        status = connector.status
+        current_state = status.get("connector", {}).get("state", "UNKNOWN")
+        task_states = [task.get("state", "UNKNOWN") for task in status.get("tasks", [])]
+        all_tasks_running = all(state == "RUNNING" for state in task_states)
+        return (
+            current_state == "RUNNING" and all_tasks_running,
+            current_state,
+            task_states,
+        )
 
-        # Apply the corrective action after backoff loop or immediately if no backoff
+    def apply(
+        self,
+        cluster: ConnectCluster,
+        connector: Connector,
+        connector_state: ConnectorState = None,
+    ) -> bool:
+        """Applies the corrective action and notifies the targets. Returns False if the action failed."""
         try:
             if self.action == "restart":
                 connector.restart()
@@ -236,11 +335,12 @@ class AutoCorrectRule:
             )
 
             if self.notify_targets:
-                for channel in self.notification_channels:
-                    channel.send_error_notification(cluster, connector)
-
-            time.sleep(initial_delay)
-            LOG.info(f"Post-action status for {connector.name}: {connector.status}")
+                with cluster.timers.time("notify"):
+                    for channel in self.notification_channels:
+                        channel.send_error_notification(
+                            cluster, connector, connector_state
+                        )
+            return True
 
         except Exception as error:
             LOG.exception(
@@ -263,3 +363,4 @@ class AutoCorrectRule:
                     connector.cluster.set_logger_log_level(
                         connector_class, log_level_to_set
                     )
+            return False
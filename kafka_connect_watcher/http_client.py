@@ -0,0 +1,203 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Pooled, keep-alive HTTP transport of a connect cluster.
+
+Each cluster gets its own requests Session, with a connection pool of up to max_pool_size connections reused
+across the requests, instead of a TCP (and TLS) handshake per request. The requests in-flight against the cluster
+are capped by max_in_flight_requests: the evaluation threads wait for a slot rather than bursting against
+the connect REST worker threads.
+The connection pools count, for each request sent, whether it went over a kept-alive connection or had to
+connect first, including the retries and the connections dropped by the server and opened again.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Union
+
+if TYPE_CHECKING:
+    from requests import Response
+
+    from kafka_connect_watcher.cluster import ConnectCluster
+
+from functools import partial
+from threading import BoundedSemaphore, Lock
+
+from compose_x_common.compose_x_common import get_duration_timedelta, set_else_none
+from kafka_connect_api.errors import evaluate_api_return
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from kafka_connect_watcher.instrumentation import InstrumentedApi
+
+DEFAULT_MAX_IN_FLIGHT_REQUESTS: int = 8
+DEFAULT_REQUEST_TIMEOUT: str = "30s"
+DEFAULT_CONNECT_TIMEOUT: str = "5s"
+
+
+class ConnectionStats:
+    """Requests sent over a kept-alive connection (reused), or which connected first (opened)"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.opened: int = 0
+        self.reused: int = 0
+
+    def count(self, reused: bool) -> None:
+        with self._lock:
+            if reused:
+                self.reused += 1
+            else:
+                self.opened += 1
+
+
+class ConnectionCountingPool:
+    """Connection pool mixin, counting the connections opened and reused by the requests sent successfully"""
+
+    def __init__(
+        self, *args, connection_stats: Union[ConnectionStats, None] = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.connection_stats = connection_stats
+
+    def _make_request(self, conn, *args, **kwargs):
+        reused: bool = getattr(conn, "sock", None) is not None
+        response = super()._make_request(conn, *args, **kwargs)
+        if self.connection_stats is not None:
+            self.connection_stats.count(reused)
+        return response
+
+
+class CountingHTTPConnectionPool(ConnectionCountingPool, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(ConnectionCountingPool, HTTPSConnectionPool):
+    pass
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter which pools count the connections opened and reused"""
+
+    def __init__(self, *args, **kwargs):
+        self.connection_stats = ConnectionStats()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": partial(
+                CountingHTTPConnectionPool, connection_stats=self.connection_stats
+            ),
+            "https": partial(
+                CountingHTTPSConnectionPool, connection_stats=self.connection_stats
+            ),
+        }
+
+
+class HttpTransport:
+    """Session with a bounded connection pool, and a cap on the requests in-flight"""
+
+    def __init__(self, http_config: dict = None):
+        http_config = http_config or {}
+        self.max_in_flight_requests: int = set_else_none(
+            "max_in_flight_requests", http_config, DEFAULT_MAX_IN_FLIGHT_REQUESTS
+        )
+        self.max_pool_size: int = set_else_none(
+            "max_pool_size", http_config, self.max_in_flight_requests
+        )
+        self.request_timeout: float = get_duration_timedelta(
+            set_else_none("request_timeout", http_config, DEFAULT_REQUEST_TIMEOUT)
+        ).total_seconds()
+        self.connect_timeout: float = get_duration_timedelta(
+            set_else_none("connect_timeout", http_config, DEFAULT_CONNECT_TIMEOUT)
+        ).total_seconds()
+        self.adapter = CountingHTTPAdapter(
+            pool_connections=1, pool_maxsize=self.max_pool_size, pool_block=True
+        )
+        self.session = Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self._in_flight = BoundedSemaphore(self.max_in_flight_requests)
+        self._lock = Lock()
+        self._metrics: dict = {"http_requests": 0, "http_in_flight_waits": 0}
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        if not self._in_flight.acquire(blocking=False):
+            with self._lock:
+                self._metrics["http_in_flight_waits"] += 1
+            self._in_flight.acquire()
+        try:
+            with self._lock:
+                self._metrics["http_requests"] += 1
+            kwargs.setdefault("timeout", (self.connect_timeout, self.request_timeout))
+            return self.session.request(method, url, **kwargs)
+        finally:
+            self._in_flight.release()
+
+    @property
+    def metrics(self) -> dict:
+        """Requests sent, and connections opened & reused to send them"""
+        with self._lock:
+            metrics: dict = dict(self._metrics)
+        metrics.update(
+            {
+                "http_connections_opened": self.adapter.connection_stats.opened,
+                "http_connections_reused": self.adapter.connection_stats.reused,
+            }
+        )
+        return metrics
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class PooledApi(InstrumentedApi):
+    """InstrumentedApi sending the requests with the pooled transport of the cluster"""
+
+    def __init__(self, *args, transport: HttpTransport = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transport: HttpTransport = transport or HttpTransport()
+
+    @evaluate_api_return
+    def send(self, query_path: str, http_method: str, **kwargs) -> Response:
+        if not query_path.startswith(r"/"):
+            query_path = f"/{query_path}"
+        return self.transport.request(
+            http_method,
+            f"{self.url}{query_path}",
+            auth=self.basic_auth,
+            headers=self.headers,
+            verify=self.verify_ssl,
+            **kwargs,
+        )
+
+    def get_raw(self, query_path, **kwargs) -> Response:
+        return self._timed("GET", self.send, query_path, http_method="GET", **kwargs)
+
+    def post_raw(self, query_path, **kwargs) -> Response:
+        return self._timed("POST", self.send, query_path, http_method="POST", **kwargs)
+
+    def put_raw(self, query_path, **kwargs) -> Response:
+        return self._timed("PUT", self.send, query_path, http_method="PUT", **kwargs)
+
+    def delete_raw(self, query_path, **kwargs) -> Response:
+        return self._timed(
+            "DELETE", self.send, query_path, http_method="DELETE", **kwargs
+        )
+
+
+def transport_metrics(clusters: Iterable[ConnectCluster]) -> dict:
+    """Totals of the transports metrics of all the clusters, for the watcher metrics"""
+    metrics: dict = {
+        "http_requests": 0,
+        "http_in_flight_waits": 0,
+        "http_connections_opened": 0,
+        "http_connections_reused": 0,
+    }
+    for cluster in clusters:
+        for metric_name, value in cluster.transport.metrics.items():
+            metrics[metric_name] += value
+    return metrics
@@ -0,0 +1,366 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Instrumentation of the scan cycles.
+
+- Per-phase timers (fetch, filter, evaluate, remediate, notify, publish), kept per cluster and per evaluation rule.
+- Calls, errors and latency histogram of the REST requests, per cluster and endpoint, recorded by InstrumentedApi.
+- Optional sampling profiler, enabled with the KAFKA_CONNECT_WATCHER_PROFILE_DIR environment variable, writing the
+  sampled stacks in the folded format (flamegraph.pl, speedscope) to that directory every
+  KAFKA_CONNECT_WATCHER_PROFILE_INTERVAL seconds.
+
+The totals are added to the watcher metrics, and the details published with the clusters Prometheus metrics.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Union
+
+if TYPE_CHECKING:
+    from requests import Response
+
+    from kafka_connect_watcher.cluster import ConnectCluster
+
+import os
+import re
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+from time import perf_counter, time
+from urllib.parse import parse_qsl
+
+from kafka_connect_api.kafka_connect_api import Api
+
+from kafka_connect_watcher.logger import LOG
+
+PHASES: tuple[str, ...] = (
+    "fetch",
+    "filter",
+    "evaluate",
+    "remediate",
+    "notify",
+    "publish",
+)
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+PROFILE_DIR_ENV: str = "KAFKA_CONNECT_WATCHER_PROFILE_DIR"
+PROFILE_INTERVAL_ENV: str = "KAFKA_CONNECT_WATCHER_PROFILE_INTERVAL"
+PROFILE_RATE_ENV: str = "KAFKA_CONNECT_WATCHER_PROFILE_RATE"
+DEFAULT_PROFILE_INTERVAL: float = 60.0
+DEFAULT_PROFILE_RATE: float = 50.0
+PROFILE_MAX_DEPTH: int = 64
+
+_ENDPOINT_PATTERNS: tuple[tuple[re.Pattern, str], ...] = (
+    (
+        re.compile(r"^/connectors/[^/]+/tasks/\d+"),
+        "/connectors/{connector}/tasks/{task}",
+    ),
+    (re.compile(r"^/connectors/[^/]+"), "/connectors/{connector}"),
+    (re.compile(r"^/admin/loggers/.+"), "/admin/loggers/{logger}"),
+)
+
+
+def endpoint_template(query_path: str) -> str:
+    """
+    The path with the connectors names, tasks ids & loggers replaced. Of the query string, only the expand
+    parameters are kept, sorted: the expanded connectors list is a request of its own.
+    """
+    query_path, _, query_string = query_path.partition("?")
+    query_path = "/" + query_path.lstrip("/")
+    expand: str = ",".join(
+        sorted({_value for _key, _value in parse_qsl(query_string) if _key == "expand"})
+    )
+    for pattern, template in _ENDPOINT_PATTERNS:
+        match = pattern.match(query_path)
+        if match:
+            query_path = template + query_path[match.end() :]
+            break
+    return f"{query_path}?expand={expand}" if expand else query_path
+
+
+def metric_slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", value.lower()).strip("_")
+
+
+class Histogram:
+    """Cumulative latency histogram, with the Prometheus buckets semantics (le)"""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts: list[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self) -> list[tuple[str, int]]:
+        """(le, count) of each bucket, +Inf last"""
+        buckets: list[tuple[str, int]] = []
+        total: int = 0
+        for bound, bucket_count in zip(
+            [str(_bound) for _bound in LATENCY_BUCKETS] + ["+Inf"], self.counts
+        ):
+            total += bucket_count
+            buckets.append((bound, total))
+        return buckets
+
+
+class PhaseTimers:
+    """Count, total and max duration of each phase, per evaluation rule ("" for the cluster phases)"""
+
+    def __init__(self):
+        self._stats: dict[tuple[str, str], list] = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def time(self, phase: str, rule: str = ""):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, perf_counter() - start, rule)
+
+    def record(self, phase: str, duration: float, rule: str = "") -> None:
+        with self._lock:
+            stats = self._stats.get((rule, phase))
+            if stats is None:
+                self._stats[(rule, phase)] = [1, duration, duration]
+                return
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+    def stats(self) -> dict[tuple[str, str], tuple[int, float, float]]:
+        """(count, total seconds, max seconds) for each (rule, phase)"""
+        with self._lock:
+            return {_key: tuple(_stats) for _key, _stats in self._stats.items()}
+
+
+class HttpStats:
+    """Calls, errors and latency histogram of the REST requests, per (method, endpoint)"""
+
+    def __init__(self):
+        self._endpoints: dict[tuple[str, str], list] = {}
+        self._lock = Lock()
+
+    def record(
+        self, method: str, query_path: str, duration: float, error: bool = False
+    ) -> None:
+        key = (method, endpoint_template(query_path))
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = [0, Histogram()]
+            stats[0] += int(error)
+            stats[1].observe(duration)
+
+    def stats(self) -> dict[tuple[str, str], tuple[int, Histogram]]:
+        """(errors, histogram) for each (method, endpoint)"""
+        with self._lock:
+            stats: dict = {}
+            for key, (errors, histogram) in self._endpoints.items():
+                histogram_copy = Histogram()
+                histogram_copy.counts = list(histogram.counts)
+                histogram_copy.count = histogram.count
+                histogram_copy.sum = histogram.sum
+                histogram_copy.max = histogram.max
+                stats[key] = (errors, histogram_copy)
+            return stats
+
+
+class InstrumentedApi(Api):
+    """kafka_connect_api Api recording the calls, errors and latency of each request into http_stats"""
+
+    def __init__(self, *args, http_stats: HttpStats = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http_stats: HttpStats = http_stats or HttpStats()
+
+    def _timed(self, method: str, function, query_path: str, **kwargs) -> Response:
+        start = perf_counter()
+        error: bool = True
+        try:
+            response = function(query_path, **kwargs)
+            error = False
+            return response
+        finally:
+            self.http_stats.record(method, query_path, perf_counter() - start, error)
+
+    def get_raw(self, query_path, **kwargs) -> Response:
+        return self._timed("GET", super().get_raw, query_path, **kwargs)
+
+    def post_raw(self, query_path, **kwargs) -> Response:
+        return self._timed("POST", super().post_raw, query_path, **kwargs)
+
+    def put_raw(self, query_path, **kwargs) -> Response:
+        return self._timed("PUT", super().put_raw, query_path, **kwargs)
+
+    def delete_raw(self, query_path, **kwargs) -> Response:
+        return self._timed("DELETE", super().delete_raw, query_path, **kwargs)
+
+
+def instrumentation_metrics(clusters: Iterable[ConnectCluster]) -> dict:
+    """Totals of the phases timers and REST requests of all the clusters, for the watcher metrics"""
+    metrics: dict = {}
+    for phase in PHASES:
+        metrics.update(
+            {
+                f"phase_{phase}_count": 0,
+                f"phase_{phase}_seconds": 0.0,
+                f"phase_{phase}_seconds_max": 0.0,
+            }
+        )
+    http_calls: int = 0
+    http_errors: int = 0
+    for cluster in clusters:
+        for (_rule, phase), (count, total, maximum) in cluster.timers.stats().items():
+            metrics[f"phase_{phase}_count"] += count
+            metrics[f"phase_{phase}_seconds"] += total
+            metrics[f"phase_{phase}_seconds_max"] = max(
+                metrics[f"phase_{phase}_seconds_max"], maximum
+            )
+        for (method, endpoint), (
+            errors,
+            histogram,
+        ) in cluster.http_stats.stats().items():
+            prefix = f"http_{metric_slug(method)}_{metric_slug(endpoint)}"
+            metrics[f"{prefix}_calls"] = (
+                metrics.get(f"{prefix}_calls", 0) + histogram.count
+            )
+            metrics[f"{prefix}_errors"] = metrics.get(f"{prefix}_errors", 0) + errors
+            metrics[f"{prefix}_latency_seconds_total"] = (
+                metrics.get(f"{prefix}_latency_seconds_total", 0.0) + histogram.sum
+            )
+            metrics[f"{prefix}_latency_seconds_max"] = max(
+                metrics.get(f"{prefix}_latency_seconds_max", 0.0), histogram.max
+            )
+            http_calls += histogram.count
+            http_errors += errors
+    metrics.update({"http_calls": http_calls, "http_errors": http_errors})
+    for metric_name, value in metrics.items():
+        if isinstance(value, float):
+            metrics[metric_name] = round(value, 6)
+    profiler = get_sampling_profiler()
+    if profiler is not None:
+        metrics.update(profiler.metrics)
+    return metrics
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all the threads rate times per second, and writes the folded stacks counts to
+    a new file in directory every interval seconds.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        interval: float = DEFAULT_PROFILE_INTERVAL,
+        rate: float = DEFAULT_PROFILE_RATE,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.interval = interval
+        self.period: float = 1.0 / max(1.0, rate)
+        self._stacks: Counter = Counter()
+        self._stop = Event()
+        self._thread: Union[Thread, None] = None
+        self.metrics: dict = {"profiler_samples": 0, "profiler_files": 0}
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+        LOG.info(
+            f"Sampling profiler writing to {self.directory} every {self.interval}s"
+        )
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stops sampling, and writes the last profile"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def sample(self) -> None:
+        threads_names: dict[int, str] = {
+            _thread.ident: _thread.name for _thread in threading.enumerate()
+        }
+        own_ident = threading.get_ident()
+        for thread_ident, frame in sys._current_frames().items():
+            if thread_ident == own_ident:
+                continue
+            stack: list[str] = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            stack.append(threads_names.get(thread_ident, str(thread_ident)))
+            self._stacks[";".join(reversed(stack))] += 1
+        self.metrics["profiler_samples"] += 1
+
+    def write(self) -> Union[str, None]:
+        """Writes the stacks sampled since the last write, in the folded format"""
+        stacks, self._stacks = self._stacks, Counter()
+        if not stacks:
+            return None
+        file_path = os.path.join(
+            self.directory, f"profile-{os.getpid()}-{int(time())}.folded"
+        )
+        with open(file_path, "w") as profile_fd:
+            profile_fd.writelines(
+                f"{_stack} {_count}\n" for _stack, _count in stacks.most_common()
+            )
+        self.metrics["profiler_files"] += 1
+        return file_path
+
+    def _run(self) -> None:
+        next_write = perf_counter() + self.interval
+        while not self._stop.wait(self.period):
+            try:
+                self.sample()
+                if perf_counter() >= next_write:
+                    next_write = perf_counter() + self.interval
+                    LOG.debug(f"Profile written to {self.write()}")
+            except Exception as error:
+                LOG.exception(error)
+        self.write()
+
+
+_SAMPLING_PROFILER: Union[SamplingProfiler, None] = None
+_SAMPLING_PROFILER_LOCK = Lock()
+
+
+def get_sampling_profiler() -> Union[SamplingProfiler, None]:
+    """The sampling profiler, started on first use if enabled in the environment"""
+    global _SAMPLING_PROFILER
+    with _SAMPLING_PROFILER_LOCK:
+        if _SAMPLING_PROFILER is None and os.environ.get(PROFILE_DIR_ENV):
+            _SAMPLING_PROFILER = SamplingProfiler(
+                os.environ[PROFILE_DIR_ENV],
+                float(os.environ.get(PROFILE_INTERVAL_ENV, DEFAULT_PROFILE_INTERVAL)),
+                float(os.environ.get(PROFILE_RATE_ENV, DEFAULT_PROFILE_RATE)),
+            )
+            _SAMPLING_PROFILER.start()
+        return _SAMPLING_PROFILER
@@ -0,0 +1,280 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Leases of the clusters, so that with several watchers (replicas) only one remediates the connectors of a cluster.
+
+All the watchers scan the clusters and keep their caches and metrics warm, but only the watcher holding the lease
+of a cluster cycles, restarts or pauses its connectors. The leases are acquired on first need, then renewed by a
+heartbeat thread every third of their ttl, which defaults to half the configured cluster interval: when the owner
+stops, another watcher takes over the cluster within one scan interval.
+Without leases configured, the watcher owns all the clusters.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Union
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.cluster import ConnectCluster
+    from kafka_connect_watcher.config import Config
+
+import fcntl
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import closing
+from socket import gethostname
+from threading import Event, Lock, Thread
+from time import time
+from urllib.parse import quote
+
+from compose_x_common.compose_x_common import get_duration_timedelta
+
+from kafka_connect_watcher.config import get_interval_seconds
+from kafka_connect_watcher.logger import LOG
+
+MIN_LEASE_TTL: float = 1.0
+
+
+class LeaseBackend(ABC):
+    """Storage of the leases. acquire and release must be atomic across the watchers sharing the backend."""
+
+    @abstractmethod
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """Acquires or renews the lease for ttl seconds. Returns False if held by another owner."""
+
+    @abstractmethod
+    def release(self, name: str, owner: str) -> None:
+        """Releases the lease, if held by owner"""
+
+
+class FileLeaseBackend(LeaseBackend):
+    """
+    One file per lease in a directory, updated under an exclusive flock. For watchers sharing a host or a
+    file system supporting locks, i.e. for testing.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def lease_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{quote(name, safe='')}.lease")
+
+    def _update(self, name: str, owner: str, expires: float) -> bool:
+        with open(self.lease_path(name), "a+") as lease_fd:
+            fcntl.flock(lease_fd, fcntl.LOCK_EX)
+            lease_fd.seek(0)
+            content = lease_fd.read()
+            lease: dict = json.loads(content) if content else {}
+            if lease.get("owner", owner) != owner and lease.get("expires", 0) > time():
+                return False
+            lease_fd.seek(0)
+            lease_fd.truncate()
+            lease_fd.write(json.dumps({"owner": owner, "expires": expires}))
+            return True
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        return self._update(name, owner, time() + ttl)
+
+    def release(self, name: str, owner: str) -> None:
+        self._update(name, owner, 0)
+
+
+class SqliteLeaseBackend(LeaseBackend):
+    """
+    Leases table in a SQLite database, acquired with a conditional upsert. Stand-in for a table in a
+    shared database.
+    """
+
+    def __init__(self, database_path: str, timeout: float = 5.0):
+        self.database_path = database_path
+        self.timeout = timeout
+        with self.connect() as database:
+            database.execute(
+                "CREATE TABLE IF NOT EXISTS leases "
+                "(name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.database_path, timeout=self.timeout)
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time()
+        with closing(self.connect()) as database, database:
+            cursor = database.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires <= ?",
+                (name, owner, now + ttl, now),
+            )
+            return cursor.rowcount > 0
+
+    def release(self, name: str, owner: str) -> None:
+        with closing(self.connect()) as database, database:
+            database.execute(
+                "UPDATE leases SET expires = 0 WHERE name = ? AND owner = ?",
+                (name, owner),
+            )
+
+
+LEASE_BACKENDS: dict[str, Callable[[str], LeaseBackend]] = {
+    "file": FileLeaseBackend,
+    "sqlite": SqliteLeaseBackend,
+}
+
+
+class LeaseManager:
+    """
+    Holds the leases of the clusters for this watcher. A lease is owned until its local expiry: when the backend
+    fails to renew it, the lease is kept until it expires, then lost.
+    """
+
+    def __init__(
+        self,
+        backend: Union[LeaseBackend, None] = None,
+        owner: Union[str, None] = None,
+        ttl: Union[float, None] = None,
+        clock: Callable[[], float] = time,
+    ):
+        self.backend = backend
+        self.owner = owner or f"{gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        self.clock = clock
+        self._ttls: dict[str, float] = {}
+        self._expires: dict[str, float] = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Union[Thread, None] = None
+        self._metrics: dict = {
+            "leases_acquired": 0,
+            "leases_lost": 0,
+            "leases_errors": 0,
+        }
+
+    def configure(self, leases_config: dict) -> None:
+        backend_name: str = leases_config.get("backend", "file")
+        self.backend = LEASE_BACKENDS[backend_name](leases_config["path"])
+        self.owner = leases_config.get("owner", self.owner)
+        if "ttl" in leases_config:
+            self.ttl = get_duration_timedelta(leases_config["ttl"]).total_seconds()
+        LOG.info(f"Leases: {backend_name} backend, owner {self.owner}")
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics: dict = dict(self._metrics)
+            now = self.clock()
+            metrics["leases_owned"] = len(
+                [_expires for _expires in self._expires.values() if _expires > now]
+            )
+        return metrics
+
+    def cluster_ttl(self, cluster: ConnectCluster) -> float:
+        """
+        The ttl set for the leases, or half the configured cluster interval. Not the current interval, which the
+        adaptive interval and circuit breaker shorten for a while.
+        """
+        if self.ttl:
+            return max(MIN_LEASE_TTL, self.ttl)
+        return max(MIN_LEASE_TTL, get_interval_seconds(cluster.base_interval) / 2)
+
+    def refresh_ttl(self, cluster: ConnectCluster) -> None:
+        """Updates the ttl of the cluster lease, if already needed, when the cluster is reconfigured"""
+        with self._lock:
+            if cluster.name in self._ttls:
+                self._ttls[cluster.name] = self.cluster_ttl(cluster)
+
+    def owns(self, cluster: ConnectCluster) -> bool:
+        """Whether the watcher holds the lease of the cluster. The lease is acquired if not held yet."""
+        if self.backend is None:
+            return True
+        with self._lock:
+            ttl = self._ttls.get(cluster.name)
+            if ttl is None:
+                ttl = self._ttls[cluster.name] = self.cluster_ttl(cluster)
+        if not self._owned(cluster.name):
+            self.renew(cluster.name, ttl)
+        return self._owned(cluster.name)
+
+    def _owned(self, name: str) -> bool:
+        with self._lock:
+            return self._expires.get(name, 0) > self.clock()
+
+    def renew(self, name: str, ttl: float) -> None:
+        now = self.clock()
+        try:
+            acquired = self.backend.acquire(name, self.owner, ttl)
+        except Exception as error:
+            LOG.error(f"{name} - failed to renew the lease: {error}")
+            with self._lock:
+                self._metrics["leases_errors"] += 1
+            return
+        with self._lock:
+            if acquired:
+                owned = self._expires.get(name, 0) > now
+                self._expires[name] = now + ttl
+                if not owned:
+                    self._metrics["leases_acquired"] += 1
+                    LOG.info(f"{name} - lease acquired by {self.owner}")
+            elif name in self._expires:
+                self._expires.pop(name, None)
+                self._metrics["leases_lost"] += 1
+                LOG.warning(f"{name} - lease lost: held by another watcher")
+
+    def release(self, cluster_name: str) -> None:
+        """Stops renewing the lease of the cluster, and releases it if owned, i.e. once no longer watched"""
+        with self._lock:
+            self._ttls.pop(cluster_name, None)
+            owned = self._expires.pop(cluster_name, 0) > self.clock()
+        if owned and self.backend is not None:
+            try:
+                self.backend.release(cluster_name, self.owner)
+            except Exception as error:
+                LOG.error(f"{cluster_name} - failed to release the lease: {error}")
+
+    def heartbeat(self) -> None:
+        """Renews the leases held, and tries to acquire the ones of the clusters which needed them"""
+        with self._lock:
+            ttls: dict[str, float] = dict(self._ttls)
+        for name, ttl in ttls.items():
+            self.renew(name, ttl)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True, name="leases")
+            self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        for cluster_name in list(self._ttls):
+            self.release(cluster_name)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                interval: float = min(self._ttls.values(), default=MIN_LEASE_TTL * 3)
+            if self._stop.wait(interval / 3):
+                return
+            if self.backend is not None:
+                self.heartbeat()
+
+
+def init_leases(config: Config) -> None:
+    if config.leases_config:
+        get_lease_manager().configure(config.leases_config)
+
+
+_LEASE_MANAGER: Union[LeaseManager, None] = None
+_LEASE_MANAGER_LOCK = Lock()
+
+
+def get_lease_manager() -> LeaseManager:
+    global _LEASE_MANAGER
+    with _LEASE_MANAGER_LOCK:
+        if _LEASE_MANAGER is None:
+            _LEASE_MANAGER = LeaseManager()
+            _LEASE_MANAGER.start()
+        return _LEASE_MANAGER
@@ -1,32 +1,403 @@
 #   SPDX-License-Identifier: Apache-2.0
 #   Copyright 2023 John "Preston" Mille <john@ews-network.net>
 
-"""Manages different channels of communications"""
+"""
+Notifications pipeline: queues the connectors errors notifications for the dispatcher thread, which
+delivers them to the channels, and coalesces them into digests grouped by connect cluster and error fingerprint,
+published by the channels when their coalescing window ends.
+"""
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Union
-
-from compose_x_common.compose_x_common import keyisset
+from typing import TYPE_CHECKING, Callable, Union
 
 if TYPE_CHECKING:
+    from kafka_connect_watcher.aws_sns import SnsChannel
     from kafka_connect_watcher.config import Config
 
-from copy import deepcopy
+from collections import deque
+from dataclasses import dataclass, field
+from functools import cached_property
+from threading import Condition, Lock, Thread
+from time import monotonic, perf_counter, sleep
+
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.traces import status_traces, trace_fingerprint
 
-from kafka_connect_watcher.aws_sns import SnsChannel
+DEFAULT_QUEUE_SIZE: int = 1000
+DEFAULT_MAX_RETRIES: int = 3
+DEFAULT_DRAIN_TIMEOUT: float = 10.0
+RETRY_BASE_DELAY: float = 1.0
+RETRY_MAX_DELAY: float = 30.0
+SEND_LATENCIES_SAMPLES: int = 100
 
 
-class Notifications:
-    def __init__(self, notifications_def: dict):
-        self._definition = deepcopy(notifications_def)
-        self.sns_channels: dict[str, SnsChannel] = {}
+def error_signature(connector_status: Union[dict, str]) -> str:
+    """
+    The first line of the connector trace, or of the first failed task trace: the exception & message.
+    Falls back to the connector state.
+    """
+    if not isinstance(connector_status, dict):
+        return str(connector_status)
+    for trace in status_traces(connector_status):
+        return trace.strip().splitlines()[0][:256]
+    return connector_status.get("connector", {}).get("state", "UNKNOWN")
 
-        if keyisset("sns", self.definition):
-            for name, definition in self.definition["sns"].items():
-                channel = SnsChannel(name, definition)
-                self.sns_channels[name] = channel
+
+@dataclass(frozen=True)
+class Notification:
+    cluster_name: str
+    connector_name: str
+    status: Union[dict, str] = field(compare=False)
+    repeats: int = field(default=0, compare=False)
 
     @property
-    def definition(self) -> dict:
-        return self._definition
+    def signature(self) -> str:
+        return error_signature(self.status)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        return trace_fingerprint(self.status)
+
+
+@dataclass
+class Digest:
+    """Notifications of a cluster sharing the same error fingerprint"""
+
+    cluster_name: str
+    signature: str
+    notifications: list[Notification] = field(default_factory=list)
+
+    @property
+    def repeats(self) -> int:
+        """Repeats of these errors suppressed since they were last notified"""
+        return sum(_notification.repeats for _notification in self.notifications)
+
+    @property
+    def connectors_names(self) -> list[str]:
+        return list(
+            dict.fromkeys(
+                _notification.connector_name for _notification in self.notifications
+            )
+        )
+
+
+class RateLimiter:
+    """Token bucket allowing rate_per_minute publishes, with bursts up to the same number"""
+
+    def __init__(
+        self, rate_per_minute: Union[int, None], clock: Callable[[], float] = monotonic
+    ):
+        self.rate_per_minute = rate_per_minute
+        self.clock = clock
+        self._tokens: float = float(rate_per_minute or 0)
+        self._updated_at: float = clock()
+        self._lock = Lock()
+
+    def try_acquire(self) -> bool:
+        if not self.rate_per_minute:
+            return True
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                float(self.rate_per_minute),
+                self._tokens + (now - self._updated_at) * self.rate_per_minute / 60.0,
+            )
+            self._updated_at = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class NotificationCoalescer:
+    """
+    Groups the notifications received during the coalescing window by cluster and error fingerprint.
+    The window opens with the first notification, and the digests are ready once it ends.
+    """
+
+    def __init__(self, window: float, clock: Callable[[], float] = monotonic):
+        self.window = window
+        self.clock = clock
+        self._digests: dict[tuple[str, str], Digest] = {}
+        self._window_end: Union[float, None] = None
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._digests)
+
+    @property
+    def window_end(self) -> Union[float, None]:
+        with self._lock:
+            return self._window_end
+
+    def add(self, notification: Notification) -> None:
+        with self._lock:
+            self._add(notification)
+
+    def requeue(self, digests: list[Digest]) -> None:
+        """Puts back digests which could not be published, to be merged into the next window"""
+        with self._lock:
+            for digest in digests:
+                for notification in digest.notifications:
+                    self._add(notification)
+
+    def _add(self, notification: Notification) -> None:
+        key = (notification.cluster_name, notification.fingerprint)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = self._digests[key] = Digest(
+                notification.cluster_name, notification.signature
+            )
+        digest.notifications.append(notification)
+        if self._window_end is None:
+            self._window_end = self.clock() + self.window
+
+    def pop_digests(self, force: bool = False) -> list[Digest]:
+        """Returns the digests once the window ended (or when forced), and resets the window"""
+        with self._lock:
+            if self._window_end is None or (
+                not force and self.clock() < self._window_end
+            ):
+                return []
+            digests = list(self._digests.values())
+            self._digests = {}
+            self._window_end = None
+            return digests
+
+
+class NotificationPipeline:
+    """
+    Decouples the notifications from the remediation threads. The notifications are put in a bounded queue,
+    drained by the dispatcher thread which delivers them to their channel, retries the failed sends with
+    backoff, and publishes the digests of the channels coalescing notifications when their window ends.
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = monotonic,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        overflow_policy: str = "drop_oldest",
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        drain_timeout: float = DEFAULT_DRAIN_TIMEOUT,
+        sleep: Callable[[float], None] = sleep,
+    ):
+        self.clock = clock
+        self.sleep = sleep
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.max_retries = max_retries
+        self.drain_timeout = drain_timeout
+        self._channels: dict[str, SnsChannel] = {}
+        self._queue: deque[tuple[SnsChannel, Notification]] = deque()
+        self._condition = Condition()
+        self._thread: Union[Thread, None] = None
+        self._accepting: bool = True
+        self._running: bool = False
+        self._send_latencies: deque[float] = deque(maxlen=SEND_LATENCIES_SAMPLES)
+        self._metrics: dict = {
+            "notifications_queued": 0,
+            "notifications_dropped": 0,
+            "notifications_send_retries": 0,
+            "notifications_send_failures": 0,
+        }
+
+    def configure(self, notifications_config: dict) -> None:
+        self.queue_size = notifications_config.get("queue_size", self.queue_size)
+        self.overflow_policy = notifications_config.get(
+            "overflow_policy", self.overflow_policy
+        )
+        self.max_retries = notifications_config.get("max_retries", self.max_retries)
+        self.drain_timeout = notifications_config.get(
+            "drain_timeout", self.drain_timeout
+        )
+
+    @property
+    def metrics(self) -> dict:
+        with self._condition:
+            metrics: dict = dict(self._metrics)
+            metrics["notifications_queue_depth"] = len(self._queue)
+            latencies = list(self._send_latencies)
+        metrics["notifications_send_latency_ms"] = (
+            round(sum(latencies) * 1000 / len(latencies), 3) if latencies else 0.0
+        )
+        metrics["notifications_send_latency_max_ms"] = (
+            round(max(latencies) * 1000, 3) if latencies else 0.0
+        )
+        for channel in list(self._channels.values()):
+            for metric_name, value in channel.metrics.items():
+                metrics[f"notifications_{metric_name}"] = (
+                    metrics.get(f"notifications_{metric_name}", 0) + value
+                )
+        return metrics
+
+    def register(self, channel: SnsChannel) -> None:
+        with self._condition:
+            self._channels[repr(channel)] = channel
+
+    def unregister(self, channel: SnsChannel) -> None:
+        with self._condition:
+            if self._channels.get(repr(channel)) is channel:
+                del self._channels[repr(channel)]
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = Thread(target=self._run, daemon=True, name="notifications")
+        self._thread.start()
+
+    def submit(self, channel: SnsChannel, notification: Notification) -> bool:
+        """
+        Queues the notification, without waiting on the channel. When the queue is full, drops the oldest
+        notification or the new one, per the overflow policy. Returns False if the notification was dropped.
+        """
+        with self._condition:
+            if not self._accepting:
+                self._metrics["notifications_dropped"] += 1
+                return False
+            if len(self._queue) >= self.queue_size:
+                self._metrics["notifications_dropped"] += 1
+                if self.overflow_policy == "drop_newest":
+                    LOG.warning(
+                        f"Notifications queue full. Dropping notification for {notification.connector_name}"
+                    )
+                    return False
+                dropped_channel, dropped = self._queue.popleft()
+                LOG.warning(
+                    f"Notifications queue full. Dropping notification for {dropped.connector_name}"
+                )
+            self._queue.append((channel, notification))
+            self._metrics["notifications_queued"] += 1
+            self._condition.notify_all()
+            return True
+
+    def wake(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+    def next_due(self) -> Union[float, None]:
+        windows_ends = [
+            _channel.coalescer.window_end
+            for _channel in list(self._channels.values())
+            if _channel.coalescer is not None
+            and _channel.coalescer.window_end is not None
+        ]
+        return min(windows_ends) if windows_ends else None
+
+    def send(
+        self, function: Callable, retryable: Callable[[Exception], bool], **kwargs
+    ):
+        """
+        Calls function, retrying up to max_retries times with exponential backoff if the error is retryable.
+        Called from the dispatcher thread only.
+        """
+        for attempt in range(self.max_retries + 1):
+            started = perf_counter()
+            try:
+                return function(**kwargs)
+            except Exception as error:
+                if attempt >= self.max_retries or not retryable(error):
+                    with self._condition:
+                        self._metrics["notifications_send_failures"] += 1
+                    raise
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+                LOG.warning(
+                    f"Notification send failed ({error}). Retrying in {delay}s ({attempt + 1}/{self.max_retries})"
+                )
+                with self._condition:
+                    self._metrics["notifications_send_retries"] += 1
+            finally:
+                with self._condition:
+                    self._send_latencies.append(perf_counter() - started)
+            self.sleep(delay)
+
+    def dispatch(self, channel: SnsChannel, notification: Notification) -> None:
+        try:
+            channel.dispatch(notification)
+        except Exception as error:
+            LOG.exception(error)
+            LOG.error(
+                f"{channel} - failed to send notification for {notification.connector_name}"
+            )
+
+    def flush(self, force: bool = False) -> None:
+        """Publishes the digests of the channels which window ended"""
+        for channel in list(self._channels.values()):
+            if channel.coalescer is None:
+                continue
+            digests = channel.coalescer.pop_digests(force)
+            if digests:
+                try:
+                    channel.publish_digests(digests)
+                except Exception as error:
+                    LOG.exception(error)
+                    LOG.error(f"{channel} - failed to publish notifications digests")
+
+    def drain(self) -> None:
+        """Dispatches the queued notifications, and publishes all the pending digests"""
+        while True:
+            with self._condition:
+                if not self._queue:
+                    break
+                channel, notification = self._queue.popleft()
+            self.dispatch(channel, notification)
+        self.flush(force=True)
+
+    def shutdown(self) -> None:
+        """
+        Stops accepting notifications, and lets the dispatcher deliver the queued ones and the pending digests,
+        for up to drain_timeout seconds.
+        """
+        with self._condition:
+            self._accepting = False
+            self._running = False
+            thread = self._thread
+            self._condition.notify_all()
+        if thread is None:
+            self.drain()
+            return
+        thread.join(self.drain_timeout)
+        if thread.is_alive():
+            LOG.warning(
+                f"Notifications not delivered after {self.drain_timeout}s: {len(self._queue)} queued"
+            )
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._running:
+                    break
+                if not self._queue:
+                    next_due = self.next_due()
+                    if next_due is None or next_due > self.clock():
+                        self._condition.wait(
+                            None if next_due is None else next_due - self.clock()
+                        )
+                        continue
+                items: list[tuple[SnsChannel, Notification]] = list(self._queue)
+                self._queue.clear()
+            for channel, notification in items:
+                self.dispatch(channel, notification)
+            self.flush()
+        self.drain()
+
+
+def init_notifications(config: Config) -> None:
+    if config.notifications_config:
+        get_notification_pipeline().configure(config.notifications_config)
+
+
+_NOTIFICATION_PIPELINE: Union[NotificationPipeline, None] = None
+_NOTIFICATION_PIPELINE_LOCK = Lock()
+
+
+def get_notification_pipeline() -> NotificationPipeline:
+    global _NOTIFICATION_PIPELINE
+    with _NOTIFICATION_PIPELINE_LOCK:
+        if _NOTIFICATION_PIPELINE is None:
+            _NOTIFICATION_PIPELINE = NotificationPipeline()
+            _NOTIFICATION_PIPELINE.start()
+        return _NOTIFICATION_PIPELINE
@@ -0,0 +1,502 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Prometheus exporter for the clusters & connectors metrics.
+
+Each cluster scan renders the samples of its cluster into an immutable frame, swapped into the registry in
+a single assignment: the scans never wait on each other nor on a scrape.
+The exposition text is rendered from the frames only once per published scan, and cached for the scrapes.
+prometheus_client is only imported once a cluster publishes its metrics.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Mapping, Union
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.cluster import ConnectCluster
+    from kafka_connect_watcher.config import Config
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from threading import Lock, Thread
+from types import MappingProxyType
+
+from compose_x_common.compose_x_common import keyisset, set_else_none
+
+from kafka_connect_watcher.circuit_breaker import CIRCUIT_STATES
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.remediation import get_remediation_scheduler
+
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_PORT: int = 8000
+DEFAULT_ADDRESS: str = "0.0.0.0"
+
+CONNECTORS_STATUSES: tuple[str, ...] = ("running", "paused", "unassigned", "failed")
+TASKS_STATES: tuple[str, ...] = ("running", "failed", "unassigned")
+
+METRICS: tuple[tuple[str, str, str], ...] = (
+    (
+        "kafka_connect_watcher_cluster_connectors",
+        "gauge",
+        "Connectors in the connect cluster",
+    ),
+    (
+        "kafka_connect_watcher_cluster_connectors_status",
+        "gauge",
+        "Connectors handled by the evaluation rules, per evaluated status",
+    ),
+    (
+        "kafka_connect_watcher_cluster_scan_duration_seconds",
+        "gauge",
+        "Duration of the last scan of the connect cluster",
+    ),
+    (
+        "kafka_connect_watcher_cluster_scan_rest_calls",
+        "gauge",
+        "REST calls made by the last scan of the connect cluster",
+    ),
+    (
+        "kafka_connect_watcher_cluster_scan_interval_seconds",
+        "gauge",
+        "Interval between the scans of the connect cluster, adapted with adaptive_interval",
+    ),
+    (
+        "kafka_connect_watcher_cluster_rest_latency_seconds",
+        "gauge",
+        "Latency of the connectors list request of the last scan",
+    ),
+    (
+        "kafka_connect_watcher_cluster_connectors_metrics_bytes",
+        "gauge",
+        "Approximate memory used by the connectors metrics of the cluster",
+    ),
+    (
+        "kafka_connect_watcher_cluster_remediation_actions_total",
+        "counter",
+        "Corrective actions applied to the connectors of the cluster",
+    ),
+    (
+        "kafka_connect_watcher_cluster_phase_seconds_total",
+        "counter",
+        "Time spent in each phase of the cluster processing, per evaluation rule",
+    ),
+    (
+        "kafka_connect_watcher_cluster_phase_runs_total",
+        "counter",
+        "Runs of each phase of the cluster processing, per evaluation rule",
+    ),
+    (
+        "kafka_connect_watcher_cluster_http_request_duration_seconds",
+        "histogram",
+        "Latency of the REST requests to the connect cluster, per endpoint",
+    ),
+    (
+        "kafka_connect_watcher_cluster_http_request_errors_total",
+        "counter",
+        "REST requests to the connect cluster which failed, per endpoint",
+    ),
+    (
+        "kafka_connect_watcher_cluster_http_connections_opened_total",
+        "counter",
+        "Connections opened to the connect cluster by its HTTP connections pool",
+    ),
+    (
+        "kafka_connect_watcher_cluster_http_connections_reused_total",
+        "counter",
+        "REST requests sent over a kept-alive connection to the connect cluster",
+    ),
+    (
+        "kafka_connect_watcher_cluster_http_in_flight_waits_total",
+        "counter",
+        "REST requests which waited for the in-flight requests limit of the connect cluster",
+    ),
+    (
+        "kafka_connect_watcher_cluster_circuit_breaker_state",
+        "gauge",
+        "State of the circuit breaker of the connect cluster: 1 for the current state",
+    ),
+    (
+        "kafka_connect_watcher_cluster_circuit_breaker_opened_total",
+        "counter",
+        "Times the circuit breaker of the connect cluster opened after consecutive failed scans",
+    ),
+    (
+        "kafka_connect_watcher_cluster_circuit_breaker_probes_total",
+        "counter",
+        "Probes of the connect cluster while its circuit breaker was open",
+    ),
+    (
+        "kafka_connect_watcher_cluster_scans_skipped_total",
+        "counter",
+        "Scans of the connect cluster skipped while its circuit breaker was open",
+    ),
+    (
+        "kafka_connect_watcher_connector_tasks",
+        "gauge",
+        "Tasks of the connector",
+    ),
+    (
+        "kafka_connect_watcher_connector_tasks_state",
+        "gauge",
+        "Tasks of the connector, per state",
+    ),
+)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class ClusterExporter:
+    """
+    Renders the samples of a connect cluster. The samples of each connector are kept between scans and
+    only rendered again for the connectors which changed.
+    """
+
+    def __init__(self, cluster_name: str):
+        from prometheus_client.utils import floatToGoString
+
+        self.format_value: Callable[[float], str] = floatToGoString
+        self.cluster_name = cluster_name
+        self.cluster_labels: str = f'cluster="{escape_label(cluster_name)}"'
+        self._connectors_samples: dict[str, tuple[str, str]] = {}
+
+    def sample(self, metric_name: str, labels: str, value: Union[int, float]) -> str:
+        return f"{metric_name}{{{labels}}} {self.format_value(value)}\n"
+
+    def connector_samples(
+        self, connector_name: str, connector_metrics: dict
+    ) -> tuple[str, str]:
+        labels: str = (
+            f'{self.cluster_labels},connector="{escape_label(connector_name)}"'
+        )
+        return (
+            self.sample(
+                "kafka_connect_watcher_connector_tasks",
+                labels,
+                connector_metrics["tasks"],
+            ),
+            "".join(
+                self.sample(
+                    "kafka_connect_watcher_connector_tasks_state",
+                    f'{labels},state="{state}"',
+                    connector_metrics[state],
+                )
+                for state in TASKS_STATES
+            ),
+        )
+
+    def instrumentation_samples(self, cluster: ConnectCluster) -> dict[str, str]:
+        """Samples of the phases timers, REST requests and HTTP connections of the cluster"""
+        phases_seconds: list[str] = []
+        phases_runs: list[str] = []
+        for (rule, phase), (runs, seconds, _max) in sorted(
+            cluster.timers.stats().items()
+        ):
+            labels: str = f'{self.cluster_labels},rule="{rule}",phase="{phase}"'
+            phases_seconds.append(
+                self.sample(
+                    "kafka_connect_watcher_cluster_phase_seconds_total", labels, seconds
+                )
+            )
+            phases_runs.append(
+                self.sample(
+                    "kafka_connect_watcher_cluster_phase_runs_total", labels, runs
+                )
+            )
+        durations: list[str] = []
+        errors: list[str] = []
+        metric_name: str = "kafka_connect_watcher_cluster_http_request_duration_seconds"
+        for (method, endpoint), (endpoint_errors, histogram) in sorted(
+            cluster.http_stats.stats().items()
+        ):
+            labels: str = (
+                f'{self.cluster_labels},method="{method}",endpoint="{escape_label(endpoint)}"'
+            )
+            for bound, bucket_count in histogram.cumulative_counts():
+                durations.append(
+                    self.sample(
+                        f"{metric_name}_bucket", f'{labels},le="{bound}"', bucket_count
+                    )
+                )
+            durations.append(self.sample(f"{metric_name}_sum", labels, histogram.sum))
+            durations.append(
+                self.sample(f"{metric_name}_count", labels, histogram.count)
+            )
+            errors.append(
+                self.sample(
+                    "kafka_connect_watcher_cluster_http_request_errors_total",
+                    labels,
+                    endpoint_errors,
+                )
+            )
+        transport_metrics: dict = cluster.transport.metrics
+        return {
+            "kafka_connect_watcher_cluster_phase_seconds_total": "".join(
+                phases_seconds
+            ),
+            "kafka_connect_watcher_cluster_phase_runs_total": "".join(phases_runs),
+            metric_name: "".join(durations),
+            "kafka_connect_watcher_cluster_http_request_errors_total": "".join(errors),
+            **{
+                f"kafka_connect_watcher_cluster_{_name}_total": self.sample(
+                    f"kafka_connect_watcher_cluster_{_name}_total",
+                    self.cluster_labels,
+                    transport_metrics[_name],
+                )
+                for _name in (
+                    "http_connections_opened",
+                    "http_connections_reused",
+                    "http_in_flight_waits",
+                )
+            },
+        }
+
+    def circuit_breaker_samples(self, cluster: ConnectCluster) -> dict[str, str]:
+        """Samples of the circuit breaker of the cluster, none if disabled"""
+        breaker = cluster.circuit_breaker
+        if breaker is None:
+            return {}
+        breaker_metrics: dict = breaker.metrics
+        return {
+            "kafka_connect_watcher_cluster_circuit_breaker_state": "".join(
+                self.sample(
+                    "kafka_connect_watcher_cluster_circuit_breaker_state",
+                    f'{self.cluster_labels},state="{state}"',
+                    int(breaker.state == state),
+                )
+                for state in CIRCUIT_STATES
+            ),
+            **{
+                metric_name: self.sample(
+                    metric_name, self.cluster_labels, breaker_metrics[_name]
+                )
+                for metric_name, _name in (
+                    (
+                        "kafka_connect_watcher_cluster_circuit_breaker_opened_total",
+                        "circuit_breaker_opened",
+                    ),
+                    (
+                        "kafka_connect_watcher_cluster_circuit_breaker_probes_total",
+                        "circuit_breaker_probes",
+                    ),
+                    (
+                        "kafka_connect_watcher_cluster_scans_skipped_total",
+                        "cluster_scans_skipped",
+                    ),
+                )
+            },
+        }
+
+    def render(self, cluster: ConnectCluster) -> Mapping[str, str]:
+        """Renders the frame of the cluster: the samples of the cluster for each metric"""
+        connectors_metrics: dict = cluster.metrics["connectors"]
+        updated = cluster.snapshot.diff.updated if cluster.snapshot else None
+        connectors_samples: dict[str, tuple[str, str]] = {}
+        for connector_name, connector_metrics in connectors_metrics.items():
+            connector_samples = self._connectors_samples.get(connector_name)
+            if (
+                connector_samples is None
+                or updated is None
+                or connector_name in updated
+            ):
+                connector_samples = self.connector_samples(
+                    connector_name, connector_metrics
+                )
+            connectors_samples[connector_name] = connector_samples
+        self._connectors_samples = connectors_samples
+
+        frame: dict[str, str] = {
+            "kafka_connect_watcher_cluster_connectors": self.sample(
+                "kafka_connect_watcher_cluster_connectors",
+                self.cluster_labels,
+                cluster.metrics.get("total", 0),
+            ),
+            "kafka_connect_watcher_cluster_connectors_status": "".join(
+                self.sample(
+                    "kafka_connect_watcher_cluster_connectors_status",
+                    f'{self.cluster_labels},status="{status}"',
+                    cluster.metrics.get(status, 0),
+                )
+                for status in CONNECTORS_STATUSES
+            ),
+            "kafka_connect_watcher_cluster_connectors_metrics_bytes": self.sample(
+                "kafka_connect_watcher_cluster_connectors_metrics_bytes",
+                self.cluster_labels,
+                cluster.metrics.get("connectors_metrics_bytes", 0),
+            ),
+            "kafka_connect_watcher_cluster_remediation_actions_total": self.sample(
+                "kafka_connect_watcher_cluster_remediation_actions_total",
+                self.cluster_labels,
+                get_remediation_scheduler().actions_applied(self.cluster_name),
+            ),
+            "kafka_connect_watcher_connector_tasks": "".join(
+                _samples[0] for _samples in connectors_samples.values()
+            ),
+            "kafka_connect_watcher_connector_tasks_state": "".join(
+                _samples[1] for _samples in connectors_samples.values()
+            ),
+        }
+        frame.update(self.instrumentation_samples(cluster))
+        frame.update(self.circuit_breaker_samples(cluster))
+        if cluster.snapshot:
+            for metric_name, value in (
+                (
+                    "kafka_connect_watcher_cluster_scan_duration_seconds",
+                    cluster.snapshot.duration,
+                ),
+                (
+                    "kafka_connect_watcher_cluster_scan_rest_calls",
+                    cluster.snapshot.rest_calls,
+                ),
+                (
+                    "kafka_connect_watcher_cluster_rest_latency_seconds",
+                    cluster.snapshot.rest_latency,
+                ),
+                (
+                    "kafka_connect_watcher_cluster_scan_interval_seconds",
+                    cluster.interval,
+                ),
+            ):
+                frame[metric_name] = self.sample(
+                    metric_name, self.cluster_labels, value
+                )
+        return MappingProxyType(frame)
+
+
+class MetricsRegistry:
+    """
+    Holds the latest frame of each cluster. Publishing a frame is a single dict assignment, and the
+    exposition text is only rendered again when a frame was published since the last scrape.
+    """
+
+    def __init__(self):
+        self._exporters: dict[str, ClusterExporter] = {}
+        self._frames: dict[str, Mapping[str, str]] = {}
+        self._versions = count(1)
+        self._version: int = 0
+        self._exposition: tuple[int, bytes] = (0, b"")
+
+    def publish(self, cluster: ConnectCluster) -> None:
+        """Renders the cluster samples in the calling (scan) thread, and swaps in its frame"""
+        exporter = self._exporters.get(cluster.name)
+        if exporter is None:
+            exporter = self._exporters.setdefault(
+                cluster.name, ClusterExporter(cluster.name)
+            )
+        self.publish_frame(cluster.name, exporter.render(cluster))
+
+    def publish_frame(self, cluster_name: str, frame: Mapping[str, str]) -> None:
+        self._frames[cluster_name] = frame
+        self._version = next(self._versions)
+
+    def frames(self) -> dict[str, dict[str, str]]:
+        """Copy of the latest frames, i.e. to send them to another process"""
+        return {
+            _cluster_name: dict(_frame)
+            for _cluster_name, _frame in list(self._frames.items())
+        }
+
+    def remove(self, cluster_name: str) -> None:
+        self._exporters.pop(cluster_name, None)
+        if self._frames.pop(cluster_name, None) is not None:
+            self._version = next(self._versions)
+
+    def exposition(self) -> bytes:
+        version = self._version
+        cached_version, cached_exposition = self._exposition
+        if cached_version == version:
+            return cached_exposition
+        frames: list[Mapping[str, str]] = list(self._frames.values())
+        lines: list[str] = []
+        for metric_name, metric_type, metric_help in METRICS:
+            lines.append(f"# HELP {metric_name} {metric_help}\n")
+            lines.append(f"# TYPE {metric_name} {metric_type}\n")
+            lines.extend(frame.get(metric_name, "") for frame in frames)
+        exposition: bytes = "".join(lines).encode("utf-8")
+        self._exposition = (version, exposition)
+        return exposition
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        exposition = self.server.registry.exposition()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(exposition)))
+        self.end_headers()
+        self.wfile.write(exposition)
+
+    def log_message(self, format, *args):
+        LOG.debug(f"prometheus - {self.address_string()} - {format % args}")
+
+
+def start_metrics_server(
+    prometheus_config: dict, registry: MetricsRegistry = None
+) -> ThreadingHTTPServer:
+    """Serves /metrics from a daemon thread"""
+    port: int = int(prometheus_config.get("port", DEFAULT_PORT))
+    address: str = prometheus_config.get("address", DEFAULT_ADDRESS)
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry or get_metrics_registry()
+    Thread(target=server.serve_forever, daemon=True, name="prometheus").start()
+    LOG.info(f"Prometheus metrics available on http://{address}:{port}/metrics")
+    return server
+
+
+def prometheus_enabled(cluster: ConnectCluster) -> bool:
+    return keyisset("enabled", cluster.prometheus_config)
+
+
+def prometheus_configured(config: Config) -> bool:
+    """
+    Whether prometheus is configured, or enabled for any of the clusters. Read from the clusters definitions,
+    so that processes which do not watch the clusters can tell without creating them.
+    """
+    return config.prometheus_config is not None or any(
+        keyisset(
+            "enabled",
+            set_else_none("prometheus", set_else_none("metrics", _cluster, {}), {}),
+        )
+        for _cluster in config.config["clusters"]
+    )
+
+
+def init_prometheus(config: Config) -> Union[ThreadingHTTPServer, None]:
+    """
+    Starts the metrics server if prometheus is configured, or enabled for any of the clusters.
+    Called again with the reloaded configuration, so that enabling prometheus for a cluster starts the
+    server. The server is only started once.
+    """
+    global _METRICS_SERVER
+    with _METRICS_SERVER_LOCK:
+        if _METRICS_SERVER is None and prometheus_configured(config):
+            _METRICS_SERVER = start_metrics_server(config.prometheus_config or {})
+        return _METRICS_SERVER
+
+
+def publish_cluster_prometheus(cluster: ConnectCluster) -> None:
+    if prometheus_enabled(cluster):
+        get_metrics_registry().publish(cluster)
+
+
+_METRICS_REGISTRY: Union[MetricsRegistry, None] = None
+_METRICS_REGISTRY_LOCK = Lock()
+_METRICS_SERVER: Union[ThreadingHTTPServer, None] = None
+_METRICS_SERVER_LOCK = Lock()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    global _METRICS_REGISTRY
+    with _METRICS_REGISTRY_LOCK:
+        if _METRICS_REGISTRY is None:
+            _METRICS_REGISTRY = MetricsRegistry()
+        return _METRICS_REGISTRY
@@ -0,0 +1,269 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Hot reload of the configuration file.
+
+The configuration file is reloaded when it changes (mtime polling) or on SIGHUP, and validated before being applied.
+The running clusters are diffed against the new definitions: only the added, removed or changed clusters and
+evaluation rules are created or rebuilt. The clusters which connection settings did not change keep their HTTP
+session, snapshot and metrics, and the remediations in progress run to completion with the rules they started with.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Union
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.aws_sns import SnsChannel
+    from kafka_connect_watcher.sharding import Shard
+
+import json
+import signal
+from dataclasses import dataclass, field
+from os import path, stat
+from time import monotonic
+
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.error_rules import EvaluationRule
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.notifications import get_notification_pipeline
+
+RELOADABLE_CLUSTER_KEYS: tuple[str, ...] = (
+    "evaluation_rules",
+    "interval",
+    "adaptive_interval",
+    "circuit_breaker",
+    "metrics",
+)
+RESTART_REQUIRED_KEYS: tuple[str, ...] = (
+    "aws_emf",
+    "prometheus",
+    "engine",
+    "leases",
+)
+
+
+def definition_key(definition: dict) -> str:
+    return json.dumps(definition, sort_keys=True, default=str)
+
+
+class ConfigWatcher:
+    """
+    Detects the changes of the configuration file: on SIGHUP, and by polling its mtime every poll_interval
+    seconds if set. With a shard, the configurations loaded only keep the clusters of the shard.
+    """
+
+    def __init__(
+        self,
+        config_file_path: str,
+        poll_interval: Union[float, None] = None,
+        clock: Callable[[], float] = monotonic,
+        shard: Union[Shard, None] = None,
+    ):
+        self.config_file_path = path.abspath(config_file_path)
+        self.poll_interval = poll_interval
+        self.shard = shard
+        self.clock = clock
+        self._requested: bool = False
+        self._mtime: Union[int, None] = self.mtime()
+        self._next_poll: float = clock() + (poll_interval or 0)
+
+    def install_signal_handler(self) -> None:
+        signal.signal(signal.SIGHUP, self.request)
+
+    def request(self, *args) -> None:
+        """Reload requested (SIGHUP). Only sets a flag: the reload is done by the watcher loop."""
+        self._requested = True
+
+    def mtime(self) -> Union[int, None]:
+        try:
+            return stat(self.config_file_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def changed(self) -> bool:
+        if self._requested:
+            self._requested = False
+            self._mtime = self.mtime()
+            return True
+        if not self.poll_interval or self.clock() < self._next_poll:
+            return False
+        self._next_poll = self.clock() + self.poll_interval
+        mtime = self.mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        return True
+
+    def load(self) -> Union[Config, None]:
+        """The new configuration, or None if it cannot be loaded or is not valid: the running one is kept."""
+        try:
+            config = Config(self.config_file_path)
+            return self.shard.select(config) if self.shard is not None else config
+        except Exception as error:
+            LOG.error(
+                f"Configuration {self.config_file_path} not reloaded, keeping the running configuration: {error}"
+            )
+            return None
+
+
+@dataclass
+class ClustersChanges:
+    clusters: dict[str, ConnectCluster] = field(default_factory=dict)
+    added: list[ConnectCluster] = field(default_factory=list)
+    removed: list[ConnectCluster] = field(default_factory=list)
+    rebuilt: list[tuple[ConnectCluster, ConnectCluster]] = field(default_factory=list)
+    reconfigured: list[ConnectCluster] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.rebuilt or self.reconfigured)
+
+
+def reload_channels(running_config: Config, new_config: Config) -> set[str]:
+    """
+    Keeps the running channels which definition did not change, with their SNS client and pending digests.
+    The notifications pending in the channels which changed are moved to their new version.
+    Returns the names of the channels which changed or were removed.
+    """
+    pipeline = get_notification_pipeline()
+    changed: set[str] = set()
+    for channel_name, channel in running_config.notification_channels.items():
+        new_channel: Union[SnsChannel, None] = new_config.notification_channels.get(
+            channel_name
+        )
+        if new_channel is not None and definition_key(
+            new_channel.definition
+        ) == definition_key(channel.definition):
+            new_config.notification_channels[channel_name] = channel
+            pipeline.register(channel)
+            continue
+        changed.add(channel_name)
+        digests = (
+            channel.coalescer.pop_digests(force=True)
+            if channel.coalescer is not None
+            else []
+        )
+        if new_channel is None:
+            pipeline.unregister(channel)
+            if digests:
+                LOG.warning(
+                    f"{channel} removed. Dropping {len(digests)} pending notifications digests"
+                )
+            continue
+        for digest in digests:
+            for notification in digest.notifications:
+                pipeline.submit(new_channel, notification)
+    return changed
+
+
+def notifies(rule_definition: dict, channels_names: set[str]) -> bool:
+    return any(
+        _target.get("target") in channels_names
+        for _action in rule_definition.get("auto_correct_actions", [])
+        for _target in _action.get("notify", [])
+    )
+
+
+def requires_rebuild(running: ConnectCluster, cluster_definition: dict) -> bool:
+    """Whether the settings other than the rules, interval and metrics changed"""
+    return definition_key(
+        {
+            _key: _value
+            for _key, _value in running.definition.items()
+            if _key not in RELOADABLE_CLUSTER_KEYS
+        }
+    ) != definition_key(
+        {
+            _key: _value
+            for _key, _value in cluster_definition.items()
+            if _key not in RELOADABLE_CLUSTER_KEYS
+        }
+    )
+
+
+def reconfigure_cluster(
+    cluster: ConnectCluster,
+    cluster_definition: dict,
+    new_config: Config,
+    changed_channels: set[str],
+) -> bool:
+    """
+    Applies the new rules, interval, circuit breaker and metrics settings to the running cluster.
+    The evaluation rules which did not change, and do not notify a changed channel, are kept with their caches.
+    The adaptive interval and circuit breaker keep their state unless their settings changed.
+    Returns False if nothing changed.
+    """
+    running_rules: dict[str, EvaluationRule] = {
+        definition_key(_rule.original_config): _rule
+        for _rule in cluster.handling_rules
+        if not notifies(_rule.original_config, changed_channels)
+    }
+    rules_definitions: list[dict] = cluster_definition.get(
+        EvaluationRule.config_key, []
+    )
+    if definition_key(cluster_definition) == definition_key(cluster.definition) and len(
+        running_rules
+    ) == len(cluster.handling_rules):
+        return False
+    handling_rules: list[EvaluationRule] = []
+    for rule_definition in rules_definitions:
+        rule = running_rules.pop(definition_key(rule_definition), None)
+        handling_rules.append(
+            rule if rule is not None else EvaluationRule(rule_definition, new_config)
+        )
+    breaker_changed: bool = cluster_definition.get(
+        "circuit_breaker"
+    ) != cluster.definition.get("circuit_breaker")
+    interval_changed: bool = any(
+        cluster_definition.get(_key) != cluster.definition.get(_key)
+        for _key in ("interval", "adaptive_interval")
+    )
+    cluster.definition = cluster_definition
+    cluster.handling_rules = handling_rules
+    cluster.init_metrics_config()
+    if interval_changed:
+        cluster.init_adaptive_interval()
+    if breaker_changed:
+        cluster.init_circuit_breaker()
+    return True
+
+
+def reload_clusters(
+    clusters: dict[str, ConnectCluster], running_config: Config, new_config: Config
+) -> ClustersChanges:
+    """Diffs the running clusters against the new configuration, and applies the changes"""
+    changed_channels = reload_channels(running_config, new_config)
+    changes = ClustersChanges()
+    for cluster_definition in new_config.config["clusters"]:
+        running = clusters.get(ConnectCluster.definition_name(cluster_definition))
+        if running is None:
+            new_cluster = ConnectCluster(cluster_definition, new_config)
+            changes.added.append(new_cluster)
+            changes.clusters[new_cluster.name] = new_cluster
+        elif requires_rebuild(running, cluster_definition):
+            new_cluster = ConnectCluster(cluster_definition, new_config)
+            changes.rebuilt.append((running, new_cluster))
+            changes.clusters[new_cluster.name] = new_cluster
+        else:
+            if reconfigure_cluster(
+                running, cluster_definition, new_config, changed_channels
+            ):
+                changes.reconfigured.append(running)
+            changes.clusters[running.name] = running
+    changes.removed = [
+        _cluster
+        for _name, _cluster in clusters.items()
+        if _name not in changes.clusters
+    ]
+    for key in RESTART_REQUIRED_KEYS:
+        if definition_key(running_config.config.get(key)) != definition_key(
+            new_config.config.get(key)
+        ):
+            LOG.warning(f"{key} settings changed: only applied after a restart")
+    LOG.info(
+        f"Configuration reloaded: {len(changes.added)} clusters added, {len(changes.removed)} removed, "
+        f"{len(changes.rebuilt)} rebuilt, {len(changes.reconfigured)} reconfigured"
+    )
+    return changes
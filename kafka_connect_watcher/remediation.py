@@ -0,0 +1,291 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Remediation of the connectors, run outside of the clusters scans.
+
+Each remediation is a state machine walking through the auto-correct rules of the evaluation rule.
+Its waits (backoff between status checks, delay after the action) are handled by the RemediationScheduler
+delayed queue, never by sleeping, and its steps are executed on the evaluation pool.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Union
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.cluster import ConnectCluster, ConnectorState
+    from kafka_connect_watcher.error_rules import AutoCorrectRule
+
+import heapq
+from itertools import count
+from threading import Condition, Lock, Thread
+from time import monotonic
+
+from kafka_connect_watcher.leases import get_lease_manager
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.traces import FingerprintCache, trace_fingerprint
+from kafka_connect_watcher.workers import get_evaluation_pool
+
+CHECK_STATUS: str = "check_status"
+APPLY_ACTION: str = "apply_action"
+POST_ACTION_STATUS: str = "post_action_status"
+POST_ACTION_LOG_TTL: float = 3600.0
+
+POST_ACTION_TRACES = FingerprintCache(POST_ACTION_LOG_TTL)
+
+
+class Remediation:
+    """
+    Applies the auto-correct rules, in order, to a connector.
+    For each rule using backoff, the connector status is checked up to max_attempts times, with exponential
+    backoff capped to max_backoff, and the action skipped if the connector recovered.
+    """
+
+    def __init__(
+        self,
+        cluster: ConnectCluster,
+        connector_state: ConnectorState,
+        rules: list[AutoCorrectRule],
+    ):
+        self.cluster = cluster
+        self.connector_state = connector_state
+        self.connector = connector_state.handle
+        self.rules = rules
+        self.rule_index: int = -1
+        self.phase: Union[str, None] = None
+        self.attempt: int = 0
+        self.backoff: int = 0
+        self.actions_applied: int = 0
+        self._next_rule()
+
+    def __repr__(self):
+        return f"{self.cluster.name}.{self.connector_state.name}"
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.cluster.name, self.connector_state.name
+
+    @property
+    def rule(self) -> Union[AutoCorrectRule, None]:
+        if 0 <= self.rule_index < len(self.rules):
+            return self.rules[self.rule_index]
+        return None
+
+    @property
+    def done(self) -> bool:
+        return self.rule is None
+
+    def _next_rule(self) -> None:
+        self.rule_index += 1
+        self.attempt = 0
+        if self.rule is None:
+            self.phase = None
+            return
+        self.backoff = self.rule.initial_delay
+        self.phase = CHECK_STATUS if self.rule.use_backoff else APPLY_ACTION
+
+    def step(self) -> Union[float, None]:
+        """
+        Executes the current step of the remediation.
+        Returns the delay (seconds) before the next step, or None when the remediation is complete.
+        """
+        rule = self.rule
+        if rule is None:
+            return None
+        if self.phase == CHECK_STATUS:
+            if self.attempt == 0:
+                LOG.info(
+                    f"Backoff enabled: max_backoff={rule.max_backoff}, max_attempts={rule.max_attempts}"
+                )
+            recovered, current_state, task_states = rule.has_recovered(self.connector)
+            if recovered:
+                LOG.info(
+                    f"{self.connector.name} and all its tasks have recovered. Skipping corrective action."
+                )
+                self._next_rule()
+                return None if self.done else 0
+            LOG.warning(
+                f"{self.connector.name} not fully recovered (connector: {current_state}, tasks: {task_states}). "
+                f"Attempt {self.attempt + 1}/{rule.max_attempts}. Waiting {self.backoff}s before re-checking..."
+            )
+            delay = self.backoff
+            self.backoff = min(rule.max_backoff, self.backoff * 2)
+            self.attempt += 1
+            if self.attempt >= rule.max_attempts:
+                self.phase = APPLY_ACTION
+            return delay
+        elif self.phase == APPLY_ACTION:
+            if not get_lease_manager().owns(self.cluster):
+                LOG.warning(
+                    f"{self} - cluster lease lost, another watcher takes over. Aborting the remediation."
+                )
+                return None
+            if not rule.use_backoff:
+                LOG.info(
+                    f"No backoff configured for connector {self.connector.name}. "
+                    f"Applying corrective action '{rule.action}' immediately."
+                )
+            if rule.apply(self.cluster, self.connector, self.connector_state):
+                self.actions_applied += 1
+                self.phase = POST_ACTION_STATUS
+                return rule.initial_delay
+            self._next_rule()
+            return None if self.done else 0
+        elif self.phase == POST_ACTION_STATUS:
+            connector_status = self.connector.status
+            fingerprint = trace_fingerprint(connector_status)
+            if (
+                POST_ACTION_TRACES.admit(
+                    (self.cluster.name, self.connector.name, fingerprint)
+                )
+                is None
+            ):
+                LOG.info(
+                    f"Post-action status for {self.connector.name}: same as previously logged ({fingerprint})"
+                )
+            else:
+                LOG.info(
+                    f"Post-action status for {self.connector.name} ({fingerprint}): {connector_status}"
+                )
+            self._next_rule()
+            return None if self.done else 0
+        return None
+
+
+class RemediationScheduler:
+    """
+    Delayed queue of remediations: a heap keyed by the time the next step of each remediation is due.
+    A timer thread pops the due remediations and runs their step on the evaluation pool, then re-queues them
+    with the delay the step returned.
+    Only one remediation per connector can be in progress at any time.
+    """
+
+    def __init__(self, clock: Callable[[], float] = monotonic):
+        self.clock = clock
+        self._heap: list[tuple[float, int, Remediation]] = []
+        self._sequence = count()
+        self._condition = Condition()
+        self._in_progress: dict[tuple[str, str], Remediation] = {}
+        self._thread: Union[Thread, None] = None
+        self._running: bool = False
+        self.metrics: dict = {
+            "remediations_started": 0,
+            "remediations_completed": 0,
+            "remediations_actions_applied": 0,
+            "remediations_failed_steps": 0,
+        }
+        self._actions_applied: dict[str, int] = {}
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, daemon=True, name="remediations")
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+    def submit(self, remediation: Remediation) -> bool:
+        """Queues a new remediation. Returns False if the connector already has one in progress"""
+        if remediation.done:
+            return False
+        with self._condition:
+            if remediation.key in self._in_progress:
+                LOG.debug(f"{remediation} - remediation already in progress")
+                return False
+            self._in_progress[remediation.key] = remediation
+            self.metrics["remediations_started"] += 1
+            self._push(remediation, 0)
+        return True
+
+    def pending(self, cluster_name: str = None) -> int:
+        """Number of remediations in progress, for all clusters or the given one"""
+        with self._condition:
+            if cluster_name is None:
+                return len(self._in_progress)
+            return len([key for key in self._in_progress if key[0] == cluster_name])
+
+    def actions_applied(self, cluster_name: str) -> int:
+        """Number of corrective actions applied to the connectors of the cluster"""
+        with self._condition:
+            return self._actions_applied.get(cluster_name, 0)
+
+    def next_due(self) -> Union[float, None]:
+        with self._condition:
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self) -> list[Remediation]:
+        """Returns the remediations which next step is due"""
+        now = self.clock()
+        due: list[Remediation] = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def run_step(self, remediation: Remediation) -> None:
+        """Runs the remediation step, then re-queues it or marks it completed"""
+        try:
+            actions_applied = remediation.actions_applied
+            with remediation.cluster.timers.time("remediate"):
+                delay = remediation.step()
+            with self._condition:
+                actions_applied = remediation.actions_applied - actions_applied
+                self.metrics["remediations_actions_applied"] += actions_applied
+                self._actions_applied[remediation.cluster.name] = (
+                    self._actions_applied.get(remediation.cluster.name, 0)
+                    + actions_applied
+                )
+        except Exception as error:
+            LOG.exception(error)
+            LOG.error(f"{remediation} - remediation step failed")
+            with self._condition:
+                self.metrics["remediations_failed_steps"] += 1
+            delay = None
+        with self._condition:
+            if delay is None:
+                self._in_progress.pop(remediation.key, None)
+                self.metrics["remediations_completed"] += 1
+            else:
+                self._push(remediation, delay)
+
+    def _push(self, remediation: Remediation, delay: float) -> None:
+        heapq.heappush(
+            self._heap,
+            (self.clock() + delay, next(self._sequence), remediation),
+        )
+        self._condition.notify_all()
+
+    def _run(self) -> None:
+        evaluation_pool = get_evaluation_pool()
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                next_due = self._heap[0][0] if self._heap else None
+                if next_due is None or next_due > self.clock():
+                    self._condition.wait(
+                        None if next_due is None else next_due - self.clock()
+                    )
+                    continue
+            for remediation in self.pop_due():
+                evaluation_pool.submit(self.run_step, remediation)
+
+
+_REMEDIATION_SCHEDULER: Union[RemediationScheduler, None] = None
+_REMEDIATION_SCHEDULER_LOCK = Lock()
+
+
+def get_remediation_scheduler() -> RemediationScheduler:
+    """The remediation scheduler is shared by all the clusters, and started on first use"""
+    global _REMEDIATION_SCHEDULER
+    with _REMEDIATION_SCHEDULER_LOCK:
+        if _REMEDIATION_SCHEDULER is None:
+            _REMEDIATION_SCHEDULER = RemediationScheduler()
+            _REMEDIATION_SCHEDULER.start()
+        return _REMEDIATION_SCHEDULER
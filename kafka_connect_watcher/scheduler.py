@@ -0,0 +1,173 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Deadline based scheduling of the connect clusters scans
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Union
+
+if TYPE_CHECKING:
+    from kafka_connect_watcher.cluster import ConnectCluster
+
+import heapq
+import random
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+from kafka_connect_watcher.logger import LOG
+
+DEFAULT_JITTER_RATIO: float = 0.1
+
+
+def jitter(interval: float, jitter_ratio: float = DEFAULT_JITTER_RATIO) -> float:
+    """Returns the interval +/- jitter_ratio of itself"""
+    spread = interval * jitter_ratio
+    return max(0.0, interval + random.uniform(-spread, spread))
+
+
+class AdaptiveInterval:
+    """
+    Interval between the scans of a cluster, adapted to its activity:
+      * fast_interval while connectors are unhealthy or remediations are pending.
+      * the cluster interval after a scan with changes.
+      * multiplied by backoff_factor after every stable_cycles scans without changes, up to max_interval.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        fast_interval: float,
+        max_interval: float,
+        stable_cycles: int = 3,
+        backoff_factor: float = 2.0,
+    ):
+        self.base_interval = interval
+        self.fast_interval = min(fast_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.stable_cycles = max(1, stable_cycles)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.interval: float = interval
+        self._stable: int = 0
+
+    def update(self, changed: bool, unhealthy: bool) -> float:
+        """Adapts the interval to the last scan of the cluster, and returns it"""
+        if unhealthy:
+            self._stable = 0
+            self.interval = self.fast_interval
+        elif changed or self.interval < self.base_interval:
+            self._stable = 0
+            self.interval = self.base_interval
+        else:
+            self._stable += 1
+            if self._stable >= self.stable_cycles:
+                self._stable = 0
+                self.interval = min(
+                    self.max_interval, self.interval * self.backoff_factor
+                )
+        return self.interval
+
+
+class ClusterScheduler:
+    """
+    Keeps the connect clusters in a heap keyed by the time their next scan is due.
+    Each cluster is dispatched on its own interval, with jitter to spread the scans over time.
+    A cluster which previous scan is still in-flight when due is skipped until its next due time.
+    """
+
+    def __init__(
+        self,
+        clusters: list[ConnectCluster],
+        jitter_ratio: float = DEFAULT_JITTER_RATIO,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.jitter_ratio = max(0.0, min(jitter_ratio, 1.0))
+        self.clock = clock
+        self._heap: list[tuple[float, int, ConnectCluster]] = []
+        self._sequence = count()
+        self._in_flight: set[str] = set()
+        self._lock = Lock()
+        self.metrics: dict = {"scans_dispatched": 0, "scans_skipped": 0}
+        now = self.clock()
+        for cluster in clusters:
+            self.add(cluster, now + random.uniform(0, cluster.interval * jitter_ratio))
+
+    def __len__(self):
+        return len(self._heap)
+
+    def jitter(self, interval: float) -> float:
+        return jitter(interval, self.jitter_ratio)
+
+    def add(self, cluster: ConnectCluster, due: float = None) -> None:
+        with self._lock:
+            heapq.heappush(
+                self._heap,
+                (
+                    self.clock() if due is None else due,
+                    next(self._sequence),
+                    cluster,
+                ),
+            )
+
+    def remove(self, cluster_name: str) -> None:
+        """Stops scheduling the cluster. A scan in-flight runs to completion."""
+        with self._lock:
+            self._heap = [
+                _entry for _entry in self._heap if _entry[2].name != cluster_name
+            ]
+            heapq.heapify(self._heap)
+
+    def next_due(self) -> Union[float, None]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self) -> list[ConnectCluster]:
+        """
+        Returns the clusters due for a scan, and reschedules them for their next interval.
+        Clusters with a scan still in-flight are rescheduled without being returned.
+        """
+        now = self.clock()
+        due_clusters: list[ConnectCluster] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, cluster = heapq.heappop(self._heap)
+                next_due = due + self.jitter(cluster.interval)
+                if next_due <= now:
+                    next_due = now + self.jitter(cluster.interval)
+                heapq.heappush(self._heap, (next_due, next(self._sequence), cluster))
+                if cluster.name in self._in_flight:
+                    self.metrics["scans_skipped"] += 1
+                    LOG.warning(
+                        f"{cluster.name} - previous scan still in progress. Skipping."
+                    )
+                    continue
+                self._in_flight.add(cluster.name)
+                self.metrics["scans_dispatched"] += 1
+                due_clusters.append(cluster)
+        return due_clusters
+
+    def done(self, cluster: ConnectCluster) -> None:
+        """
+        Marks the cluster scan as finished, allowing the next one to be dispatched.
+        If the interval of the cluster was shortened by the scan, its next scan is brought forward.
+        """
+        with self._lock:
+            self._in_flight.discard(cluster.name)
+            now = self.clock()
+            latest_due = now + cluster.interval * (1 + self.jitter_ratio)
+            for index, (due, sequence, _cluster) in enumerate(self._heap):
+                if _cluster is cluster and due > latest_due:
+                    self._heap[index] = (
+                        now + self.jitter(cluster.interval),
+                        sequence,
+                        cluster,
+                    )
+                    heapq.heapify(self._heap)
+                    break
+
+    def in_flight(self, cluster: ConnectCluster) -> bool:
+        with self._lock:
+            return cluster.name in self._in_flight
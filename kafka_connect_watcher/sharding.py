@@ -0,0 +1,357 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Sharding of the clusters across processes and replicas.
+
+The clusters are assigned to the shards with a consistent hash ring of their names: adding or removing shards
+only moves the clusters of the shards which changed. A replica runs one shard (--shard-index/--shard-count),
+which can be split again across worker processes (--processes): each worker shard keeps the clusters of the
+replica shard, and splits them with a second ring over the processes only, so that the workers of a replica
+watch exactly the clusters of the replica, whatever the number of processes of the other replicas.
+The workers report their watcher metrics and Prometheus frames to the parent process, which merges them for
+the watcher-level EMF metrics and serves the Prometheus metrics of all the shards. The reports of a worker
+which stopped reporting expire after a few scan intervals.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Union
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+    from multiprocessing.queues import Queue
+
+    from kafka_connect_watcher.config import Config
+    from kafka_connect_watcher.watcher import Watcher
+
+import os
+import signal
+from bisect import bisect
+from dataclasses import dataclass, field
+from functools import lru_cache
+from hashlib import blake2b
+from multiprocessing import get_context
+from queue import Empty
+from time import monotonic
+
+from kafka_connect_watcher.aws_emf import handle_watcher_emf, init_emf_config
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.prometheus import get_metrics_registry, init_prometheus
+from kafka_connect_watcher.reload import ConfigWatcher
+
+DEFAULT_VIRTUAL_NODES: int = 128
+DEFAULT_STOP_TIMEOUT: float = 15.0
+REPORT_TTL_INTERVALS: int = 3
+MAX_METRICS_SUFFIXES: tuple[str, ...] = ("_max", "_max_ms")
+AVERAGE_METRICS_SUFFIXES: tuple[str, ...] = ("_avg", "_latency_ms")
+
+
+def ring_position(key: str) -> int:
+    return int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring of the shards, each placed at virtual_nodes positions"""
+
+    def __init__(self, shards: int, virtual_nodes: int = DEFAULT_VIRTUAL_NODES):
+        points: list[tuple[int, int]] = sorted(
+            (ring_position(f"shard-{_shard}-{_node}"), _shard)
+            for _shard in range(shards)
+            for _node in range(virtual_nodes)
+        )
+        self._positions: list[int] = [_point[0] for _point in points]
+        self._shards: list[int] = [_point[1] for _point in points]
+
+    def shard(self, key: str) -> int:
+        return self._shards[
+            bisect(self._positions, ring_position(key)) % len(self._shards)
+        ]
+
+
+@lru_cache(maxsize=8)
+def get_hash_ring(shards: int) -> HashRing:
+    return HashRing(shards)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Shard of the clusters. The shards of the worker processes have the replica shard as parent."""
+
+    index: int = 0
+    count: int = 1
+    parent: Union[Shard, None] = None
+
+    def __post_init__(self):
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError(
+                f"Invalid shard {self.index}/{self.count}: the index must be in [0, count)"
+            )
+
+    def __str__(self):
+        if self.parent is not None:
+            return f"{self.parent}:{self.index}/{self.count}"
+        return f"{self.index}/{self.count}"
+
+    def owns(self, cluster_name: str) -> bool:
+        if self.parent is not None and not self.parent.owns(cluster_name):
+            return False
+        return (
+            self.count == 1
+            or get_hash_ring(self.count).shard(cluster_name) == self.index
+        )
+
+    def split(self, processes: int) -> list[Shard]:
+        """The shards of the worker processes of this shard, splitting its clusters between them"""
+        return [Shard(_process, processes, self) for _process in range(processes)]
+
+    def select(self, config: Config) -> Config:
+        """Keeps the clusters of the configuration which belong to the shard"""
+        if self.count == 1 and self.parent is None:
+            return config
+        clusters: list[dict] = config.config["clusters"]
+        config.config["clusters"] = [
+            _cluster
+            for _cluster in clusters
+            if self.owns(ConnectCluster.definition_name(_cluster))
+        ]
+        LOG.info(
+            f"Shard {self} - watching {len(config.config['clusters'])} of {len(clusters)} clusters"
+        )
+        return config
+
+
+def merge_metrics(shards_metrics: Iterable[dict]) -> dict:
+    """Sums the watcher metrics of the shards. The maximums are merged as max, and averages as the mean."""
+    merged: dict = {}
+    averaged: dict[str, int] = {}
+    for shard_metrics in shards_metrics:
+        for metric_name, value in shard_metrics.items():
+            if metric_name not in merged:
+                merged[metric_name] = value
+            elif metric_name.endswith(MAX_METRICS_SUFFIXES):
+                merged[metric_name] = max(merged[metric_name], value)
+            else:
+                merged[metric_name] += value
+            if metric_name.endswith(AVERAGE_METRICS_SUFFIXES):
+                averaged[metric_name] = averaged.get(metric_name, 0) + 1
+    for metric_name, shards in averaged.items():
+        merged[metric_name] = round(merged[metric_name] / shards, 6)
+    return merged
+
+
+@dataclass
+class ShardReport:
+    shard_index: int
+    metrics: dict
+    frames: dict[str, dict[str, str]] = field(default_factory=dict)
+    received: float = field(default_factory=monotonic)
+
+
+class ShardReporter:
+    """Watcher metrics reporter of the worker processes: sends the metrics and frames to the parent process"""
+
+    def __init__(self, shard: Shard, reports: Queue):
+        self.shard = shard
+        self.reports = reports
+
+    def __call__(self, config: Config, watcher: Watcher) -> None:
+        self.reports.put(
+            ShardReport(
+                self.shard.index, dict(watcher.metrics), get_metrics_registry().frames()
+            )
+        )
+
+
+def run_shard(
+    config_file_path: str,
+    shard: Shard,
+    engine: str,
+    reload_interval: Union[float, None],
+    reports: Queue,
+) -> None:
+    """Entrypoint of the worker processes"""
+    from kafka_connect_watcher.config import Config
+
+    config = shard.select(Config(config_file_path))
+    config_watcher = ConfigWatcher(config_file_path, reload_interval, shard=shard)
+    config_watcher.install_signal_handler()
+    reporter = ShardReporter(shard, reports)
+    if engine == "async":
+        from kafka_connect_watcher.async_engine import AsyncWatcher
+
+        watcher = AsyncWatcher(reporter, serve_prometheus=False)
+    else:
+        from kafka_connect_watcher.watcher import Watcher
+
+        watcher = Watcher(reporter, serve_prometheus=False)
+    watcher.run(config, config_watcher)
+
+
+class ShardedWatcher:
+    """
+    Runs the watcher of each shard in its own process, restarting the processes which exit, and merges
+    their metrics. SIGHUP is forwarded to the worker processes, which each reload the configuration.
+    The parent process reloads it too, only to start the Prometheus server if enabled by the new configuration.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        shard: Shard = None,
+        engine: str = "threads",
+        reload_interval: Union[float, None] = None,
+    ):
+        signal.signal(signal.SIGINT, self.exit_gracefully)
+        signal.signal(signal.SIGTERM, self.exit_gracefully)
+        signal.signal(signal.SIGHUP, self.forward_signal)
+        self.keep_running: bool = True
+        self.shard: Shard = shard or Shard()
+        self.shards: list[Shard] = self.shard.split(max(1, processes))
+        self.engine = engine
+        self.reload_interval = reload_interval
+        self.config_watcher: Union[ConfigWatcher, None] = None
+        self.context = get_context("spawn")
+        self.reports: Union[Queue, None] = None
+        self.processes: dict[int, BaseProcess] = {}
+        self.shards_reports: dict[int, ShardReport] = {}
+        self.restarts: int = 0
+        self.metrics: dict = {}
+
+    def run(self, config: Config) -> None:
+        LOG.info(f"Initializing the watcher with {len(self.shards)} worker processes")
+        self.config_watcher = ConfigWatcher(
+            config.config_file_path, self.reload_interval, shard=self.shard
+        )
+        init_emf_config(config, [])
+        init_prometheus(config)
+        self.reports = self.context.Queue()
+        for shard in self.shards:
+            self.start_shard(config.config_file_path, shard)
+        next_watcher_emf: float = monotonic() + config.scan_intervals
+        try:
+            while self.keep_running:
+                if self.config_watcher.changed():
+                    config = self.reload(config)
+                try:
+                    self.handle_report(self.reports.get(timeout=1.0))
+                except Empty:
+                    pass
+                self.supervise(config.config_file_path)
+                if monotonic() >= next_watcher_emf:
+                    self.publish_metrics(config)
+                    next_watcher_emf = monotonic() + config.scan_intervals
+        except KeyboardInterrupt:
+            LOG.debug("\rExited due to Keyboard interrupt")
+        finally:
+            self.stop_shards()
+
+    def reload(self, config: Config) -> Config:
+        """
+        Reloads the configuration, to start the Prometheus server once enabled for any of the clusters.
+        The clusters are not created: the worker processes watch them, and reload their own configuration.
+        """
+        new_config = self.config_watcher.load()
+        if new_config is None:
+            return config
+        init_prometheus(new_config)
+        return new_config
+
+    def start_shard(self, config_file_path: str, shard: Shard) -> None:
+        process = self.context.Process(
+            target=run_shard,
+            args=(
+                config_file_path,
+                shard,
+                self.engine,
+                self.reload_interval,
+                self.reports,
+            ),
+            name=f"watcher-shard-{shard.index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[shard.index] = process
+        LOG.info(f"Shard {shard} - started worker process {process.pid}")
+
+    def supervise(self, config_file_path: str) -> None:
+        """Restarts the worker processes which exited"""
+        for shard in self.shards:
+            process = self.processes.get(shard.index)
+            if not self.keep_running or process is None or process.is_alive():
+                continue
+            LOG.error(
+                f"Shard {shard} - worker process {process.pid} exited ({process.exitcode}). Restarting"
+            )
+            self.restarts += 1
+            self.drop_report(shard.index)
+            self.start_shard(config_file_path, shard)
+
+    def handle_report(self, report: ShardReport) -> None:
+        """Keeps the latest metrics of the shard, and publishes its Prometheus frames"""
+        registry = get_metrics_registry()
+        previous = self.shards_reports.get(report.shard_index)
+        if previous is not None:
+            for cluster_name in previous.frames.keys() - report.frames.keys():
+                registry.remove(cluster_name)
+        for cluster_name, frame in report.frames.items():
+            registry.publish_frame(cluster_name, frame)
+        report.received = monotonic()
+        self.shards_reports[report.shard_index] = report
+
+    def drop_report(self, shard_index: int) -> None:
+        """Forgets the metrics of the shard, and removes its Prometheus frames"""
+        report = self.shards_reports.pop(shard_index, None)
+        if report is None:
+            return
+        registry = get_metrics_registry()
+        for cluster_name in report.frames:
+            registry.remove(cluster_name)
+
+    def expire_reports(self, max_age: float) -> None:
+        """Drops the reports of the shards which did not report for max_age seconds"""
+        now = monotonic()
+        for shard_index, report in list(self.shards_reports.items()):
+            if now - report.received > max_age:
+                LOG.warning(
+                    f"Shard {shard_index} - no report for {now - report.received:.0f}s. Dropping its metrics"
+                )
+                self.drop_report(shard_index)
+
+    def publish_metrics(self, config: Config) -> None:
+        self.expire_reports(REPORT_TTL_INTERVALS * config.scan_intervals)
+        self.metrics = merge_metrics(
+            _report.metrics for _report in self.shards_reports.values()
+        )
+        self.metrics.update(
+            {
+                "watcher_shards": len(self.shards),
+                "watcher_shards_reporting": len(self.shards_reports),
+                "watcher_shards_restarts": self.restarts,
+            }
+        )
+        LOG.debug(f"Watcher metrics: {self.metrics}")
+        handle_watcher_emf(config, self)
+
+    def forward_signal(self, signum, frame) -> None:
+        if self.config_watcher is not None:
+            self.config_watcher.request()
+        for process in self.processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    def stop_shards(self) -> None:
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = monotonic() + DEFAULT_STOP_TIMEOUT
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - monotonic()))
+            if process.is_alive():
+                LOG.warning(f"Killing worker process {process.pid}")
+                process.kill()
+        self.processes.clear()
+
+    def exit_gracefully(self, signum, frame) -> None:
+        self.keep_running = False
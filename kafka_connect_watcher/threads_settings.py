@@ -7,3 +7,11 @@ from os import cpu_count, environ
 NUM_THREADS: int = abs(int(environ.get("CONCURRENT_THREADS", cpu_count())))
 if NUM_THREADS <= 0:
     NUM_THREADS = 1
+
+EVALUATION_THREADS: int = abs(int(environ.get("EVALUATION_THREADS", NUM_THREADS)))
+if EVALUATION_THREADS <= 0:
+    EVALUATION_THREADS = 1
+
+EVALUATION_QUEUE_SIZE: int = abs(
+    int(environ.get("EVALUATION_QUEUE_SIZE", EVALUATION_THREADS * 64))
+)
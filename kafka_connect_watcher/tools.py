@@ -4,9 +4,83 @@
 from __future__ import annotations
 
 import re
+from typing import Union
 
+REGEX_SPECIAL_CHARACTERS: frozenset = frozenset(r".^$*+?{}[]\|()")
+MATCH_ALL_PATTERNS: tuple = (".*", "(.*)", ".*$", "(.*)$")
+ANY_SUFFIXES: tuple = ("(.*)", ".*")
+BACKREFERENCE = re.compile(r"\\[1-9]")
 
-def import_regexes(to_import: list[str]) -> list[re.Pattern]:
+
+def is_literal(pattern: str) -> bool:
+    return not REGEX_SPECIAL_CHARACTERS.intersection(pattern)
+
+
+class RegexMatcher:
+    """
+    Matches names against a list of regular expressions, with re.match semantics (anchored at the start).
+    Patterns which are plain names, plain names ending with $, or plain names followed by .* are matched
+    with set lookups & str.startswith. The other patterns are merged into a single alternation.
+    """
+
+    def __init__(self, patterns: list[re.Pattern]):
+        self.patterns = patterns
+        self.match_all: bool = False
+        self.exact: set[str] = set()
+        prefixes: list[str] = []
+        regexes: list[re.Pattern] = []
+        unmergeable: list[re.Pattern] = []
+        for regex in patterns:
+            pattern: str = regex.pattern
+            if regex.flags & ~re.UNICODE or BACKREFERENCE.search(pattern):
+                unmergeable.append(regex)
+                continue
+            pattern = pattern[1:] if pattern.startswith("^") else pattern
+            if pattern in MATCH_ALL_PATTERNS:
+                self.match_all = True
+            elif pattern.endswith("$") and is_literal(pattern[:-1]):
+                self.exact.add(pattern[:-1])
+            elif is_literal(pattern):
+                prefixes.append(pattern)
+            elif pattern.endswith(ANY_SUFFIXES) and is_literal(
+                prefix := pattern.removesuffix("(.*)").removesuffix(".*")
+            ):
+                prefixes.append(prefix)
+            else:
+                regexes.append(regex)
+        self.prefixes: tuple[str, ...] = tuple(prefixes)
+        self.regexes: list[re.Pattern] = self.merge(regexes) + unmergeable
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    @staticmethod
+    def merge(regexes: list[re.Pattern]) -> list[re.Pattern]:
+        """Merges the patterns into one alternation. Keeps them apart if that fails, i.e. duplicate group names"""
+        if len(regexes) < 2:
+            return regexes
+        try:
+            return [re.compile("|".join(f"(?:{regex.pattern})" for regex in regexes))]
+        except re.error:
+            return regexes
+
+    def match(self, name: str) -> bool:
+        if self.match_all or name in self.exact:
+            return True
+        if self.prefixes and name.startswith(self.prefixes):
+            return True
+        for regex in self.regexes:
+            if regex.match(name):
+                return True
+        return False
+
+
+def import_regexes(to_import: Union[list[str], str]) -> RegexMatcher:
+    if isinstance(to_import, str):
+        to_import = [to_import]
     compiled_regexes: list[re.Pattern] = []
     for regex in to_import:
         try:
@@ -15,4 +89,4 @@ def import_regexes(to_import: list[str]) -> list[re.Pattern]:
         except Exception as error:
             print(regex)
             print(error)
-    return compiled_regexes
+    return RegexMatcher(compiled_regexes)
@@ -0,0 +1,114 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Fingerprinting of the connectors error traces.
+
+The traces are normalised (timestamps, ids, addresses, offsets and other numbers stripped) before being hashed,
+so that the same failure, repeated across tasks and scans, has the same fingerprint.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+from time import monotonic
+from typing import Callable, Hashable, Union
+
+DEFAULT_FINGERPRINTS_CACHE_SIZE: int = 4096
+
+NORMALIZATIONS: tuple[tuple[re.Pattern, str], ...] = (
+    (
+        re.compile(
+            r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+        ),
+        "<ts>",
+    ),
+    (
+        re.compile(
+            r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"
+        ),
+        "<id>",
+    ),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<hex>"),
+    (re.compile(r"@[0-9a-fA-F]{4,}\b"), "@<hex>"),
+    (re.compile(r"\d+"), "<n>"),
+)
+
+
+def normalize_trace(trace: str) -> str:
+    for pattern, replacement in NORMALIZATIONS:
+        trace = pattern.sub(replacement, trace)
+    return trace.strip()
+
+
+def status_traces(connector_status: Union[dict, str]) -> list[str]:
+    """The traces of the connector and of its tasks"""
+    if not isinstance(connector_status, dict):
+        return []
+    traces: list[str] = [connector_status.get("connector", {}).get("trace", "")]
+    traces += [_task.get("trace", "") for _task in connector_status.get("tasks", [])]
+    return [_trace for _trace in traces if _trace]
+
+
+def trace_fingerprint(connector_status: Union[dict, str]) -> str:
+    """
+    Hash of the distinct normalised traces of the connector and its tasks.
+    Falls back to the connector state when there is no trace.
+    """
+    traces = sorted(
+        {normalize_trace(_trace) for _trace in status_traces(connector_status)}
+    )
+    if not traces:
+        traces = [
+            (
+                connector_status.get("connector", {}).get("state", "UNKNOWN")
+                if isinstance(connector_status, dict)
+                else str(connector_status)
+            )
+        ]
+    return blake2b("\n".join(traces).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class FingerprintCache:
+    """
+    LRU of the fingerprints seen in the last ttl seconds, counting their repeats.
+    A fingerprint is admitted again once its ttl expired, with the number of repeats suppressed meanwhile.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = DEFAULT_FINGERPRINTS_CACHE_SIZE,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: OrderedDict[Hashable, list] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def admit(self, key: Hashable) -> Union[int, None]:
+        """
+        Returns None if the key was admitted less than ttl seconds ago: the repeat is counted and suppressed.
+        Otherwise, admits the key and returns the number of repeats suppressed since it was last admitted.
+        """
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                entry[1] += 1
+                self._entries.move_to_end(key)
+                return None
+            repeats: int = entry[1] if entry is not None else 0
+            self._entries[key] = [now + self.ttl, 0]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return repeats
@@ -7,74 +7,104 @@ Main entrypoint of the python watcher
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Union
 
 if TYPE_CHECKING:
     from kafka_connect_watcher.config import Config
 
 import signal
-import threading
-from datetime import datetime as dt
-from queue import Queue
-from time import sleep
+from time import monotonic, perf_counter, sleep
 
 from kafka_connect_watcher.aws_emf import (
     handle_watcher_emf,
     init_emf_config,
     publish_clusters_emf,
 )
-from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.circuit_breaker import circuit_breakers_metrics
+from kafka_connect_watcher.cluster import (
+    ClusterSnapshot,
+    ConnectCluster,
+    ConnectorState,
+)
+from kafka_connect_watcher.http_client import transport_metrics
+from kafka_connect_watcher.instrumentation import (
+    get_sampling_profiler,
+    instrumentation_metrics,
+)
+from kafka_connect_watcher.leases import get_lease_manager, init_leases
 from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.notifications import (
+    get_notification_pipeline,
+    init_notifications,
+)
+from kafka_connect_watcher.prometheus import (
+    get_metrics_registry,
+    init_prometheus,
+    publish_cluster_prometheus,
+)
+from kafka_connect_watcher.reload import ConfigWatcher, reload_clusters
+from kafka_connect_watcher.remediation import get_remediation_scheduler
+from kafka_connect_watcher.scheduler import ClusterScheduler
 from kafka_connect_watcher.threads_settings import NUM_THREADS
-
-FOREVER = 42
+from kafka_connect_watcher.workers import WorkerPool, get_evaluation_pool
 
 
 class Watcher:
     """
     The Watcher class is the entry point to the program cycling over the different connect cluster, collecting metrics,
     handling exceptions and graceful shutdowns.
+    The watcher metrics are published with metrics_reporter, every scan interval.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        metrics_reporter: Callable[[Config, Watcher], None] = handle_watcher_emf,
+        serve_prometheus: bool = True,
+    ):
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
         self.keep_running: bool = True
-        self.connect_clusters_processing_queue = Queue()
-        self._threads: list[threading.Thread] = []
+        self.metrics_reporter = metrics_reporter
+        self.serve_prometheus = serve_prometheus
+        self.cluster_workers: WorkerPool = WorkerPool(
+            "cluster_workers", NUM_THREADS, process_cluster
+        )
+        self.scheduler: Union[ClusterScheduler, None] = None
+        self.clusters: dict[str, ConnectCluster] = {}
         self.metrics: dict = {
             "connect_clusters_total": 0,
             "connect_clusters_healthy": 0,
             "connect_clusters_unhealthy": 0,
         }
 
-    def run(self, config: Config):
+    def run(self, config: Config, config_watcher: ConfigWatcher = None):
         LOG.info("Initializing the watcher")
+        get_sampling_profiler()
         clusters: list[ConnectCluster] = [
             ConnectCluster(cluster, config) for cluster in config.config["clusters"]
         ]
+        self.clusters = {cluster.name: cluster for cluster in clusters}
         self.metrics.update({"connect_clusters_total": len(clusters)})
-        init_emf_config(config)
+        init_emf_config(config, clusters)
+        if self.serve_prometheus:
+            init_prometheus(config)
+        init_notifications(config)
+        init_leases(config)
         LOG.info("Watcher clusters initialized.")
-        for _ in range(NUM_THREADS):
-            _thread = threading.Thread(
-                target=process_cluster,
-                daemon=True,
-                args=(self.connect_clusters_processing_queue,),
-            )
-            _thread.start()
-            self._threads.append(_thread)
+        self.cluster_workers.start()
         LOG.info(
             "Watcher threads ({}) initialized. Processing clusters & evaluation rules.".format(
                 NUM_THREADS
             )
         )
+        self.scheduler = ClusterScheduler(clusters)
+        next_watcher_emf: float = monotonic() + config.scan_intervals
         try:
             while self.keep_running:
-                now = dt.now()
-                LOG.info("Clusters processing started")
-                for connect_cluster in clusters:
-                    self.connect_clusters_processing_queue.put(
+                if config_watcher is not None and config_watcher.changed():
+                    config = self.reload(config, config_watcher)
+                for connect_cluster in self.scheduler.pop_due():
+                    self.cluster_workers.put(
                         [
                             self,
                             config,
@@ -82,56 +112,151 @@ class Watcher:
                         ],
                         False,
                     )
-                self.connect_clusters_processing_queue.join()
-                LOG.info(
-                    "Clusters processing finished - {}s".format(
-                        (dt.now() - now).total_seconds()
+                if monotonic() >= next_watcher_emf:
+                    self.metrics.update(self.cluster_workers.metrics)
+                    self.metrics.update(get_evaluation_pool().metrics)
+                    self.metrics.update(get_remediation_scheduler().metrics)
+                    self.metrics.update(get_notification_pipeline().metrics)
+                    self.metrics.update(get_lease_manager().metrics)
+                    self.metrics.update(instrumentation_metrics(self.clusters.values()))
+                    self.metrics.update(transport_metrics(self.clusters.values()))
+                    self.metrics.update(
+                        circuit_breakers_metrics(self.clusters.values())
                     )
+                    self.metrics_reporter(config, self)
+                    LOG.debug(f"Watcher metrics: {self.metrics}")
+                    self.metrics.update(
+                        {"connect_clusters_healthy": 0, "connect_clusters_unhealthy": 0}
+                    )
+                    next_watcher_emf = monotonic() + config.scan_intervals
+                next_due = self.scheduler.next_due()
+                wait = (
+                    next_watcher_emf
+                    if next_due is None
+                    else min(next_due, next_watcher_emf)
                 )
-                if config.emf_watcher_config:
-                    handle_watcher_emf(config, self)
-                for _second in range(1, config.scan_intervals):
-                    sleep(1)
-                    if not self.keep_running:
-                        break
-                self.metrics.update(
-                    {"connect_clusters_healthy": 0, "connect_clusters_unhealthy": 0}
-                )
-                LOG.debug(f"Watcher metrics: {self.metrics}")
+                sleep(min(1.0, max(0.0, wait - monotonic())))
         except KeyboardInterrupt:
             self.keep_running = False
             LOG.debug("\rExited due to Keyboard interrupt")
+        finally:
+            self.cluster_workers.shutdown(wait=False)
+            get_notification_pipeline().shutdown()
+            get_lease_manager().shutdown()
+            profiler = get_sampling_profiler()
+            if profiler is not None:
+                profiler.shutdown()
+
+    def reload(self, config: Config, config_watcher: ConfigWatcher) -> Config:
+        """
+        Applies the new configuration to the clusters and their scheduling. Returns the running configuration,
+        which is the new one unless it could not be loaded.
+        """
+        new_config = config_watcher.load()
+        if new_config is None:
+            return config
+        changes = reload_clusters(self.clusters, config, new_config)
+        for connect_cluster in changes.removed:
+            self.scheduler.remove(connect_cluster.name)
+            get_metrics_registry().remove(connect_cluster.name)
+            get_lease_manager().release(connect_cluster.name)
+            connect_cluster.transport.close()
+        for previous_cluster, connect_cluster in changes.rebuilt:
+            self.scheduler.remove(previous_cluster.name)
+            self.scheduler.add(connect_cluster)
+            get_lease_manager().refresh_ttl(connect_cluster)
+            previous_cluster.transport.close()
+        for connect_cluster in changes.added:
+            self.scheduler.add(connect_cluster)
+        for connect_cluster in changes.reconfigured:
+            get_lease_manager().refresh_ttl(connect_cluster)
+        self.clusters = changes.clusters
+        self.metrics.update({"connect_clusters_total": len(self.clusters)})
+        init_notifications(new_config)
+        if self.serve_prometheus:
+            init_prometheus(new_config)
+        return new_config
 
     def exit_gracefully(self, pid, pelse):
         print(pid, pelse)
         self.keep_running = False
+        self.cluster_workers.shutdown(wait=False)
         exit(0)
 
 
 def process_error_rules(
-    handling_rule, connect_cluster: ConnectCluster, watcher: Watcher
-):
+    handling_rule,
+    connect_cluster: ConnectCluster,
+    snapshot: ClusterSnapshot,
+    connectors: list[ConnectorState],
+) -> bool:
     try:
-        handling_rule.execute(connect_cluster)
-        watcher.metrics["connect_clusters_healthy"] += 1
+        handling_rule.execute(connect_cluster, snapshot, connectors)
+        return True
     except Exception as error:
-        watcher.metrics["connect_clusters_unhealthy"] += 1
         LOG.exception(error)
         LOG.error(f"Failed to process the cluster {connect_cluster.name}")
+        return False
+
+
+def process_connect_cluster(connect_cluster: ConnectCluster, watcher: Watcher):
+    """
+    Scans the cluster once and evaluates the connectors against the rules matching them.
+    Clusters which circuit breaker is open are skipped, until their probe is due.
+    """
+    start = perf_counter()
+    if not connect_cluster.available():
+        watcher.metrics["connect_clusters_unhealthy"] += 1
+        publish_cluster_prometheus(connect_cluster)
+        return
+    try:
+        with connect_cluster.timers.time("fetch"):
+            snapshot = connect_cluster.scan()
+        with connect_cluster.timers.time("filter"):
+            routes = connect_cluster.route_connectors(snapshot)
+    except Exception as error:
+        watcher.metrics["connect_clusters_unhealthy"] += 1
+        LOG.exception(error)
+        LOG.error(f"Failed to scan the cluster {connect_cluster.name}")
+        publish_cluster_prometheus(connect_cluster)
+        return
+    healthy: bool = True
+    for handling_rule, connectors in routes.items():
+        healthy &= process_error_rules(
+            handling_rule, connect_cluster, snapshot, connectors
+        )
+    if healthy:
+        watcher.metrics["connect_clusters_healthy"] += 1
+    else:
+        watcher.metrics["connect_clusters_unhealthy"] += 1
+    connect_cluster.adapt_interval()
+    with connect_cluster.timers.time("publish"):
+        publish_cluster_metrics(connect_cluster)
+    LOG.info(
+        f"{connect_cluster.name} - Cluster processing finished - {perf_counter() - start:.3f}s"
+    )
+
+
+def publish_cluster_metrics(connect_cluster: ConnectCluster) -> None:
     try:
         if connect_cluster.emf_config:
             publish_clusters_emf(connect_cluster)
     except Exception as error:
         LOG.exception(error)
         LOG.error(f"Failed to export EMF metrics for cluster {connect_cluster.name}")
+    try:
+        publish_cluster_prometheus(connect_cluster)
+    except Exception as error:
+        LOG.exception(error)
+        LOG.error(
+            f"Failed to export prometheus metrics for cluster {connect_cluster.name}"
+        )
 
 
-def process_cluster(queue: Queue):
-    while FOREVER:
-        if not queue.empty():
-            watcher, config, connect_cluster = queue.get()
-            if connect_cluster is None:
-                break
-            for handling_rule in connect_cluster.handling_rules:
-                process_error_rules(handling_rule, connect_cluster, watcher)
-            queue.task_done()
+def process_cluster(work_item: list) -> None:
+    """Processes a cluster dispatched by the scheduler to the cluster workers"""
+    watcher, config, connect_cluster = work_item
+    try:
+        process_connect_cluster(connect_cluster, watcher)
+    finally:
+        watcher.scheduler.done(connect_cluster)
@@ -0,0 +1,197 @@
+#   SPDX-License-Identifier: Apache-2.0
+#   Copyright 2023 John "Preston" Mille <john@ews-network.net>
+
+"""
+Pools of worker threads consuming work items from a queue
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from time import monotonic, thread_time
+from typing import Any, Callable, Union
+
+from kafka_connect_watcher.logger import LOG
+from kafka_connect_watcher.threads_settings import (
+    EVALUATION_QUEUE_SIZE,
+    EVALUATION_THREADS,
+)
+
+_SHUTDOWN = object()
+
+
+class _WorkItem:
+    __slots__ = ("future", "function", "args", "kwargs", "enqueued_at")
+
+    def __init__(self, future: Future, function: Callable, args: tuple, kwargs: dict):
+        self.future = future
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = monotonic()
+
+
+class WorkerPool:
+    """
+    Fixed size pool of long-lived threads processing the work submitted to its queue.
+    Workers block on the queue (with a timeout to check for stop) instead of polling it, and exit
+    on a sentinel value sent for each of them on shutdown.
+    With max_queue_size, submitting blocks while the queue is full, applying back-pressure to the producers.
+    The CPU time the workers spent while waiting for work is tracked as idle_cpu_seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        handler: Callable[[Any], None] = None,
+        poll_timeout: float = 1.0,
+        max_queue_size: int = 0,
+    ):
+        self.name = name
+        self.size = max(1, size)
+        self.handler = handler
+        self.poll_timeout = poll_timeout
+        self._queue: Queue = Queue(maxsize=max(0, max_queue_size))
+        self._threads: list[Thread] = []
+        self._stop = Event()
+        self._metrics_lock = Lock()
+        self._idle_cpu_seconds: float = 0.0
+        self._busy_cpu_seconds: float = 0.0
+        self._processed: int = 0
+        self._queue_wait_seconds: float = 0.0
+        self._latency_seconds: float = 0.0
+        self._latency_max_seconds: float = 0.0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._threads)
+
+    def start(self) -> None:
+        for index in range(self.size):
+            _thread = Thread(target=self._run, daemon=True, name=f"{self.name}-{index}")
+            _thread.start()
+            self._threads.append(_thread)
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """Queues the function to be executed by one of the workers. Blocks while the queue is full."""
+        future: Future = Future()
+        self._queue.put(_WorkItem(future, function, args, kwargs))
+        return future
+
+    def put(self, item: Any, block: bool = True, timeout: float = None) -> Future:
+        """Queues the item to be processed by the pool handler"""
+        future: Future = Future()
+        self._queue.put(_WorkItem(future, self.handler, (item,), {}), block, timeout)
+        return future
+
+    def join(self) -> None:
+        """Waits for all the items put in the queue to be processed"""
+        self._queue.join()
+
+    def shutdown(self, wait: bool = True, timeout: float = None) -> None:
+        """Sends one sentinel per worker, which exits once the items queued before it are processed"""
+        if not wait:
+            self._stop.set()
+        for _ in self._threads:
+            try:
+                self._queue.put(_SHUTDOWN, block=wait)
+            except Exception:
+                break
+        if wait:
+            for _thread in self._threads:
+                _thread.join(timeout)
+        self._threads = []
+
+    @property
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            processed = max(1, self._processed)
+            return {
+                f"{self.name}_workers": self.size,
+                f"{self.name}_queue_depth": self._queue.qsize(),
+                f"{self.name}_processed": self._processed,
+                f"{self.name}_idle_cpu_seconds": round(self._idle_cpu_seconds, 6),
+                f"{self.name}_busy_cpu_seconds": round(self._busy_cpu_seconds, 6),
+                f"{self.name}_queue_wait_seconds_avg": round(
+                    self._queue_wait_seconds / processed, 6
+                ),
+                f"{self.name}_task_latency_seconds_avg": round(
+                    self._latency_seconds / processed, 6
+                ),
+                f"{self.name}_task_latency_seconds_max": round(
+                    self._latency_max_seconds, 6
+                ),
+            }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            idle_start = thread_time()
+            try:
+                item: Union[_WorkItem, object] = self._queue.get(
+                    timeout=self.poll_timeout
+                )
+            except Empty:
+                self._record(idle=thread_time() - idle_start)
+                continue
+            busy_start = thread_time()
+            self._record(idle=busy_start - idle_start)
+            if item is _SHUTDOWN:
+                self._queue.task_done()
+                break
+            started_at = monotonic()
+            try:
+                if item.future.set_running_or_notify_cancel():
+                    item.future.set_result(item.function(*item.args, **item.kwargs))
+            except Exception as error:
+                LOG.exception(error)
+                LOG.error(f"{self.name} - failed to process {item.args}")
+                item.future.set_exception(error)
+            finally:
+                finished_at = monotonic()
+                self._record(
+                    busy=thread_time() - busy_start,
+                    processed=1,
+                    queue_wait=started_at - item.enqueued_at,
+                    latency=finished_at - item.enqueued_at,
+                )
+                self._queue.task_done()
+
+    def _record(
+        self,
+        idle: float = 0.0,
+        busy: float = 0.0,
+        processed: int = 0,
+        queue_wait: float = 0.0,
+        latency: float = 0.0,
+    ):
+        with self._metrics_lock:
+            self._idle_cpu_seconds += idle
+            self._busy_cpu_seconds += busy
+            self._processed += processed
+            self._queue_wait_seconds += queue_wait
+            self._latency_seconds += latency
+            self._latency_max_seconds = max(self._latency_max_seconds, latency)
+
+
+_EVALUATION_POOL: Union[WorkerPool, None] = None
+_EVALUATION_POOL_LOCK = Lock()
+
+
+def get_evaluation_pool() -> WorkerPool:
+    """
+    The evaluation pool is shared by all the EvaluationRule and AutoCorrectRule of all clusters,
+    created & started on first use, and kept for the lifetime of the process.
+    """
+    global _EVALUATION_POOL
+    with _EVALUATION_POOL_LOCK:
+        if _EVALUATION_POOL is None:
+            _EVALUATION_POOL = WorkerPool(
+                "evaluation_workers",
+                EVALUATION_THREADS,
+                max_queue_size=EVALUATION_QUEUE_SIZE,
+            )
+            _EVALUATION_POOL.start()
+        return _EVALUATION_POOL
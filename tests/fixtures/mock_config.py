@@ -1,3 +1,6 @@
+from kafka_connect_watcher.instrumentation import PhaseTimers
+
+
 class MockClusterConfig:
     def __init__(self):
         self.name = "cluster_config_name"
@@ -13,6 +16,7 @@ class MockConnectCluster:
     def __init__(self):
         self.name = "connect_cluster_name"
         self.metrics = {"connectors": {}}
+        self.timers = PhaseTimers()
 
 
 class MockTask:
@@ -33,5 +37,9 @@ class MockConnector:
         self.state = state
         self.tasks = tasks
 
+    @property
+    def handle(self):
+        return self
+
     def cycle_connector(self):
         pass
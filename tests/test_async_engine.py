@@ -0,0 +1,93 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from kafka_connect_api.errors import GenericNotFound
+
+from kafka_connect_watcher.async_engine import execute_rule, scan_cluster
+from kafka_connect_watcher.cluster import ConnectCluster
+
+from .test_cluster import EXPANDED_PAYLOAD
+
+
+class MockAsyncClient:
+    def __init__(self, responses: dict):
+        self.responses = responses
+        self.queries: list[str] = []
+
+    async def get(self, query_path):
+        self.queries.append(query_path)
+        return self.responses[query_path]
+
+    async def run_sync(self, function, *args):
+        return function(*args)
+
+
+def test_async_scan_and_evaluate():
+    connect_cluster = ConnectCluster(
+        {
+            "hostname": "localhost",
+            "evaluation_rules": [{"include_regex": ["connector-(.*)"]}],
+        },
+        {},
+    )
+    client = MockAsyncClient(
+        {"/connectors?expand=status&expand=info": EXPANDED_PAYLOAD}
+    )
+    rule = connect_cluster.handling_rules[0]
+    rule.ignore_paused = True
+
+    async def process():
+        snapshot = await scan_cluster(connect_cluster, client)
+        routes = connect_cluster.route_connectors(snapshot)
+        return await execute_rule(rule, connect_cluster, client, snapshot, routes[rule])
+
+    assert asyncio.run(process())
+    assert client.queries == ["/connectors?expand=status&expand=info"]
+    assert connect_cluster.metrics["total"] == 2
+    assert connect_cluster.metrics["paused"] == 1
+    assert connect_cluster.metrics["failed"] == 1
+
+
+def test_async_failed_cycle_does_not_abort_the_rule():
+    connect_cluster = ConnectCluster(
+        {"hostname": "localhost", "evaluation_rules": [{"ignore_paused": False}]}, {}
+    )
+    client = MockAsyncClient(
+        {"/connectors?expand=status&expand=info": EXPANDED_PAYLOAD}
+    )
+    rule = connect_cluster.handling_rules[0]
+
+    async def process():
+        snapshot = await scan_cluster(connect_cluster, client)
+        routes = connect_cluster.route_connectors(snapshot)
+        for connector in routes[rule]:
+            connector.handle.cycle_connector = MagicMock(
+                side_effect=ConnectionError("reset by peer")
+            )
+        return await execute_rule(rule, connect_cluster, client, snapshot, routes[rule])
+
+    assert asyncio.run(process())
+    assert connect_cluster.metrics["paused"] == 1
+    assert connect_cluster.metrics["failed"] == 2
+
+
+def test_async_scan_without_expand_counts_rest_calls():
+    connect_cluster = ConnectCluster({"hostname": "localhost"}, {})
+    client = MockAsyncClient(
+        {
+            "/connectors?expand=status&expand=info": ["connector-a", "deleted"],
+            "/connectors/connector-a/status": EXPANDED_PAYLOAD["connector-a"]["status"],
+            "/connectors/connector-a": EXPANDED_PAYLOAD["connector-a"]["info"],
+        }
+    )
+
+    async def get(query_path):
+        client.queries.append(query_path)
+        if "deleted" in query_path:
+            raise GenericNotFound(404, (query_path,))
+        return client.responses[query_path]
+
+    client.get = get
+    snapshot = asyncio.run(scan_cluster(connect_cluster, client))
+    assert set(snapshot.connectors) == {"connector-a"}
+    assert snapshot.rest_calls == len(client.queries) == 5
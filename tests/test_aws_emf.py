@@ -0,0 +1,98 @@
+import json
+from unittest.mock import MagicMock
+
+from aws_embedded_metrics.environment.local_environment import LocalEnvironment
+from aws_embedded_metrics.serializers.log_serializer import LogSerializer
+from aws_embedded_metrics.sinks.agent_sink import AgentSink
+from aws_embedded_metrics.sinks.stdout_sink import StdoutSink
+
+from kafka_connect_watcher.aws_emf import publish_clusters_emf
+from kafka_connect_watcher.cluster import ConnectCluster
+from tests.test_cluster import EXPANDED_PAYLOAD
+
+
+def emf_cluster() -> ConnectCluster:
+    connect_cluster = ConnectCluster(
+        {
+            "hostname": "localhost",
+            "name": "cluster-a",
+            "evaluation_rules": [{"ignore_paused": True}],
+            "metrics": {
+                "aws_emf": {
+                    "enabled": True,
+                    "namespace": "KafkaConnect",
+                    "dimensions": {"Env": "test"},
+                }
+            },
+        },
+        {},
+    )
+    connect_cluster._api.get = MagicMock(return_value=EXPANDED_PAYLOAD)
+    snapshot = connect_cluster.scan()
+    (rule,) = connect_cluster.handling_rules
+    rule.execute(
+        connect_cluster, snapshot, connect_cluster.route_connectors(snapshot)[rule]
+    )
+    return connect_cluster
+
+
+def test_publish_clusters_emf_single_write(capsys):
+    connect_cluster = emf_cluster()
+    environment = LocalEnvironment()
+    environment.get_sink = MagicMock(return_value=environment.get_sink())
+    publish_clusters_emf(connect_cluster, environment)
+    documents = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert documents[0].get("ConnectorName") is None
+    assert sorted(document.get("ConnectorName") for document in documents[1:]) == [
+        "connector-a",
+        "connector-b",
+    ]
+    assert all(document["Env"] == "test" for document in documents)
+    assert documents[0]["failed"] == 1
+    assert documents[1]["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "KafkaConnect"
+    assert documents[1]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["Env", "ConnectorName", "ConnectCluster"]
+    ]
+    environment.get_sink.assert_called_once()
+
+    snapshot = connect_cluster.scan()
+    connect_cluster.route_connectors(snapshot)
+    publish_clusters_emf(connect_cluster, environment)
+    documents = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert documents[0].get("ConnectorName") is None
+    assert sorted(document.get("ConnectorName") for document in documents[1:]) == [
+        "connector-a",
+        "connector-b",
+    ]
+
+
+def test_emf_sinks_internals():
+    """EmfWriter relies on these internals of aws-embedded-metrics, to check when upgrading the library"""
+    from aws_embedded_metrics.environment.environment_detector import (
+        resolve_environment_sync,
+    )
+
+    assert callable(resolve_environment_sync)
+    agent_sink = AgentSink("kafka/connect/watcher/metrics", "stream")
+    assert agent_sink.log_group_name == "kafka/connect/watcher/metrics"
+    assert agent_sink.log_steam_name == "stream"
+    assert callable(agent_sink.client.send_message)
+    for sink in (agent_sink, StdoutSink()):
+        assert callable(sink.serializer.serialize)
+
+
+def test_publish_clusters_emf_agent_sink():
+    connect_cluster = emf_cluster()
+    sink = MagicMock(spec=AgentSink)
+    sink.serializer = LogSerializer()
+    sink.log_group_name = "kafka/connect/watcher/metrics"
+    sink.log_steam_name = None
+    sink.client = MagicMock()
+    environment = MagicMock()
+    environment.get_sink.return_value = sink
+    publish_clusters_emf(connect_cluster, environment)
+    sink.client.send_message.assert_called_once()
+    sink.accept.assert_not_called()
+    lines = sink.client.send_message.call_args.args[0].decode().splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[0])["_aws"]["LogGroupName"] == sink.log_group_name
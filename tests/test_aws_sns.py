@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from botocore.stub import ANY, Stubber
+
+from kafka_connect_watcher.aws_sns import SnsChannel
+from kafka_connect_watcher.notifications import NotificationPipeline
+from tests.fixtures.mock_config import MockConnectCluster, MockConnector
+
+TOPIC_ARN = "arn:aws:sns:eu-west-1:123456789012:connect-alerts"
+
+
+def test_send_error_notification_reuses_client_and_templates(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    pipeline = NotificationPipeline()
+    monkeypatch.setattr(
+        "kafka_connect_watcher.aws_sns.get_notification_pipeline", lambda: pipeline
+    )
+    channel = SnsChannel("alerts", {"topic_arn": TOPIC_ARN, "dedupe_ttl": "0s"})
+    assert channel.client is channel.client
+    assert channel.client.meta.region_name == "eu-west-1"
+    connector = MockConnector(name="connector-a")
+    connector_state = MagicMock(status={"connector": {"state": "FAILED"}})
+    with Stubber(channel.client) as stubber, patch(
+        "kafka_connect_watcher.aws_sns.JINJA_ENV.from_string"
+    ) as from_string:
+        for _ in range(2):
+            stubber.add_response(
+                "publish",
+                {"MessageId": "id"},
+                {
+                    "TopicArn": TOPIC_ARN,
+                    "Subject": "Kafka Connect error for connector-a",
+                    "Message": ANY,
+                    "MessageStructure": "json",
+                },
+            )
+            channel.send_error_notification(
+                MockConnectCluster(), connector, connector_state
+            )
+        pipeline.shutdown()
+        stubber.assert_no_pending_responses()
+        from_string.assert_not_called()
+
+
+def test_assume_role_credentials_are_deferred_and_refreshable():
+    channel = SnsChannel(
+        "alerts",
+        {"topic_arn": TOPIC_ARN, "role_arn": "arn:aws:iam::123456789012:role/sns"},
+    )
+    expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+    with patch.object(
+        SnsChannel,
+        "assume_role_credentials",
+        return_value={
+            "access_key": "key",
+            "secret_key": "secret",
+            "token": "token",
+            "expiry_time": expiration.isoformat(),
+        },
+    ) as assume_role:
+        session = channel.session
+        assert channel.session is session
+        assume_role.assert_not_called()
+        assert session.get_credentials().method == "sns-channel-assume-role"
+        credentials = session.get_credentials().get_frozen_credentials()
+        assert credentials.access_key == "key"
+        session.get_credentials().get_frozen_credentials()
+        assume_role.assert_called_once()
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from requests.exceptions import ConnectionError
+
+from kafka_connect_watcher.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    circuit_breakers_metrics,
+)
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.watcher import process_connect_cluster
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_breaker_states():
+    clock = MockClock()
+    breaker = CircuitBreaker(
+        failure_threshold=2, probe_interval=10, max_probe_interval=30, clock=clock
+    )
+    assert breaker.record_failure() == CLOSED
+    assert breaker.allow()
+    assert breaker.record_failure() == OPEN
+    assert not breaker.allow()
+    assert breaker.probe_in() == 10
+
+    clock.now = 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    assert breaker.record_failure() == OPEN
+    assert breaker.probe_delay == 20
+
+    clock.now = 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.probe_delay == 30
+
+    clock.now = 60
+    assert breaker.allow()
+    assert breaker.record_success() == HALF_OPEN
+    assert breaker.is_closed
+    assert breaker.probe_delay == 10
+    assert breaker.metrics == {
+        "circuit_breaker_opened": 1,
+        "circuit_breaker_probes": 3,
+        "cluster_scans_skipped": 2,
+    }
+
+
+def test_unreachable_cluster_skipped_until_probe_succeeds():
+    clock = MockClock()
+    connect_cluster = ConnectCluster(
+        {
+            "hostname": "localhost",
+            "interval": 30,
+            "circuit_breaker": {"failure_threshold": 2, "probe_interval": "10s"},
+            "evaluation_rules": [{"ignore_paused": True}],
+        },
+        {},
+    )
+    connect_cluster.circuit_breaker.clock = clock
+    connect_cluster._api.get = MagicMock(side_effect=ConnectionError("refused"))
+    connect_cluster._api.get_raw = MagicMock(side_effect=ConnectionError("refused"))
+    watcher = SimpleNamespace(
+        metrics={"connect_clusters_healthy": 0, "connect_clusters_unhealthy": 0}
+    )
+
+    for _ in range(2):
+        process_connect_cluster(connect_cluster, watcher)
+    assert connect_cluster.circuit_open
+    assert connect_cluster.interval == 10
+    assert connect_cluster._api.get.call_count == 2
+
+    process_connect_cluster(connect_cluster, watcher)
+    assert connect_cluster._api.get.call_count == 2
+    assert connect_cluster._api.get_raw.call_count == 0
+
+    clock.now = 10
+    process_connect_cluster(connect_cluster, watcher)
+    assert connect_cluster._api.get_raw.call_args.args == ("/",)
+    assert connect_cluster.interval == 20
+
+    clock.now = 30
+    connect_cluster._api.get_raw = MagicMock()
+    connect_cluster._api.get = MagicMock(return_value={})
+    process_connect_cluster(connect_cluster, watcher)
+    assert not connect_cluster.circuit_open
+    assert connect_cluster.interval == 30
+    assert watcher.metrics == {
+        "connect_clusters_healthy": 1,
+        "connect_clusters_unhealthy": 4,
+    }
+    assert circuit_breakers_metrics([connect_cluster]) == {
+        "connect_clusters_open": 0,
+        "circuit_breaker_opened": 1,
+        "circuit_breaker_probes": 2,
+        "cluster_scans_skipped": 1,
+    }
+
+
+def test_circuit_breaker_disabled():
+    connect_cluster = ConnectCluster(
+        {"hostname": "localhost", "circuit_breaker": {"enabled": False}}, {}
+    )
+    assert connect_cluster.circuit_breaker is None
+    assert connect_cluster.available()
+    assert circuit_breakers_metrics([connect_cluster])["connect_clusters_open"] == 0
@@ -0,0 +1,280 @@
+from copy import deepcopy
+from sys import getsizeof
+from unittest.mock import MagicMock, patch
+
+import pytest
+from kafka_connect_api.errors import GenericNotFound
+
+from kafka_connect_watcher.cluster import ConnectCluster, ConnectorState
+from kafka_connect_watcher.connectors_eval import ConnectorMetrics
+
+EXPANDED_PAYLOAD = {
+    "connector-a": {
+        "status": {
+            "name": "connector-a",
+            "connector": {"state": "RUNNING", "worker_id": "10.0.0.1:8083"},
+            "tasks": [
+                {
+                    "id": 1,
+                    "state": "FAILED",
+                    "worker_id": "10.0.0.1:8083",
+                    "trace": "boom",
+                },
+                {"id": 0, "state": "RUNNING", "worker_id": "10.0.0.2:8083"},
+            ],
+            "type": "sink",
+        },
+        "info": {
+            "name": "connector-a",
+            "config": {"connector.class": "FileStreamSink"},
+            "tasks": [],
+            "type": "sink",
+        },
+    },
+    "connector-b": {
+        "status": {
+            "name": "connector-b",
+            "connector": {"state": "PAUSED", "worker_id": "10.0.0.1:8083"},
+            "tasks": [],
+            "type": "source",
+        },
+        "info": {"name": "connector-b", "config": {}, "tasks": [], "type": "source"},
+    },
+}
+
+
+@pytest.fixture
+def connect_cluster():
+    return ConnectCluster({"hostname": "localhost", "evaluation_rules": []}, {})
+
+
+def test_scan_with_expand(connect_cluster):
+    connect_cluster._api.get = MagicMock(return_value=EXPANDED_PAYLOAD)
+    snapshot = connect_cluster.scan()
+    connect_cluster.api.get.assert_called_once_with(
+        "/connectors?expand=status&expand=info"
+    )
+    assert snapshot.expanded
+    assert snapshot.rest_calls == 1
+    assert set(snapshot.connectors) == {"connector-a", "connector-b"}
+    connector_a = snapshot.connectors["connector-a"]
+    assert connector_a.is_running()
+    assert [_task.id for _task in connector_a.tasks] == [0, 1]
+    assert [_task.state for _task in connector_a.tasks] == ["RUNNING", "FAILED"]
+    assert connector_a.config["connector.class"] == "FileStreamSink"
+    assert connector_a.status["tasks"][1]["trace"] == "boom"
+    assert connector_a.handle.name == "connector-a"
+    with pytest.raises(TypeError):
+        connector_a.config["connector.class"] = "Other"
+
+
+def test_scan_without_expand(connect_cluster):
+    def api_get(query_path):
+        if query_path.startswith("/connectors?"):
+            return ["connector-a", "connector-b", "deleted"]
+        if query_path == "/connectors":
+            return ["connector-a", "connector-b"]
+        name = query_path.split("/")[2]
+        if name == "deleted":
+            raise GenericNotFound(404, ("Connector deleted not found",))
+        if query_path.endswith("/status"):
+            return EXPANDED_PAYLOAD[name]["status"]
+        return EXPANDED_PAYLOAD[name]["info"]
+
+    connect_cluster._api.get = MagicMock(side_effect=api_get)
+    snapshot = connect_cluster.scan()
+    assert not snapshot.expanded
+    assert connect_cluster.supports_expand is False
+    assert set(snapshot.connectors) == {"connector-a", "connector-b"}
+    assert snapshot.rest_calls == connect_cluster.api.get.call_count == 6
+    assert snapshot.connectors["connector-b"] == ConnectorState.from_status(
+        "connector-b",
+        EXPANDED_PAYLOAD["connector-b"]["status"],
+        EXPANDED_PAYLOAD["connector-b"]["info"],
+    )
+
+    connect_cluster.api.get.reset_mock()
+    connect_cluster.scan()
+    assert connect_cluster.api.get.call_args_list[0].args == ("/connectors",)
+
+
+def test_route_connectors_shares_scan():
+    connect_cluster = ConnectCluster(
+        {
+            "hostname": "localhost",
+            "evaluation_rules": [
+                {"include_regex": ["connector-a"]},
+                {"exclude_regex": ["(.*)-b$"]},
+                {"include_regex": ["none-such"]},
+            ],
+        },
+        {},
+    )
+    connect_cluster._api.get = MagicMock(return_value=EXPANDED_PAYLOAD)
+    snapshot = connect_cluster.scan()
+    routes = connect_cluster.route_connectors(snapshot)
+    rule_a, rule_not_b, rule_none = connect_cluster.handling_rules
+    assert [_connector.name for _connector in routes[rule_a]] == ["connector-a"]
+    assert [_connector.name for _connector in routes[rule_not_b]] == ["connector-a"]
+    assert routes[rule_none] == []
+    assert set(connect_cluster.metrics["connectors"]) == {"connector-a"}
+    assert connect_cluster.metrics["connectors"]["connector-a"] == {
+        "tasks": 2,
+        "running": 1,
+        "failed": 1,
+        "unassigned": 0,
+    }
+    connect_cluster.api.get.assert_called_once()
+
+
+def test_snapshot_diff_and_report(connect_cluster):
+    connect_cluster.handling_rules = ConnectCluster(
+        {"hostname": "localhost", "evaluation_rules": [{}]}, {}
+    ).handling_rules
+    payload = deepcopy(EXPANDED_PAYLOAD)
+    payload["connector-c"] = {
+        "status": {"connector": {"state": "RUNNING"}, "tasks": []},
+        "info": {"config": {}},
+    }
+    connect_cluster._api.get = MagicMock(return_value=payload)
+    snapshot = connect_cluster.scan()
+    assert snapshot.diff.added == {"connector-a", "connector-b", "connector-c"}
+    connect_cluster.route_connectors(snapshot)
+    assert connect_cluster.connectors_to_report == {
+        "connector-a",
+        "connector-b",
+        "connector-c",
+    }
+
+    snapshot = connect_cluster.scan()
+    assert not snapshot.diff
+    connect_cluster.route_connectors(snapshot)
+    assert connect_cluster.connectors_to_report == {"connector-a", "connector-b"}
+
+    payload["connector-a"]["status"]["tasks"][0]["state"] = "RUNNING"
+    payload["connector-a"]["status"]["connector"]["worker_id"] = "10.0.0.3:8083"
+    del payload["connector-b"]
+    snapshot = connect_cluster.scan()
+    assert snapshot.diff.changed == {"connector-a"}
+    assert snapshot.diff.removed == {"connector-b"}
+    assert not snapshot.diff.added
+    connect_cluster.route_connectors(snapshot)
+    assert connect_cluster.connectors_to_report == {"connector-a"}
+    assert set(connect_cluster.metrics["connectors"]) == {"connector-a", "connector-c"}
+    assert connect_cluster.metrics["connectors"]["connector-a"]["failed"] == 0
+
+
+def test_evaluate_reuses_unchanged_statuses(connect_cluster):
+    (rule,) = ConnectCluster(
+        {"hostname": "localhost", "evaluation_rules": [{}]}, {}
+    ).handling_rules
+    connect_cluster._api.get = MagicMock(return_value=EXPANDED_PAYLOAD)
+    snapshot = connect_cluster.scan()
+    connectors = list(snapshot.connectors.values())
+    statuses, to_fix, to_cycle = rule.evaluate(connectors, snapshot.diff)
+    assert [_connector.name for _connector in to_fix] == ["connector-a"]
+    assert [_connector.name for _connector in to_cycle] == ["connector-b"]
+
+    snapshot = connect_cluster.scan()
+    with patch(
+        "kafka_connect_watcher.error_rules.evaluate_connector_status"
+    ) as evaluate_status:
+        assert rule.evaluate(connectors, snapshot.diff) == (
+            statuses,
+            to_fix,
+            to_cycle,
+        )
+        evaluate_status.assert_not_called()
+
+
+def test_connectors_metrics_reconciled_with_snapshot(connect_cluster):
+    connect_cluster.handling_rules = ConnectCluster(
+        {"hostname": "localhost", "evaluation_rules": [{}]}, {}
+    ).handling_rules
+    connect_cluster._api.get = MagicMock(return_value=EXPANDED_PAYLOAD)
+    snapshot = connect_cluster.scan()
+    connect_cluster.route_connectors(snapshot)
+    connectors_metrics = connect_cluster.metrics["connectors"]
+    assert isinstance(connectors_metrics["connector-a"], ConnectorMetrics)
+    assert dict(connectors_metrics["connector-a"]) == {
+        "tasks": 2,
+        "running": 1,
+        "failed": 1,
+        "unassigned": 0,
+    }
+    connectors_metrics["deleted-by-ci"] = ConnectorMetrics(1, 1)
+    connect_cluster.route_connectors(connect_cluster.scan())
+    assert set(connectors_metrics) == {"connector-a", "connector-b"}
+    assert connect_cluster.metrics["connectors_metrics_bytes"] == getsizeof(
+        connectors_metrics
+    ) + 2 * getsizeof(ConnectorMetrics())
+
+
+def test_adaptive_interval_follows_cluster_health():
+    connect_cluster = ConnectCluster(
+        {
+            "hostname": "localhost",
+            "interval": 30,
+            "adaptive_interval": {
+                "fast_interval": "5s",
+                "max_interval": "2m",
+                "stable_cycles": 1,
+            },
+            "evaluation_rules": [{"ignore_paused": True}],
+        },
+        {},
+    )
+
+    def scan_cycle(payload: dict) -> float:
+        connect_cluster._api.get = MagicMock(return_value=payload)
+        snapshot = connect_cluster.scan()
+        routes = connect_cluster.route_connectors(snapshot)
+        for rule in connect_cluster.handling_rules:
+            rule.execute(connect_cluster, snapshot, routes[rule])
+        connect_cluster.adapt_interval()
+        return connect_cluster.interval
+
+    assert scan_cycle(EXPANDED_PAYLOAD) == 5
+    healthy_payload = deepcopy(EXPANDED_PAYLOAD)
+    healthy_payload["connector-a"]["status"]["tasks"][0]["state"] = "RUNNING"
+    assert [scan_cycle(healthy_payload) for _ in range(4)] == [30, 60, 120, 120]
+    assert scan_cycle(EXPANDED_PAYLOAD) == 5
+
+
+def test_scan_without_expand_quotes_connectors_names(connect_cluster):
+    status = deepcopy(EXPANDED_PAYLOAD["connector-b"]["status"])
+    info = deepcopy(EXPANDED_PAYLOAD["connector-b"]["info"])
+    responses = {
+        "/connectors?expand=status&expand=info": ["team/sink?v2 a"],
+        "/connectors/team%2Fsink%3Fv2%20a/status": status,
+        "/connectors/team%2Fsink%3Fv2%20a": info,
+    }
+    connect_cluster._api.get = MagicMock(side_effect=responses.__getitem__)
+    snapshot = connect_cluster.scan()
+    assert set(snapshot.connectors) == {"team/sink?v2 a"}
+    connect_cluster = ConnectCluster(
+        {"hostname": "localhost", "evaluation_rules": [{"ignore_paused": False}]}, {}
+    )
+    payload = deepcopy(EXPANDED_PAYLOAD)
+    payload["connector-c"] = deepcopy(payload["connector-b"])
+    payload["connector-c"]["status"]["name"] = "connector-c"
+    connect_cluster._api.get = MagicMock(return_value=payload)
+    snapshot = connect_cluster.scan()
+    routes = connect_cluster.route_connectors(snapshot)
+    rule = connect_cluster.handling_rules[0]
+    rule.auto_correct_rules = [MagicMock()]
+    rule.auto_correct = MagicMock()
+
+    def cycle(connect, connector):
+        if connector.name == "connector-b":
+            raise ConnectionError("reset by peer")
+        return True
+
+    with patch("kafka_connect_watcher.error_rules.cycle_connector", cycle):
+        rule.execute(connect_cluster, snapshot, routes[rule])
+    assert connect_cluster.metrics["paused"] == 2
+    assert connect_cluster.metrics["failed"] == 2
+    assert [_call.args[1].name for _call in rule.auto_correct.call_args_list] == [
+        "connector-a",
+        "connector-b",
+    ]
@@ -3,8 +3,9 @@ from os import path
 
 import pytest
 import yaml
+from jsonschema.exceptions import ValidationError
 
-from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.config import Config, get_config_validator
 
 
 @pytest.mark.parametrize(
@@ -45,3 +46,13 @@ from kafka_connect_watcher.config import Config
 def test_config_parsing(config_path, expected):
     actual = Config(path.abspath(f"tests/fixtures/configs/{config_path}"))
     assert actual.config == expected
+
+
+def test_config_validator_is_reused():
+    assert get_config_validator() is get_config_validator()
+    with pytest.raises(ValidationError):
+        Config(
+            configuration={
+                "clusters": [{"hostname": "localhost", "port": "not-a-port"}]
+            }
+        )
@@ -1,9 +1,13 @@
-from queue import Queue
 from unittest.mock import Mock
 
 import pytest
 
-from kafka_connect_watcher.connectors_eval import evaluate_connector_status
+from kafka_connect_watcher import connectors_eval
+from kafka_connect_watcher.connectors_eval import (
+    CONNECTOR_TO_FIX,
+    evaluate_connector_status,
+    needs_cycle,
+)
 
 from .fixtures.mock_config import (
     MockConnectCluster,
@@ -45,7 +49,6 @@ def test_evaluate_connector_status(
     ignore_paused,
     cycle_connector,
 ):
-    connector_queue = Queue()
     rule = MockEvaluationRule(
         ignore_paused=ignore_paused, ignore_unassigned=ignore_unassigned
     )
@@ -57,15 +60,15 @@ def test_evaluate_connector_status(
         for task_state in task_states:
             tasks.append(MockTask(state=task_state))
         connectors.append(MockConnector(state=connector_state, tasks=tasks))
-    for connector in connectors:
-        connector_queue.put(
-            [rule, connect, connector, 0, 0, 0, connectors_to_fix],
-            False,
-        )
     mock_cycle = mocker.patch(
         "tests.fixtures.mock_config.MockConnector.cycle_connector"
     )
-    evaluate_connector_status(connector_queue)
+    for connector in connectors:
+        connector_status = evaluate_connector_status(rule, connector)
+        if connector_status == CONNECTOR_TO_FIX:
+            connectors_to_fix.append(connector)
+        elif needs_cycle(rule, connector_status):
+            connectors_eval.cycle_connector(connect, connector)
     assert len(connectors_to_fix) == len_connectors_to_fix
     if cycle_connector:
         mock_cycle.assert_called_once_with()
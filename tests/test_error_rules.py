@@ -1,8 +1,9 @@
-from unittest.mock import MagicMock, PropertyMock, patch
+from unittest.mock import MagicMock, PropertyMock
 
 import pytest
 
 from kafka_connect_watcher.error_rules import AutoCorrectRule, EvaluationRule
+from kafka_connect_watcher.remediation import Remediation, RemediationScheduler
 from tests.fixtures.mock_config import (
     MockClusterConfig,
     MockConnectCluster,
@@ -22,10 +23,12 @@ def test_filter_out_connector(rule_definition, connector_name, expected):
     cluster_config = MockClusterConfig()
     rule = EvaluationRule(rule_definition, {})
     assert rule.filter_out_connector(connector_name, cluster_config) == expected
+    assert rule.filter_out_connector(connector_name, cluster_config) == expected
+    assert rule._is_handled.cache_info().hits == 1
 
 
 @pytest.mark.parametrize(
-    "config, status_sequence, expected_action, expected_sleep_calls",
+    "config, status_sequence, expected_action, expected_delays",
     [
         pytest.param(
             {
@@ -74,13 +77,11 @@ def test_filter_out_connector(rule_definition, connector_name, expected):
         ),
     ],
 )
-@patch("time.sleep", return_value=None)
 def test_backoff_logic_with_mock_connector(
-    mock_sleep,
     config,
     status_sequence,
     expected_action,
-    expected_sleep_calls,
+    expected_delays,
 ):
     rule = AutoCorrectRule(config=config, watcher_config={})
     connector = MockConnector()
@@ -98,7 +99,11 @@ def test_backoff_logic_with_mock_connector(
     connector.pause = MagicMock()
     connector.cycle_connector = MagicMock()
 
-    rule.process(cluster=MockConnectCluster(), connector=connector)
+    remediation = Remediation(MockConnectCluster(), connector, [rule])
+    delays = []
+    while (delay := remediation.step()) is not None:
+        delays.append(delay)
+    assert remediation.done
 
     if expected_action == "restart":
         connector.restart.assert_called_once()
@@ -108,6 +113,44 @@ def test_backoff_logic_with_mock_connector(
         connector.restart.assert_not_called()
         connector.pause.assert_not_called()
 
-    sleep_durations = [call.args[0] for call in mock_sleep.call_args_list]
-    backoff_durations = sleep_durations[: len(expected_sleep_calls)]
-    assert backoff_durations == expected_sleep_calls
+    assert delays[: len(expected_delays)] == expected_delays
+
+
+def test_remediation_scheduler_one_per_connector():
+    now = [0.0]
+    scheduler = RemediationScheduler(clock=lambda: now[0])
+    rule = AutoCorrectRule(
+        config={
+            "action": "restart",
+            "wait_for_status": "30s",
+            "max_backoff": 60,
+            "max_attempts": 2,
+        },
+        watcher_config={},
+    )
+    connector = MockConnector()
+    connector.config = {"connector.class": "TestClass"}
+    connector.cluster.loggers = {}
+    type(connector).status = PropertyMock(
+        return_value={"connector": {"state": "FAILED"}, "tasks": []}
+    )
+    connector.restart = MagicMock()
+
+    assert scheduler.submit(Remediation(MockConnectCluster(), connector, [rule]))
+    assert not scheduler.submit(Remediation(MockConnectCluster(), connector, [rule]))
+    assert scheduler.pending() == 1
+    assert scheduler.pending("connect_cluster_name") == 1
+
+    for expected_due in (30.0, 90.0, 120.0):
+        (remediation,) = scheduler.pop_due()
+        scheduler.run_step(remediation)
+        assert scheduler.pop_due() == []
+        now[0] = scheduler.next_due()
+        assert now[0] == expected_due
+    (remediation,) = scheduler.pop_due()
+    scheduler.run_step(remediation)
+    connector.restart.assert_called_once()
+    assert scheduler.pending() == 0
+    assert scheduler.next_due() is None
+    assert scheduler.metrics["remediations_completed"] == 1
+    assert scheduler.metrics["remediations_actions_applied"] == 1
@@ -0,0 +1,98 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+
+import pytest
+
+from kafka_connect_watcher.cluster import ConnectCluster
+
+
+class ConnectHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    lock = Lock()
+    in_flight = 0
+    max_in_flight = 0
+    delay = 0.0
+    close_connections = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        handler = type(self)
+        with handler.lock:
+            handler.in_flight += 1
+            handler.max_in_flight = max(handler.max_in_flight, handler.in_flight)
+        sleep(handler.delay)
+        with handler.lock:
+            handler.in_flight -= 1
+        payload = json.dumps([]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if handler.close_connections:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def connect_server():
+    handler = type("Handler", (ConnectHandler,), {"lock": Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def server_cluster(server, http_client: dict) -> ConnectCluster:
+    return ConnectCluster(
+        {
+            "hostname": "127.0.0.1",
+            "port": server.server_address[1],
+            "http_client": http_client,
+        },
+        {},
+    )
+
+
+def test_connections_kept_alive(connect_server):
+    cluster = server_cluster(connect_server, {})
+    for _ in range(5):
+        assert cluster.api.get("/connectors") == []
+    metrics = cluster.transport.metrics
+    assert metrics["http_requests"] == 5
+    assert metrics["http_connections_opened"] == 1
+    assert metrics["http_connections_reused"] == 4
+    cluster.transport.close()
+
+
+def test_connections_closed_by_the_server_are_not_reused(connect_server):
+    connect_server.RequestHandlerClass.close_connections = True
+    cluster = server_cluster(connect_server, {})
+    for _ in range(3):
+        assert cluster.api.get("/connectors") == []
+    metrics = cluster.transport.metrics
+    assert metrics["http_requests"] == 3
+    assert metrics["http_connections_opened"] == 3
+    assert metrics["http_connections_reused"] == 0
+    cluster.transport.close()
+
+
+def test_in_flight_requests_limit(connect_server):
+    connect_server.RequestHandlerClass.delay = 0.05
+    cluster = server_cluster(
+        connect_server, {"max_in_flight_requests": 2, "max_pool_size": 4}
+    )
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: cluster.api.get("/connectors"), range(16)))
+    assert connect_server.RequestHandlerClass.max_in_flight == 2
+    metrics = cluster.transport.metrics
+    assert metrics["http_in_flight_waits"] > 0
+    assert metrics["http_connections_opened"] <= 2
+    cluster.transport.close()
@@ -0,0 +1,99 @@
+from threading import Event, Thread
+from unittest.mock import MagicMock
+
+import pytest
+
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.instrumentation import (
+    Histogram,
+    SamplingProfiler,
+    endpoint_template,
+    instrumentation_metrics,
+)
+
+
+@pytest.mark.parametrize(
+    ["query_path", "expected"],
+    (
+        ("/connectors?expand=status&expand=info", "/connectors?expand=info,status"),
+        ("/connectors?expand=info", "/connectors?expand=info"),
+        ("/connectors", "/connectors"),
+        (
+            "/connectors/my-connector/restart?includeTasks=true",
+            "/connectors/{connector}/restart",
+        ),
+        ("/connectors/my-connector/status", "/connectors/{connector}/status"),
+        ("/connectors/team%2Fsink%3Fv2%20a/status", "/connectors/{connector}/status"),
+        ("connectors/my-connector", "/connectors/{connector}"),
+        (
+            "/connectors/my-connector/tasks/3/restart",
+            "/connectors/{connector}/tasks/{task}/restart",
+        ),
+        ("/admin/loggers/org.apache.kafka", "/admin/loggers/{logger}"),
+    ),
+)
+def test_endpoint_template(query_path, expected):
+    assert endpoint_template(query_path) == expected
+
+
+def test_histogram_buckets():
+    histogram = Histogram()
+    for value in (0.001, 0.005, 0.2, 30.0):
+        histogram.observe(value)
+    buckets = dict(histogram.cumulative_counts())
+    assert buckets["0.005"] == 2
+    assert buckets["0.25"] == 3
+    assert buckets["10.0"] == 3
+    assert buckets["+Inf"] == histogram.count == 4
+    assert histogram.max == 30.0
+
+
+def test_cluster_requests_and_phases_metrics(monkeypatch):
+    config = Config(
+        configuration={"clusters": [{"hostname": "localhost", "name": "cluster"}]}
+    )
+    cluster = ConnectCluster(config.config["clusters"][0], config)
+    response = MagicMock(status_code=200, **{"json.return_value": []})
+    monkeypatch.setattr(
+        cluster.transport,
+        "request",
+        MagicMock(side_effect=[response, response, ConnectionError("refused")]),
+    )
+    cluster.api.get("/connectors/a/status")
+    cluster.api.get("/connectors/b/status")
+    with pytest.raises(ConnectionError):
+        cluster.api.get("/connectors")
+    with cluster.timers.time("evaluate", "0"):
+        pass
+    cluster.timers.record("evaluate", 2.0, "1")
+    metrics = instrumentation_metrics([cluster])
+    assert metrics["http_calls"] == 3
+    assert metrics["http_errors"] == 1
+    assert metrics["http_get_connectors_connector_status_calls"] == 2
+    assert metrics["http_get_connectors_errors"] == 1
+    assert metrics["phase_evaluate_count"] == 2
+    assert metrics["phase_evaluate_seconds_max"] == 2.0
+    assert metrics["phase_fetch_count"] == 0
+
+
+def test_sampling_profiler_writes_folded_stacks(tmp_path):
+    stop = Event()
+    worker = Thread(target=stop.wait, name="sampled-worker")
+    worker.start()
+    profiler = SamplingProfiler(str(tmp_path))
+    try:
+        profiler.sample()
+        profiler.sample()
+    finally:
+        stop.set()
+        worker.join()
+    profile_path = profiler.write()
+    with open(profile_path) as profile_fd:
+        stacks = profile_fd.read().splitlines()
+    assert any(
+        _stack.startswith("sampled-worker;") and _stack.endswith(" 2")
+        for _stack in stacks
+    )
+    assert profiler.write() is None
+    assert profiler.metrics == {"profiler_samples": 2, "profiler_files": 1}
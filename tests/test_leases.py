@@ -0,0 +1,117 @@
+from time import sleep
+from unittest.mock import MagicMock, PropertyMock
+
+import pytest
+
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.error_rules import AutoCorrectRule, EvaluationRule
+from kafka_connect_watcher.leases import (
+    FileLeaseBackend,
+    LeaseBackend,
+    LeaseManager,
+    SqliteLeaseBackend,
+)
+from kafka_connect_watcher.remediation import Remediation
+from tests.fixtures.mock_config import MockConnectCluster, MockConnector
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "file":
+        return FileLeaseBackend(str(tmp_path / "leases"))
+    return SqliteLeaseBackend(str(tmp_path / "leases.db"))
+
+
+def test_backend_lease_held_by_one_owner(backend):
+    assert backend.acquire("cluster", "a", 0.2)
+    assert not backend.acquire("cluster", "b", 0.2)
+    assert backend.acquire("cluster", "a", 0.2)
+    assert backend.acquire("other-cluster", "b", 0.2)
+    backend.release("cluster", "b")
+    assert not backend.acquire("cluster", "b", 0.2)
+    sleep(0.3)
+    assert backend.acquire("cluster", "b", 0.2)
+    backend.release("cluster", "b")
+    assert backend.acquire("cluster", "a", 0.2)
+
+
+def test_incomplete_backend_fails_on_creation():
+    class AcquireOnlyBackend(LeaseBackend):
+        def acquire(self, name: str, owner: str, ttl: float) -> bool:
+            return True
+
+    with pytest.raises(TypeError):
+        AcquireOnlyBackend()
+
+
+def test_standby_takes_over_released_lease(backend):
+    cluster = MockConnectCluster()
+    cluster.base_interval = 30
+    leader = LeaseManager(backend, "leader")
+    standby = LeaseManager(backend, "standby")
+    assert leader.owns(cluster)
+    assert not standby.owns(cluster)
+    leader.heartbeat()
+    standby.heartbeat()
+    assert leader.metrics["leases_owned"] == 1
+    assert standby.metrics["leases_owned"] == 0
+    leader.shutdown()
+    standby.heartbeat()
+    assert standby.owns(cluster)
+    assert standby.metrics["leases_acquired"] == 1
+
+
+def test_lease_lost_on_expiry(backend):
+    now = [0.0]
+    cluster = MockConnectCluster()
+    leader = LeaseManager(backend, "leader", ttl=60, clock=lambda: now[0])
+    assert leader.owns(cluster)
+    backend.release(cluster.name, "leader")
+    assert backend.acquire(cluster.name, "standby", 60)
+    assert leader.owns(cluster)
+    leader.heartbeat()
+    assert not leader.owns(cluster)
+    assert leader.metrics["leases_lost"] == 1
+
+
+def test_standby_does_not_remediate(monkeypatch):
+    lease_manager = MagicMock()
+    lease_manager.owns.return_value = False
+    monkeypatch.setattr(
+        "kafka_connect_watcher.error_rules.get_lease_manager", lambda: lease_manager
+    )
+    monkeypatch.setattr(
+        "kafka_connect_watcher.remediation.get_lease_manager", lambda: lease_manager
+    )
+    cluster = MockConnectCluster()
+    assert EvaluationRule.remediates(cluster, [], [])
+    assert not EvaluationRule.remediates(cluster, [MockConnector()], [])
+
+    connector = MockConnector()
+    type(connector).status = PropertyMock(
+        return_value={"connector": {"state": "FAILED"}, "tasks": []}
+    )
+    connector.restart = MagicMock()
+    rule = AutoCorrectRule(config={"action": "restart"}, watcher_config={})
+    assert Remediation(cluster, connector, [rule]).step() is None
+    connector.restart.assert_not_called()
+
+
+def test_lease_ttl_follows_the_configured_interval(backend):
+    cluster = ConnectCluster(
+        {
+            "hostname": "localhost",
+            "interval": 60,
+            "adaptive_interval": {"fast_interval": "5s"},
+        },
+        {},
+    )
+    cluster.adaptive_interval.update(changed=True, unhealthy=True)
+    assert cluster.interval == 5
+    leader = LeaseManager(backend, "leader")
+    assert leader.owns(cluster)
+    assert leader._ttls[cluster.name] == 30
+
+    cluster.definition = dict(cluster.definition, interval=120)
+    leader.refresh_ttl(cluster)
+    assert leader._ttls[cluster.name] == 60
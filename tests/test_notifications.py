@@ -0,0 +1,275 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+from kafka_connect_watcher.aws_sns import (
+    PUBLISH_MAX_BYTES,
+    TRUNCATED_TRACE_SUFFIX,
+    SnsChannel,
+)
+from kafka_connect_watcher.notifications import (
+    Notification,
+    NotificationCoalescer,
+    NotificationPipeline,
+    RateLimiter,
+    error_signature,
+)
+from tests.fixtures.mock_config import MockConnectCluster
+
+TOPIC_ARN = "arn:aws:sns:eu-west-1:123456789012:connect-alerts"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def failed_status(trace: str) -> dict:
+    return {
+        "connector": {"state": "RUNNING"},
+        "tasks": [{"id": 0, "state": "FAILED", "trace": trace}],
+    }
+
+
+def test_error_signature():
+    assert (
+        error_signature(failed_status("org.apache.kafka.ConnectException: boom\n\tat"))
+        == "org.apache.kafka.ConnectException: boom"
+    )
+    assert error_signature({"connector": {"state": "PAUSED"}}) == "PAUSED"
+    assert error_signature("no status") == "no status"
+
+
+def test_coalescer_groups_by_cluster_and_signature():
+    clock = FakeClock()
+    coalescer = NotificationCoalescer(30.0, clock)
+    for connector_name in ("a", "b", "a"):
+        coalescer.add(Notification("cluster", connector_name, failed_status("Boom")))
+    coalescer.add(Notification("cluster", "c", failed_status("Other")))
+    coalescer.add(Notification("other-cluster", "d", failed_status("Boom")))
+    assert coalescer.window_end == 30.0
+    clock.now = 29.0
+    assert coalescer.pop_digests() == []
+    clock.now = 30.0
+    digests = coalescer.pop_digests()
+    assert len(digests) == 3
+    assert digests[0].connectors_names == ["a", "b"]
+    assert coalescer.window_end is None
+    coalescer.requeue(digests[:1])
+    assert coalescer.pop_digests(force=True)[0].connectors_names == ["a", "b"]
+
+
+def test_rate_limiter():
+    clock = FakeClock()
+    limiter = RateLimiter(2, clock)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    clock.now = 30.0
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert all(RateLimiter(None, clock).try_acquire() for _ in range(100))
+
+
+def test_publish_digests_in_one_batch(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    channel = SnsChannel("alerts", {"topic_arn": TOPIC_ARN})
+    channel.coalescer = NotificationCoalescer(30.0, FakeClock())
+    cluster = MockConnectCluster()
+    for index in range(3):
+        channel.dispatch(
+            Notification(
+                cluster.name,
+                f"connector-{index}",
+                failed_status(("TimeoutException", "AuthException")[index % 2]),
+            )
+        )
+    digests = channel.coalescer.pop_digests(force=True)
+    assert [_digest.connectors_names for _digest in digests] == [
+        ["connector-0", "connector-2"],
+        ["connector-1"],
+    ]
+    with Stubber(channel.client) as stubber:
+        stubber.add_response(
+            "publish_batch",
+            {"Successful": [], "Failed": []},
+            {
+                "TopicArn": TOPIC_ARN,
+                "PublishBatchRequestEntries": [
+                    {
+                        "Id": "0",
+                        "Subject": f"Kafka Connect errors for 2 connectors in {cluster.name}",
+                        "Message": ANY,
+                        "MessageStructure": "json",
+                    },
+                    {
+                        "Id": "1",
+                        "Subject": "Kafka Connect error for connector-1",
+                        "Message": ANY,
+                        "MessageStructure": "json",
+                    },
+                ],
+            },
+        )
+        channel.publish_digests(digests)
+        stubber.assert_no_pending_responses()
+    assert channel.metrics == {
+        "received": 0,
+        "suppressed": 0,
+        "digests": 2,
+        "publish_calls": 1,
+        "rate_limited": 0,
+    }
+
+
+def test_publish_digests_batches_within_the_size_limit(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    channel = SnsChannel("alerts", {"topic_arn": TOPIC_ARN, "dedupe_ttl": "0s"})
+    channel.coalescer = NotificationCoalescer(30.0, FakeClock())
+    cluster = MockConnectCluster()
+    traces = [f"{error}: {'x' * 60_000}" for error in "ABCDE"]
+    traces.append(f"F: {'x' * 400_000}")
+    for index, trace in enumerate(traces):
+        channel.dispatch(
+            Notification(cluster.name, f"connector-{index}", failed_status(trace))
+        )
+    digests = channel.coalescer.pop_digests(force=True)
+    subject, messages, size = channel.render_digest(digests[5])
+    assert size <= PUBLISH_MAX_BYTES
+    assert messages["email"].endswith(TRUNCATED_TRACE_SUFFIX)
+    with Stubber(channel.client) as stubber:
+        stubber.add_response(
+            "publish_batch",
+            {
+                "Successful": [{"Id": "0", "MessageId": "0"}],
+                "Failed": [
+                    {"Id": "1", "Code": "InternalError", "SenderFault": False},
+                    {"Id": "2", "Code": "InvalidParameter", "SenderFault": True},
+                ],
+            },
+            {
+                "TopicArn": TOPIC_ARN,
+                "PublishBatchRequestEntries": [
+                    {
+                        "Id": str(index),
+                        "Subject": f"Kafka Connect error for connector-{index}",
+                        "Message": ANY,
+                        "MessageStructure": "json",
+                    }
+                    for index in range(4)
+                ],
+            },
+        )
+        for index in (4, 5):
+            stubber.add_response(
+                "publish",
+                {"MessageId": str(index)},
+                {
+                    "TopicArn": TOPIC_ARN,
+                    "Subject": f"Kafka Connect error for connector-{index}",
+                    "Message": ANY,
+                    "MessageStructure": "json",
+                },
+            )
+        channel.publish_digests(digests)
+        stubber.assert_no_pending_responses()
+    assert channel.metrics["publish_calls"] == 3
+    assert [
+        _digest.connectors_names
+        for _digest in channel.coalescer.pop_digests(force=True)
+    ] == [["connector-1"]]
+
+
+def test_pipeline_overflow_and_drain_on_shutdown():
+    channel = MagicMock()
+    pipeline = NotificationPipeline(queue_size=2)
+    for index in range(3):
+        assert pipeline.submit(channel, Notification("cluster", f"c{index}", {}))
+    assert pipeline.metrics["notifications_queue_depth"] == 2
+    assert pipeline.metrics["notifications_dropped"] == 1
+    pipeline.overflow_policy = "drop_newest"
+    assert not pipeline.submit(channel, Notification("cluster", "c3", {}))
+    pipeline.shutdown()
+    assert [
+        _call.args[0].connector_name for _call in channel.dispatch.call_args_list
+    ] == ["c1", "c2"]
+    assert not pipeline.submit(channel, Notification("cluster", "c4", {}))
+    assert pipeline.metrics["notifications_queue_depth"] == 0
+
+
+def test_pipeline_dispatches_from_its_thread():
+    delivered = Event()
+    channel = MagicMock(coalescer=None)
+    channel.dispatch.side_effect = lambda _notification: delivered.set()
+    pipeline = NotificationPipeline()
+    pipeline.start()
+    pipeline.submit(channel, Notification("cluster", "c0", {}))
+    assert delivered.wait(5)
+    pipeline.shutdown()
+
+
+def test_pipeline_send_retries_with_backoff():
+    delays: list = []
+    pipeline = NotificationPipeline(max_retries=3, sleep=delays.append)
+    function = MagicMock(side_effect=[ValueError("throttled")] * 2 + ["ok"])
+    assert pipeline.send(function, lambda _error: True, Subject="subject") == "ok"
+    function.assert_called_with(Subject="subject")
+    assert delays == [1.0, 2.0]
+    function = MagicMock(side_effect=ValueError("denied"))
+    with pytest.raises(ValueError):
+        pipeline.send(function, lambda _error: False)
+    function.assert_called_once()
+    metrics = pipeline.metrics
+    assert metrics["notifications_send_retries"] == 2
+    assert metrics["notifications_send_failures"] == 1
+
+
+def test_repeated_errors_are_suppressed(monkeypatch):
+    pipeline = NotificationPipeline()
+    monkeypatch.setattr(
+        "kafka_connect_watcher.aws_sns.get_notification_pipeline", lambda: pipeline
+    )
+    channel = SnsChannel("alerts", {"topic_arn": TOPIC_ARN, "dedupe_ttl": "1h"})
+    channel.fingerprints.clock = clock = FakeClock()
+    cluster = MockConnectCluster()
+    connector = MagicMock()
+    connector.name = "connector-a"
+    for offset in range(3):
+        channel.send_error_notification(
+            cluster,
+            connector,
+            MagicMock(status=failed_status(f"OffsetOutOfRange: offset {offset}")),
+        )
+    clock.now = 3600.0
+    channel.send_error_notification(
+        cluster,
+        connector,
+        MagicMock(status=failed_status("OffsetOutOfRange: offset 42")),
+    )
+    assert channel.metrics["suppressed"] == 2
+    queued = [_notification for _channel, _notification in pipeline._queue]
+    assert [_notification.repeats for _notification in queued] == [0, 2]
+
+
+def test_channel_metrics_counted_from_concurrent_threads(monkeypatch):
+    pipeline = NotificationPipeline()
+    monkeypatch.setattr(
+        "kafka_connect_watcher.aws_sns.get_notification_pipeline", lambda: pipeline
+    )
+    channel = SnsChannel("alerts", {"topic_arn": TOPIC_ARN})
+    cluster = MockConnectCluster()
+    connector = MagicMock()
+    connector.name = "connector-a"
+    status = MagicMock(status=failed_status("OffsetOutOfRange: offset 1"))
+    with ThreadPoolExecutor(8) as executor:
+        for _ in range(400):
+            executor.submit(channel.send_error_notification, cluster, connector, status)
+    assert channel.metrics["received"] == 400
+    assert channel.metrics["suppressed"] == 399
@@ -0,0 +1,55 @@
+from unittest.mock import MagicMock
+from urllib.request import urlopen
+
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.prometheus import MetricsRegistry, start_metrics_server
+from tests.test_cluster import EXPANDED_PAYLOAD
+
+
+def test_registry_exposition():
+    connect_cluster = ConnectCluster(
+        {
+            "hostname": "localhost",
+            "name": "cluster-a",
+            "evaluation_rules": [{"ignore_paused": True}],
+            "metrics": {"prometheus": {"enabled": True}},
+        },
+        {},
+    )
+    connect_cluster._api.get = MagicMock(return_value=EXPANDED_PAYLOAD)
+    snapshot = connect_cluster.scan()
+    (rule,) = connect_cluster.handling_rules
+    routes = connect_cluster.route_connectors(snapshot)
+    rule.execute(connect_cluster, snapshot, routes[rule])
+    registry = MetricsRegistry()
+    assert registry.exposition() == registry.exposition()
+
+    registry.publish(connect_cluster)
+    exposition = registry.exposition()
+    assert exposition is registry.exposition()
+    text = exposition.decode()
+    assert "# TYPE kafka_connect_watcher_connector_tasks gauge\n" in text
+    assert (
+        'kafka_connect_watcher_connector_tasks_state{cluster="cluster-a",'
+        'connector="connector-a",state="failed"} 1.0\n'
+    ) in text
+    assert (
+        'kafka_connect_watcher_cluster_connectors_status{cluster="cluster-a",'
+        'status="paused"} 1.0\n'
+    ) in text
+    assert (
+        'kafka_connect_watcher_cluster_scan_rest_calls{cluster="cluster-a"} 1.0\n'
+        in text
+    )
+
+    server = start_metrics_server({"port": 0, "address": "127.0.0.1"}, registry)
+    try:
+        with urlopen(
+            f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        ) as response:
+            assert response.read() == exposition
+
+        registry.remove("cluster-a")
+        assert "cluster-a" not in registry.exposition().decode()
+    finally:
+        server.shutdown()
@@ -0,0 +1,169 @@
+from copy import deepcopy
+from os import utime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import yaml
+
+from kafka_connect_watcher.cluster import ConnectCluster
+from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.reload import ConfigWatcher, reload_clusters
+from kafka_connect_watcher.watcher import process_connect_cluster
+
+TOPIC_ARN = "arn:aws:sns:eu-west-1:123456789012:connect-alerts"
+
+CONFIGURATION: dict = {
+    "clusters": [
+        {
+            "name": "cluster-a",
+            "hostname": "localhost",
+            "evaluation_rules": [
+                {"include_regex": ["a-.*"]},
+                {
+                    "include_regex": ["b-.*"],
+                    "auto_correct_actions": [
+                        {"action": "restart", "notify": [{"target": "sns.alerts"}]}
+                    ],
+                },
+            ],
+        },
+        {"name": "cluster-b", "hostname": "localhost", "port": 8084},
+        {"name": "cluster-c", "hostname": "localhost", "port": 8085},
+    ],
+    "notification_channels": {"sns": {"alerts": {"topic_arn": TOPIC_ARN}}},
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def running_clusters(config: Config) -> dict[str, ConnectCluster]:
+    return {
+        _cluster.name: _cluster
+        for _cluster in (
+            ConnectCluster(_definition, config)
+            for _definition in config.config["clusters"]
+        )
+    }
+
+
+def test_reload_clusters_keeps_unchanged_objects():
+    config = Config(configuration=deepcopy(CONFIGURATION))
+    clusters = running_clusters(config)
+    cluster_a = clusters["cluster-a"]
+    rule_a, rule_b = cluster_a.handling_rules
+    api_a = cluster_a.api
+
+    definition = deepcopy(CONFIGURATION)
+    definition["clusters"][0]["interval"] = "10s"
+    definition["clusters"][0]["evaluation_rules"][0]["ignore_paused"] = True
+    definition["clusters"][1]["port"] = 9084
+    del definition["clusters"][2]
+    definition["clusters"].append({"name": "cluster-d", "hostname": "localhost"})
+    new_config = Config(configuration=definition)
+    changes = reload_clusters(clusters, config, new_config)
+
+    assert [_cluster.name for _cluster in changes.added] == ["cluster-d"]
+    assert [_cluster.name for _cluster in changes.removed] == ["cluster-c"]
+    ((previous, rebuilt),) = changes.rebuilt
+    assert previous is clusters["cluster-b"] and rebuilt.port == 9084
+    assert changes.reconfigured == [cluster_a]
+    assert changes.clusters["cluster-a"] is cluster_a
+    assert cluster_a.api is api_a
+    assert cluster_a.interval == 10
+    new_rule_a, kept_rule_b = cluster_a.handling_rules
+    assert new_rule_a is not rule_a and new_rule_a.ignore_paused
+    assert kept_rule_b is rule_b
+    assert (
+        new_config.notification_channels["sns.alerts"]
+        is config.notification_channels["sns.alerts"]
+    )
+    assert set(changes.clusters) == {"cluster-a", "cluster-b", "cluster-d"}
+
+
+def test_reload_rebuilds_rules_notifying_changed_channels():
+    config = Config(configuration=deepcopy(CONFIGURATION))
+    clusters = running_clusters(config)
+    rule_a, rule_b = clusters["cluster-a"].handling_rules
+    definition = deepcopy(CONFIGURATION)
+    definition["notification_channels"]["sns"]["alerts"]["ignore_errors"] = True
+    new_config = Config(configuration=deepcopy(definition))
+    changes = reload_clusters(clusters, config, new_config)
+    assert changes.reconfigured == [clusters["cluster-a"]]
+    new_rule_a, new_rule_b = clusters["cluster-a"].handling_rules
+    assert new_rule_a is rule_a
+    assert new_rule_b is not rule_b
+    assert new_rule_b.auto_correct_rules[0].notification_channels == [
+        new_config.notification_channels["sns.alerts"]
+    ]
+
+    unchanged = reload_clusters(
+        changes.clusters, new_config, Config(configuration=deepcopy(definition))
+    )
+    assert not unchanged
+
+
+def test_reload_keeps_the_adaptive_interval_state():
+    definition = deepcopy(CONFIGURATION)
+    definition["clusters"][0]["adaptive_interval"] = {"fast_interval": "5s"}
+    config = Config(configuration=deepcopy(definition))
+    clusters = running_clusters(config)
+    cluster_a = clusters["cluster-a"]
+    adaptive_interval = cluster_a.adaptive_interval
+    circuit_breaker = cluster_a.circuit_breaker
+
+    definition["clusters"][0]["evaluation_rules"][0]["ignore_paused"] = True
+    new_config = Config(configuration=deepcopy(definition))
+    assert reload_clusters(clusters, config, new_config).reconfigured == [cluster_a]
+    assert cluster_a.adaptive_interval is adaptive_interval
+    assert cluster_a.circuit_breaker is circuit_breaker
+
+    definition["clusters"][0]["adaptive_interval"]["fast_interval"] = "10s"
+    reload_clusters(clusters, new_config, Config(configuration=deepcopy(definition)))
+    assert cluster_a.adaptive_interval is not adaptive_interval
+    assert cluster_a.circuit_breaker is circuit_breaker
+
+
+def test_reload_during_cluster_processing():
+    config = Config(configuration=deepcopy(CONFIGURATION))
+    clusters = running_clusters(config)
+    cluster_a = clusters["cluster-a"]
+    cluster_a._api.get = MagicMock(return_value={})
+    definition = deepcopy(CONFIGURATION)
+    definition["clusters"][0]["evaluation_rules"][0]["ignore_paused"] = True
+    route_connectors = cluster_a.route_connectors
+
+    def route_then_reload(snapshot):
+        routes = route_connectors(snapshot)
+        reload_clusters(clusters, config, Config(configuration=definition))
+        return routes
+
+    cluster_a.route_connectors = route_then_reload
+    watcher = SimpleNamespace(
+        metrics={"connect_clusters_healthy": 0, "connect_clusters_unhealthy": 0}
+    )
+    process_connect_cluster(cluster_a, watcher)
+    assert watcher.metrics["connect_clusters_healthy"] == 1
+    assert cluster_a.handling_rules[0].ignore_paused
+
+
+def test_config_watcher(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(yaml.dump(CONFIGURATION))
+    clock = FakeClock()
+    config_watcher = ConfigWatcher(str(config_file), poll_interval=5.0, clock=clock)
+    assert not config_watcher.changed()
+    config_file.write_text(yaml.dump({"clusters": [{"port": "not-valid"}]}))
+    utime(config_file, ns=(0, 10**9))
+    assert not config_watcher.changed()
+    clock.now = 5.0
+    assert config_watcher.changed()
+    assert config_watcher.load() is None
+    assert not config_watcher.changed()
+    config_watcher.request()
+    assert config_watcher.changed()
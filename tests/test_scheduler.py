@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+from kafka_connect_watcher.scheduler import AdaptiveInterval, ClusterScheduler
+
+
+class MockScheduledCluster:
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = interval
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@patch("kafka_connect_watcher.scheduler.random.uniform", return_value=0.0)
+def test_clusters_dispatched_on_own_interval(_uniform):
+    clock = MockClock()
+    fast = MockScheduledCluster("fast", 5)
+    slow = MockScheduledCluster("slow", 300)
+    scheduler = ClusterScheduler([fast, slow], clock=clock)
+    dispatched: list[str] = []
+    while clock.now < 300:
+        for cluster in scheduler.pop_due():
+            dispatched.append(cluster.name)
+            scheduler.done(cluster)
+        clock.now += 1
+    assert dispatched.count("slow") == 1
+    assert dispatched.count("fast") == 60
+
+
+@patch("kafka_connect_watcher.scheduler.random.uniform", return_value=0.0)
+def test_overlapping_scan_skipped(_uniform):
+    clock = MockClock()
+    cluster = MockScheduledCluster("busy", 5)
+    scheduler = ClusterScheduler([cluster], clock=clock)
+    assert scheduler.pop_due() == [cluster]
+    clock.now = 5
+    assert scheduler.pop_due() == []
+    assert scheduler.metrics["scans_skipped"] == 1
+    scheduler.done(cluster)
+    clock.now = 10
+    assert scheduler.pop_due() == [cluster]
+    assert scheduler.next_due() == 15
+
+
+def test_jitter_within_ratio():
+    scheduler = ClusterScheduler([], jitter_ratio=0.1)
+    for _ in range(100):
+        assert 9.0 <= scheduler.jitter(10) <= 11.0
+
+
+def test_adaptive_interval():
+    adaptive = AdaptiveInterval(30, 5, 120, stable_cycles=2, backoff_factor=2)
+    assert adaptive.update(changed=True, unhealthy=False) == 30
+    assert adaptive.update(changed=False, unhealthy=False) == 30
+    assert adaptive.update(changed=False, unhealthy=False) == 60
+    assert [adaptive.update(False, False) for _ in range(4)] == [60, 120, 120, 120]
+    assert adaptive.update(changed=False, unhealthy=True) == 5
+    assert adaptive.update(changed=True, unhealthy=True) == 5
+    assert adaptive.update(changed=False, unhealthy=False) == 30
+    assert adaptive.update(changed=False, unhealthy=False) == 30
+    assert adaptive.update(changed=True, unhealthy=False) == 30
+
+
+@patch("kafka_connect_watcher.scheduler.random.uniform", return_value=0.0)
+def test_scan_brought_forward_when_interval_shortened(_uniform):
+    clock = MockClock()
+    cluster = MockScheduledCluster("incident", 300)
+    scheduler = ClusterScheduler([cluster], clock=clock)
+    assert scheduler.pop_due() == [cluster]
+    assert scheduler.next_due() == 300
+    clock.now = 2
+    cluster.interval = 5
+    scheduler.done(cluster)
+    assert scheduler.next_due() == 7
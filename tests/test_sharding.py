@@ -0,0 +1,164 @@
+import signal
+from unittest.mock import MagicMock
+
+import pytest
+
+from kafka_connect_watcher.config import Config
+from kafka_connect_watcher.prometheus import MetricsRegistry
+from kafka_connect_watcher.sharding import (
+    Shard,
+    ShardedWatcher,
+    ShardReport,
+    get_hash_ring,
+    merge_metrics,
+)
+
+CLUSTERS_NAMES: list = [f"cluster-{index}" for index in range(200)]
+
+
+def test_shards_partition_the_clusters():
+    shards = Shard(1, 2).split(3)
+    assert [str(_shard) for _shard in shards] == ["1/2:0/3", "1/2:1/3", "1/2:2/3"]
+    for cluster_name in CLUSTERS_NAMES:
+        assert sum(_shard.owns(cluster_name) for _shard in Shard().split(4)) == 1
+    owned = [
+        len([_name for _name in CLUSTERS_NAMES if _shard.owns(_name)])
+        for _shard in Shard().split(4)
+    ]
+    assert min(owned) > 25
+    with pytest.raises(ValueError):
+        Shard(2, 2)
+
+
+@pytest.mark.parametrize("processes", [1, 2, 3])
+@pytest.mark.parametrize("count", [2, 3])
+def test_processes_watch_the_clusters_of_their_replica(count, processes):
+    definitions = [{"name": _name, "hostname": "localhost"} for _name in CLUSTERS_NAMES]
+
+    def selected(shard: Shard) -> list[str]:
+        config = Config(configuration={"clusters": [dict(_d) for _d in definitions]})
+        return [
+            _cluster["name"] for _cluster in shard.select(config).config["clusters"]
+        ]
+
+    for index in range(count):
+        replica = Shard(index, count)
+        watched = [selected(_shard) for _shard in replica.split(processes)]
+        assert sorted(sum(watched, [])) == sorted(selected(replica))
+
+
+def test_adding_a_shard_only_moves_clusters_to_it():
+    before = {_name: get_hash_ring(4).shard(_name) for _name in CLUSTERS_NAMES}
+    after = {_name: get_hash_ring(5).shard(_name) for _name in CLUSTERS_NAMES}
+    moved = [_name for _name in CLUSTERS_NAMES if before[_name] != after[_name]]
+    assert all(after[_name] == 4 for _name in moved)
+    assert len(moved) < len(CLUSTERS_NAMES) / 2
+
+
+def test_select_clusters_of_the_shard():
+    definitions = [
+        {"name": _name, "hostname": "localhost"} for _name in CLUSTERS_NAMES[:20]
+    ]
+    selected = [
+        [
+            _cluster["name"]
+            for _cluster in _shard.select(
+                Config(configuration={"clusters": [dict(_d) for _d in definitions]})
+            ).config["clusters"]
+        ]
+        for _shard in Shard().split(2)
+    ]
+    assert sorted(selected[0] + selected[1]) == sorted(CLUSTERS_NAMES[:20])
+    assert not set(selected[0]) & set(selected[1])
+
+
+def test_merge_metrics():
+    assert merge_metrics(
+        [
+            {
+                "connect_clusters_total": 2,
+                "cluster_workers_task_latency_seconds_avg": 1.0,
+                "cluster_workers_task_latency_seconds_max": 3.0,
+                "notifications_send_latency_ms": 10.0,
+                "notifications_send_latency_max_ms": 20.0,
+            },
+            {
+                "connect_clusters_total": 3,
+                "cluster_workers_task_latency_seconds_avg": 2.0,
+                "cluster_workers_task_latency_seconds_max": 1.0,
+                "notifications_send_latency_ms": 30.0,
+                "notifications_send_latency_max_ms": 50.0,
+            },
+        ]
+    ) == {
+        "connect_clusters_total": 5,
+        "cluster_workers_task_latency_seconds_avg": 1.5,
+        "cluster_workers_task_latency_seconds_max": 3.0,
+        "notifications_send_latency_ms": 20.0,
+        "notifications_send_latency_max_ms": 50.0,
+    }
+
+
+def test_shards_reports_are_merged(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(
+        "kafka_connect_watcher.sharding.get_metrics_registry", lambda: registry
+    )
+    watcher = ShardedWatcher(2)
+    watcher.handle_report(
+        ShardReport(
+            0,
+            {"connect_clusters_total": 1},
+            {"a": {"kafka_connect_watcher_cluster_connectors": "sample-a\n"}},
+        )
+    )
+    watcher.handle_report(
+        ShardReport(
+            1,
+            {"connect_clusters_total": 2},
+            {"b": {"kafka_connect_watcher_cluster_connectors": "sample-b\n"}},
+        )
+    )
+    assert b"sample-a\nsample-b\n" in registry.exposition()
+    watcher.handle_report(ShardReport(0, {"connect_clusters_total": 0}, {}))
+    assert b"sample-a" not in registry.exposition()
+    watcher.publish_metrics(Config(configuration={"clusters": []}))
+    assert watcher.metrics == {
+        "connect_clusters_total": 2,
+        "watcher_shards": 2,
+        "watcher_shards_reporting": 2,
+        "watcher_shards_restarts": 0,
+    }
+
+    watcher.shards_reports[1].received -= 3600
+    watcher.publish_metrics(Config(configuration={"clusters": []}))
+    assert b"sample-b" not in registry.exposition()
+    assert watcher.metrics["watcher_shards_reporting"] == 1
+
+
+def test_reload_starts_the_prometheus_server(monkeypatch):
+    servers = []
+    monkeypatch.setattr("kafka_connect_watcher.prometheus._METRICS_SERVER", None)
+    monkeypatch.setattr(
+        "kafka_connect_watcher.prometheus.start_metrics_server",
+        lambda prometheus_config: servers.append(prometheus_config) or object(),
+    )
+    cluster: dict = {"name": "cluster-a", "hostname": "localhost"}
+    watcher = ShardedWatcher(2)
+    watcher.config_watcher = MagicMock()
+    watcher.config_watcher.load.return_value = Config(
+        configuration={"clusters": [dict(cluster)]}
+    )
+    watcher.reload(Config(configuration={"clusters": []}))
+    assert servers == []
+
+    watcher.config_watcher.load.return_value = Config(
+        configuration={
+            "clusters": [dict(cluster, metrics={"prometheus": {"enabled": True}})]
+        }
+    )
+    for _ in range(2):
+        watcher.reload(Config(configuration={"clusters": []}))
+    assert servers == [{}]
+    watcher.forward_signal(signal.SIGHUP, None)
+    watcher.config_watcher.request.assert_called_once()
@@ -0,0 +1,39 @@
+import pytest
+
+from kafka_connect_watcher.tools import import_regexes
+
+
+@pytest.mark.parametrize(
+    ["patterns", "name", "expected"],
+    (
+        ([r"(.*)"], "anything", True),
+        ("^.*", "anything", True),
+        (["connector-a$"], "connector-a", True),
+        (["connector-a$"], "connector-ab", False),
+        (["connector"], "connector-a", True),
+        (["connector-(.*)"], "connector-a", True),
+        (["connector-.*"], "other-connector", False),
+        ([r"(.*)-b$", r"^db-\d+"], "connector-b", True),
+        ([r"(.*)-b$", r"^db-\d+"], "db-12", True),
+        ([r"(.*)-b$", r"^db-\d+"], "db-x", False),
+        ([r"(?i)CONNECTOR", r"(\w)\1"], "connector", True),
+        ([r"(?i)CONNECTOR", r"(\w)\1"], "aab", True),
+        ([r"(?P<x>a)", r"(?P<x>b)"], "b", True),
+        ([], "connector", False),
+    ),
+)
+def test_regex_matcher(patterns, name, expected):
+    matcher = import_regexes(patterns)
+    assert matcher.match(name) == expected
+    patterns = [patterns] if isinstance(patterns, str) else patterns
+    assert expected == any(
+        _regex.match(name) for _regex in (import_regexes(_p) for _p in patterns)
+    )
+
+
+def test_regex_matcher_fast_paths():
+    matcher = import_regexes(["exact$", "prefix", "^other-(.*)", r"a\d+", r"b\d+"])
+    assert matcher.exact == {"exact"}
+    assert matcher.prefixes == ("prefix", "other-")
+    assert len(matcher.regexes) == 1
+    assert not matcher.match_all
@@ -0,0 +1,59 @@
+from kafka_connect_watcher.traces import (
+    FingerprintCache,
+    normalize_trace,
+    trace_fingerprint,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def task_failed(trace: str) -> dict:
+    return {
+        "connector": {"state": "RUNNING"},
+        "tasks": [
+            {"id": 0, "state": "FAILED", "trace": trace},
+            {"id": 1, "state": "FAILED", "trace": trace},
+        ],
+    }
+
+
+def test_normalize_trace():
+    assert (
+        normalize_trace(
+            "2023-05-01T10:00:00.123Z consumer 5c1a7bd2-1f0e-4a8e-9d3b-2f6e1c9a0b11 "
+            "failed at offset 1234 (Foo@6d06d69c, 0xdeadbeef)"
+        )
+        == "<ts> consumer <id> failed at offset <n> (Foo@<hex>, <hex>)"
+    )
+
+
+def test_trace_fingerprint():
+    assert trace_fingerprint(task_failed("Boom at offset 12")) == trace_fingerprint(
+        task_failed("Boom at offset 9999")
+    )
+    assert trace_fingerprint(task_failed("Boom")) != trace_fingerprint(
+        task_failed("Bang")
+    )
+    assert trace_fingerprint({"connector": {"state": "PAUSED"}}) != trace_fingerprint(
+        {"connector": {"state": "FAILED"}}
+    )
+
+
+def test_fingerprint_cache_ttl_and_lru():
+    clock = FakeClock()
+    cache = FingerprintCache(60.0, maxsize=2, clock=clock)
+    assert cache.admit("a") == 0
+    assert cache.admit("a") is None
+    assert cache.admit("a") is None
+    clock.now = 60.0
+    assert cache.admit("a") == 2
+    assert cache.admit("b") == 0
+    assert cache.admit("c") == 0
+    assert len(cache) == 2
+    assert cache.admit("a") == 0
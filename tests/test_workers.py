@@ -0,0 +1,46 @@
+from threading import Lock
+
+from kafka_connect_watcher.workers import WorkerPool
+
+
+def test_worker_pool_processes_and_shuts_down():
+    processed: list[int] = []
+    lock = Lock()
+
+    def handler(item):
+        if item == 3:
+            raise ValueError("handler errors must not kill the worker")
+        with lock:
+            processed.append(item)
+
+    pool = WorkerPool("test", 4, handler, poll_timeout=0.01)
+    pool.start()
+    for item in range(10):
+        pool.put(item)
+    pool.join()
+    assert sorted(processed) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    pool.shutdown(wait=True, timeout=5)
+    assert not any(_thread.is_alive() for _thread in pool._threads)
+    metrics = pool.metrics
+    assert metrics["test_processed"] == 10
+    assert metrics["test_queue_depth"] == 0
+    assert metrics["test_idle_cpu_seconds"] >= 0
+
+
+def test_worker_pool_submit_futures_and_latency():
+    pool = WorkerPool("bounded", 2, max_queue_size=4, poll_timeout=0.01)
+    pool.start()
+    futures = [pool.submit(pow, value, 2) for value in range(20)]
+    assert [future.result(timeout=5) for future in futures] == [
+        value**2 for value in range(20)
+    ]
+    failed = pool.submit(int, "not-a-number")
+    assert isinstance(failed.exception(timeout=5), ValueError)
+    pool.shutdown(wait=True, timeout=5)
+    metrics = pool.metrics
+    assert metrics["bounded_processed"] == 21
+    assert metrics["bounded_task_latency_seconds_max"] >= 0
+    assert (
+        metrics["bounded_task_latency_seconds_avg"]
+        >= metrics["bounded_queue_wait_seconds_avg"]
+    )